@@ -0,0 +1,114 @@
+"""
+Benchmark: the memory the transform engine's frames take, and its peak RSS, with and
+without compact_dataframe applied to the ingested tables as they are read.
+
+Each mode runs run_transforms over the synthetic ingested tables of
+bench_transform_processes (S3 mocked by moto) in a fresh (spawned) process, so that
+each gets its own peak RSS; the RSS the setup leaves, which includes the objects
+moto holds, is reported beside it. The run is serial (one build thread, one S3
+transfer), so the peak RSS of each table's read and build is reported too. The
+outputs of the two modes are checked to be identical.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_compact_frames.py [rows]
+"""
+
+import gc
+import multiprocessing
+import resource
+import sys
+import time
+
+import boto3
+import pandas as pd
+from moto import mock_aws
+
+from bench_transform_processes import (
+    INGEST_BUCKET,
+    TRANSFORM_BUCKET,
+    read_outputs,
+    synthetic_tables,
+)
+from src.transform_lambda.main import TransformConfig, run_transforms
+from utils.common import manifest_entry
+
+
+def run(rows, compact, pipe):
+    boto3.setup_default_session(region_name="eu-west-2")
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        for bucket in (INGEST_BUCKET, TRANSFORM_BUCKET):
+            s3_client.create_bucket(
+                Bucket=bucket,
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+        manifest = {"tables": {}}
+        tables = synthetic_tables(rows)
+        for table, df in tables.items():
+            key = f"{table}/bench.json"
+            s3_client.put_object(
+                Bucket=INGEST_BUCKET, Key=key, Body=df.to_json(orient="records")
+            )
+            manifest["tables"][table] = manifest_entry(
+                [key], len(df), None, None, "json"
+            )
+        del tables, df
+        gc.collect()
+        baseline = current_rss_mib()
+
+        start = time.perf_counter()
+        entries, timings = run_transforms(
+            s3_client,
+            INGEST_BUCKET,
+            TRANSFORM_BUCKET,
+            list(manifest["tables"]),
+            "bench",
+            TransformConfig(max_workers=1, io_concurrency=1, compact=compact),
+            manifest=manifest,
+            include_static=True,
+            incremental={},
+        )
+        elapsed = time.perf_counter() - start
+        outputs = read_outputs(s3_client, entries)
+        memory = timings["memory"]
+        pipe.send((elapsed, baseline, memory["peak_rss"], memory, outputs))
+
+
+def current_rss_mib():
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return round(pages * resource.getpagesize() / 2**20, 1)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    mp_context = multiprocessing.get_context("spawn")
+    results = {}
+    for compact in (False, True):
+        parent_pipe, child_pipe = mp_context.Pipe()
+        process = mp_context.Process(target=run, args=(rows, compact, child_pipe))
+        process.start()
+        results[compact] = parent_pipe.recv()
+        process.join()
+
+    print(f"rows={rows}")
+    print(f"{'table':>14} {'plain MiB':>10} {'compact MiB':>12}")
+    for table, mib in results[False][3]["read"].items():
+        print(f"{table:>14} {mib:>10.2f} {results[True][3]['read'][table]:>12.2f}")
+    print(f"{'node':>24} {'plain peak RSS':>15} {'compact peak RSS':>17}")
+    plain, compacted = (results[mode][3]["table_peak_rss"] for mode in (False, True))
+    for kind in ("read", "build"):
+        for name, mib in plain[kind].items():
+            label = f"{kind} {name}"
+            print(f"{label:>24} {mib:>15.1f} {compacted[kind][name]:>17.1f}")
+    print(f"{'mode':>9} {'total s':>8} {'setup RSS MiB':>14} {'peak RSS MiB':>13}")
+    for compact, (elapsed, baseline, peak, _, _) in results.items():
+        label = "compact" if compact else "plain"
+        print(f"{label:>9} {elapsed:>8.2f} {baseline:>14.1f} {peak:>13.1f}")
+
+    for output, df in results[False][4].items():
+        pd.testing.assert_frame_equal(results[True][4][output], df)
+
+
+if __name__ == "__main__":
+    main()
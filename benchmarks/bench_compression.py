@@ -0,0 +1,66 @@
+"""
+Codec matrix for ingestion JSON (none/gzip/zstd) and processed Parquet
+(none/snappy/gzip/zstd) on synthetic sales_order rows: stored bytes, encode
+time and decode time per table size.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_compression.py [rows...]
+"""
+
+import io
+import sys
+import time
+
+import cramjam
+import gzip
+import pandas as pd
+
+from bench_json_encoder import COLUMNS, make_rows
+from utils.lambda_utils import compress_data, dataframe_to_parquet, encode_rows_to_json
+
+DECODERS = {
+    None: lambda data: data,
+    "gzip": gzip.decompress,
+    "zstd": lambda data: bytes(cramjam.zstd.decompress(data)),
+}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    names = [column["name"] for column in COLUMNS]
+    print(
+        f"{'rows':>9} {'object':>8} {'codec':>7} {'bytes':>12} "
+        f"{'encode':>8} {'decode':>8}"
+    )
+    for size in sizes:
+        rows = make_rows(size)
+        payload, _ = encode_rows_to_json(rows, COLUMNS)
+        for codec in [None, "gzip", "zstd"]:
+            encode_seconds, (data, _) = timed(compress_data, payload, codec)
+            decode_seconds, decoded = timed(DECODERS[codec], data)
+            assert decoded == payload
+            print(
+                f"{size:>9} {'json':>8} {codec or 'none':>7} {len(data):>12,} "
+                f"{encode_seconds:>7.2f}s {decode_seconds:>7.2f}s"
+            )
+
+        df = pd.DataFrame(rows, columns=names)
+        df["unit_price"] = df["unit_price"].astype(float)
+        for codec in ["none", "snappy", "gzip", "zstd"]:
+            encode_seconds, data = timed(dataframe_to_parquet, df, codec)
+            decode_seconds, decoded = timed(pd.read_parquet, io.BytesIO(data))
+            assert len(decoded) == size
+            print(
+                f"{size:>9} {'parquet':>8} {codec:>7} {len(data):>12,} "
+                f"{encode_seconds:>7.2f}s {decode_seconds:>7.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: bringing dim_counterparty up to date after a change to a small share of
+addresses, by joining the full address and counterparty tables (as the transform did
+before it kept snapshots) against rebuilding it from the snapshots.
+
+The snapshots are seeded by a first run; the timed run then gets only the changed
+addresses. The rows the incremental run writes are checked against the same rows of
+the full rebuild. S3 is mocked by moto; the snapshot cache is in a temporary directory.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_incremental_dimensions.py [rows] [changed_percent]
+"""
+
+import io
+import sys
+import tempfile
+import time
+
+import boto3
+import numpy as np
+import pandas as pd
+from moto import mock_aws
+
+from src.transform_lambda.main import TransformConfig, run_transforms
+from utils.common import manifest_entry
+
+
+INGEST_BUCKET = "data-squid-ingest-bucket-bench"
+TRANSFORM_BUCKET = "data-squid-transform-bench"
+
+
+def tables(rows, rng):
+    ids = np.arange(1, rows + 1)
+    address = pd.DataFrame(
+        {
+            "address_id": ids,
+            "address_line_1": "1 Road",
+            "address_line_2": None,
+            "district": "District",
+            "city": rng.choice(["Leeds", "York", "Hull"], rows),
+            "postal_code": "28441",
+            "country": "UK",
+            "phone": "1803 637401",
+        }
+    )
+    counterparty = pd.DataFrame(
+        {
+            "counterparty_id": ids,
+            "counterparty_legal_name": "Fahey and Sons",
+            "legal_address_id": rng.integers(1, rows + 1, rows),
+        }
+    )
+    return {"address": address, "counterparty": counterparty}
+
+
+def ingest(s3_client, updates, time_key):
+    manifest = {"tables": {}}
+    for table, df in updates.items():
+        key = f"{table}/{time_key}.json"
+        s3_client.put_object(
+            Bucket=INGEST_BUCKET, Key=key, Body=df.to_json(orient="records")
+        )
+        manifest["tables"][table] = manifest_entry([key], len(df), None, None, "json")
+    return manifest
+
+
+def dimension(s3_client, entries):
+    key = entries["dim_counterparty"]["keys"][0]
+    body = s3_client.get_object(Bucket=TRANSFORM_BUCKET, Key=key)["Body"].read()
+    df = pd.read_parquet(io.BytesIO(body))
+    return df.sort_values("counterparty_id", ignore_index=True)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    changed_percent = float(sys.argv[2]) if len(sys.argv) > 2 else 1
+    boto3.setup_default_session(region_name="eu-west-2")
+    rng = np.random.default_rng(0)
+    full = tables(rows, rng)
+    changed = full["address"].sample(frac=changed_percent / 100, random_state=0)
+    changed = changed.assign(city="Bradford")
+    updated_address = full["address"].set_index("address_id")
+    updated_address.update(changed.set_index("address_id"))
+    updated_address = updated_address.reset_index()
+
+    with mock_aws(), tempfile.TemporaryDirectory() as cache_dir:
+        s3_client = boto3.client("s3")
+        for bucket in (INGEST_BUCKET, TRANSFORM_BUCKET):
+            s3_client.create_bucket(
+                Bucket=bucket,
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+
+        def run(updates, time_key, **kwargs):
+            manifest = ingest(s3_client, updates, time_key)
+            start = time.perf_counter()
+            entries, _ = run_transforms(
+                s3_client,
+                INGEST_BUCKET,
+                TRANSFORM_BUCKET,
+                list(updates),
+                time_key,
+                TransformConfig(cache_dir=cache_dir),
+                manifest=manifest,
+                **kwargs,
+            )
+            return entries, time.perf_counter() - start
+
+        entries, _ = run(full, "2025/03/06/12:00")
+        transform_manifest = {"tables": entries}
+        entries, incremental = run(
+            {"address": changed},
+            "2025/03/06/12:05",
+            transform_manifest=transform_manifest,
+        )
+        updated = dimension(s3_client, entries)
+
+        entries, joined = run(
+            {"address": updated_address, "counterparty": full["counterparty"]},
+            "2025/03/06/12:10",
+            incremental={},
+        )
+        rebuilt = dimension(s3_client, entries)
+
+    expected = rebuilt[rebuilt["counterparty_id"].isin(updated["counterparty_id"])]
+    pd.testing.assert_frame_equal(updated, expected.reset_index(drop=True))
+    affected = full["counterparty"]["legal_address_id"].isin(changed["address_id"])
+    assert len(updated) == affected.sum()
+
+    print(f"rows={rows}, {len(changed)} addresses changed")
+    print(f"{'mode':>12} {'dim rows':>9} {'run s':>7}")
+    print(f"{'full join':>12} {len(rebuilt):>9} {joined:>7.2f}")
+    print(f"{'incremental':>12} {len(updated):>9} {incremental:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
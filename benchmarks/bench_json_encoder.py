@@ -0,0 +1,85 @@
+"""
+Micro-benchmark: format_data_to_json (dict per row + CustomEncoder) against the
+column-wise encode_rows_to_json, on synthetic sales_order rows.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_json_encoder.py [rows...]
+"""
+
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from utils.lambda_utils import encode_rows_to_json, format_data_to_json
+
+
+# sales_order as described by conn.columns
+COLUMNS = [
+    {"name": "sales_order_id", "type_oid": 23},
+    {"name": "created_at", "type_oid": 1114},
+    {"name": "last_updated", "type_oid": 1114},
+    {"name": "design_id", "type_oid": 23},
+    {"name": "staff_id", "type_oid": 23},
+    {"name": "counterparty_id", "type_oid": 23},
+    {"name": "units_sold", "type_oid": 23},
+    {"name": "unit_price", "type_oid": 1700},
+    {"name": "currency_id", "type_oid": 23},
+    {"name": "agreed_delivery_date", "type_oid": 1043},
+    {"name": "agreed_payment_date", "type_oid": 1043},
+    {"name": "agreed_delivery_location_id", "type_oid": 23},
+]
+
+
+def make_rows(count):
+    start = datetime(2022, 11, 3, 14, 20, 52, 186000)
+    return [
+        [
+            i,
+            start + timedelta(seconds=i),
+            start + timedelta(seconds=i, microseconds=500),
+            1 + i % 300,
+            1 + i % 20,
+            1 + i % 20,
+            1 + i % 100000,
+            Decimal(f"{2 + (i % 300) / 100:.2f}"),
+            1 + i % 3,
+            "2022-11-10",
+            "2022-11-08",
+            1 + i % 30,
+        ]
+        for i in range(count)
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    names = [column["name"] for column in COLUMNS]
+    print(
+        f"{'rows':>9} {'format_data_to_json':>20} {'encode_rows_to_json':>20} {'speed-up':>9}"
+    )
+    for size in sizes:
+        rows = make_rows(size)
+        old_seconds, old_payload = timed(format_data_to_json, rows, names)
+        # includes the json.loads emptiness check extract_data used to run
+        old_seconds += timed(json.loads, old_payload.decode("utf-8"))[0]
+        new_seconds, (new_payload, row_count) = timed(
+            encode_rows_to_json, rows, COLUMNS
+        )
+        assert new_payload == old_payload and row_count == size
+        del old_payload, new_payload
+        print(
+            f"{size:>9} {old_seconds:>19.2f}s {new_seconds:>19.2f}s "
+            f"{old_seconds / new_seconds:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compares the serial extraction loop with the snapshot-parallel engine.
+
+Runs an initial extraction of all 11 tables against a local Postgres seeded with
+benchmarks/totesys_fixture.py, uploading into a moto-mocked ingestion bucket.
+
+moto answers in-process, so on its own the benchmark only measures CPU work
+(pg8000 decoding, JSON encoding) which threads cannot overlap. S3_LATENCY_MS and
+S3_MBPS add a simulated network cost to every PutObject/UploadPart so the
+numbers reflect a Lambda talking to real S3.
+
+Usage:
+    PGHOST=/tmp/pgdata PYTHONPATH=.:benchmarks python benchmarks/bench_parallel_extraction.py [rows] [workers...]
+"""
+
+import os
+
+import sys
+import time
+
+import boto3
+from moto import mock_aws
+
+import totesys_fixture
+from src.extraction_lambda.main import ExtractionConfig, extract_data
+
+
+BUCKET = "data-squid-ingest-bucket-bench"
+S3_LATENCY_MS = float(os.environ.get("S3_LATENCY_MS", 30))
+S3_MBPS = float(os.environ.get("S3_MBPS", 80))
+
+
+def simulate_network(request, **kwargs):
+    body = request.body or b""
+    size = len(body) if isinstance(body, (bytes, bytearray)) else 0
+    time.sleep(S3_LATENCY_MS / 1000 + size / (S3_MBPS * 1024 * 1024))
+
+
+def empty_bucket(s3_client):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET):
+        for obj in page.get("Contents", []):
+            s3_client.delete_object(Bucket=BUCKET, Key=obj["Key"])
+
+
+def run(s3_client, max_workers):
+    empty_bucket(s3_client)
+    conn = totesys_fixture.connect()
+    try:
+        start = time.perf_counter()
+        _, updated_tables, _ = extract_data(
+            s3_client,
+            conn,
+            BUCKET,
+            ExtractionConfig(max_workers=max_workers),
+            connection_factory=totesys_fixture.connect,
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+    assert len(updated_tables) == 11
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    worker_counts = [int(arg) for arg in sys.argv[2:]] or [2, 4]
+
+    conn = totesys_fixture.connect()
+    totesys_fixture.create_totesys(conn, rows)
+    conn.close()
+
+    with mock_aws():
+        boto3.setup_default_session(region_name="eu-west-2")
+        for operation in ("PutObject", "UploadPart", "GetObject"):
+            boto3.DEFAULT_SESSION.events.register_first(
+                f"before-send.s3.{operation}", simulate_network
+            )
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        serial = run(s3_client, 1)
+        print(
+            f"rows/table={rows} cpus={os.cpu_count()} "
+            f"s3_latency_ms={S3_LATENCY_MS} s3_mbps={S3_MBPS}"
+        )
+        print(f"{'workers':>8} {'seconds':>9} {'speed-up':>9}")
+        print(f"{1:>8} {serial:>9.2f} {1:>9.2f}")
+        for workers in worker_counts:
+            elapsed = run(s3_client, workers)
+            print(f"{workers:>8} {elapsed:>9.2f} {serial / elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
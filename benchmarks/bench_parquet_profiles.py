@@ -0,0 +1,74 @@
+"""
+Benchmark: the size of each star-schema table written with each Parquet writer
+profile, and the time taken to encode and to decode it.
+
+The tables are built by TRANSFORMS from the synthetic ingested tables of
+bench_transform_processes. Each encode and decode is timed as the best of a few
+runs, and every profile is checked to read back the same rows as "default".
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_parquet_profiles.py [rows]
+"""
+
+import io
+import sys
+import time
+
+import pandas as pd
+
+from bench_transform_processes import synthetic_tables
+from src.transform_lambda.main import TRANSFORMS
+from utils.transform import PARQUET_PROFILES, dataframe_to_parquet
+from utils.schema import conform_dataframe
+
+
+REPEATS = 3
+
+
+def star_schema(rows):
+    frames = {
+        table: conform_dataframe(df, table)
+        for table, df in synthetic_tables(rows).items()
+    }
+    for output, (inputs, function) in TRANSFORMS.items():
+        frames[output] = function(*(frames[table] for table in inputs))
+    return {output: frames[output] for output in TRANSFORMS}
+
+
+def best_of(function):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    print(f"rows={rows}")
+    print(
+        f"{'table':>17} {'profile':>15} {'bytes':>11} {'encode s':>9} {'decode s':>9}"
+    )
+    for output, df in star_schema(rows).items():
+        expected = None
+        for profile in PARQUET_PROFILES:
+            data, encode = best_of(
+                lambda: dataframe_to_parquet(df, table=output, profile=profile)
+            )
+            read_back, decode = best_of(lambda: pd.read_parquet(io.BytesIO(data)))
+            print(
+                f"{output:>17} {profile:>15} {len(data):>11} "
+                f"{encode:>9.3f} {decode:>9.3f}"
+            )
+            read_back = conform_dataframe(read_back, output)
+            read_back = read_back.sort_values(
+                list(read_back.columns), ignore_index=True
+            )
+            if expected is None:
+                expected = read_back
+            pd.testing.assert_frame_equal(read_back, expected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: dim_staff and dim_counterparty joined in pandas by the transform lambda
+(staff, department, counterparty and address extracted separately) against the
+extraction's pushdown mode, which joins them in the source database.
+
+Runs an initial extraction and the transform over it for both modes, with S3 mocked
+by moto, and reports the bytes the extraction wrote for the tables involved and the
+time taken by each stage. The two modes' dimensions are checked to be identical.
+
+Needs a Postgres server reachable through the libpq environment variables; see
+totesys_fixture.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_pushdown.py [rows]
+"""
+
+import io
+import json
+import sys
+import time
+
+import boto3
+import pandas as pd
+from moto import mock_aws
+
+import totesys_fixture
+from src.extraction_lambda.main import ExtractionConfig, extract_data
+from src.transform_lambda.main import lambda_handler as transform_handler
+from utils.common import read_manifest
+
+
+INGEST_BUCKET = "data-squid-ingest-bucket-bench"
+TRANSFORM_BUCKET = "data-squid-transform-bench"
+INVOLVED = ["address", "counterparty", "staff", "department"]
+INVOLVED += ["dim_staff", "dim_counterparty"]
+
+
+def ingested_bytes(s3_client):
+    sizes = {}
+    for page in s3_client.get_paginator("list_objects_v2").paginate(
+        Bucket=INGEST_BUCKET
+    ):
+        for obj in page.get("Contents", []):
+            table = obj["Key"].split("/", 1)[0]
+            sizes[table] = sizes.get(table, 0) + obj["Size"]
+    return {table: size for table, size in sizes.items() if table in INVOLVED}
+
+
+def read_dimension(s3_client, dimension):
+    manifest, _ = read_manifest(s3_client, TRANSFORM_BUCKET)
+    key = manifest["tables"][dimension]["keys"][0]
+    body = s3_client.get_object(Bucket=TRANSFORM_BUCKET, Key=key)["Body"].read()
+    df = pd.read_parquet(io.BytesIO(body))
+    id_column = df.columns[0]
+    return df.sort_values(id_column).reset_index(drop=True)
+
+
+def run(pushdown):
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        for bucket in (INGEST_BUCKET, TRANSFORM_BUCKET):
+            s3_client.create_bucket(
+                Bucket=bucket,
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+        conn = totesys_fixture.connect()
+        try:
+            start = time.perf_counter()
+            _, updated_tables, table_formats = extract_data(
+                s3_client, conn, INGEST_BUCKET, ExtractionConfig(pushdown=pushdown)
+            )
+            extracted = time.perf_counter()
+        finally:
+            conn.close()
+
+        report = {"updated_tables": updated_tables, "table_formats": table_formats}
+        s3_client.put_object(
+            Bucket=INGEST_BUCKET,
+            Key="reports/bench_success.json",
+            Body=json.dumps(report),
+        )
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": INGEST_BUCKET},
+                        "object": {"key": "reports/bench_success.json"},
+                    }
+                }
+            ]
+        }
+        transform_start = time.perf_counter()
+        transform_handler(event, {})
+        transformed = time.perf_counter()
+
+        dimensions = {
+            dimension: read_dimension(s3_client, dimension)
+            for dimension in ("dim_staff", "dim_counterparty")
+        }
+        return (
+            ingested_bytes(s3_client),
+            extracted - start,
+            transformed - transform_start,
+            dimensions,
+        )
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    conn = totesys_fixture.connect()
+    totesys_fixture.create_totesys(conn, rows)
+    conn.close()
+    boto3.setup_default_session(region_name="eu-west-2")
+
+    results = {mode: run(mode) for mode in (False, True)}
+
+    print(f"rows/table={rows}")
+    print(
+        f"{'mode':>9} {'bytes':>11} {'extract s':>10} {'transform s':>12} {'total s':>8}"
+    )
+    for pushdown, (sizes, extract_s, transform_s, _) in results.items():
+        label = "pushdown" if pushdown else "pandas"
+        total = extract_s + transform_s
+        print(
+            f"{label:>9} {sum(sizes.values()):>11} {extract_s:>10.2f} "
+            f"{transform_s:>12.2f} {total:>8.2f}"
+        )
+        print(f"{'':>9} {sizes}")
+
+    for dimension, df in results[False][3].items():
+        pd.testing.assert_frame_equal(results[True][3][dimension], df)
+
+
+if __name__ == "__main__":
+    main()
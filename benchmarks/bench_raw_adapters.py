@@ -0,0 +1,62 @@
+"""
+Benchmark: fetching and JSON-encoding sales_order with pg8000's own input adapters
+(datetime and Decimal objects) against read_wire_text (timestamps and numerics kept
+as the text Postgres sends).
+
+Needs a Postgres server reachable through the libpq environment variables; see
+totesys_fixture.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_raw_adapters.py [rows] [repeats]
+"""
+
+import json
+import sys
+import time
+from decimal import Decimal
+
+import totesys_fixture
+from utils.extract import encode_rows_to_json, read_wire_text
+
+
+QUERY = "SELECT * FROM sales_order"
+
+
+def fetch_and_encode(conn, raw):
+    start = time.perf_counter()
+    with read_wire_text(conn, raw):
+        rows = conn.run(QUERY)
+    fetched = time.perf_counter()
+    payload, _ = encode_rows_to_json(rows, conn.columns)
+    encoded = time.perf_counter()
+    return payload, fetched - start, encoded - fetched
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    conn = totesys_fixture.connect()
+    try:
+        totesys_fixture.create_totesys(conn, rows)
+        print(f"sales_order rows={rows} (best of {repeats})")
+        print(f"{'adapters':>9} {'fetch s':>9} {'encode s':>9} {'total s':>9}")
+        payloads = {}
+        for raw in (False, True):
+            runs = [fetch_and_encode(conn, raw) for _ in range(repeats)]
+            payloads[raw] = runs[0][0]
+            fetch = min(run[1] for run in runs)
+            encode = min(run[2] for run in runs)
+            label = "raw" if raw else "pg8000"
+            print(f"{label:>9} {fetch:>9.2f} {encode:>9.2f} {fetch + encode:>9.2f}")
+    finally:
+        conn.close()
+
+    typed = json.loads(payloads[False])
+    raw = json.loads(payloads[True], parse_float=Decimal)
+    # the typed path rounds unit_price through float; the raw path keeps the digits
+    assert [{**row, "unit_price": float(row["unit_price"])} for row in raw] == typed
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: a continuous extraction after the source bumped last_updated on every
+sales_order row but changed the content of only a fraction of them, with and without
+row-hash change suppression.
+
+Runs an initial extraction, touches the rows, then times the continuous run for both
+modes (S3 mocked by moto) and reports the rows and bytes it wrote for sales_order.
+The suppressed run is checked to deliver exactly the rows whose content changed.
+
+Needs a Postgres server reachable through the libpq environment variables; see
+totesys_fixture.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_row_hashes.py [rows] [changed_percent]
+"""
+
+import json
+import sys
+import time
+
+import boto3
+from moto import mock_aws
+
+import totesys_fixture
+from src.extraction_lambda.main import ExtractionConfig, extract_data
+from utils.common import read_manifest
+
+
+BUCKET = "data-squid-ingest-bucket-bench"
+
+
+def run(rows, changed_percent, suppress_unchanged):
+    conn = totesys_fixture.connect()
+    totesys_fixture.create_totesys(conn, rows)
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        try:
+            extract_data(
+                s3_client,
+                conn,
+                BUCKET,
+                ExtractionConfig(suppress_unchanged=suppress_unchanged),
+            )
+            conn.run(
+                "UPDATE sales_order SET last_updated = now() + interval '1 day', "
+                "units_sold = units_sold + (sales_order_id % 100 < :percent)::int",
+                percent=changed_percent,
+            )
+            start = time.perf_counter()
+            _, updated_tables, _ = extract_data(
+                s3_client,
+                conn,
+                BUCKET,
+                ExtractionConfig(suppress_unchanged=suppress_unchanged),
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            conn.close()
+
+        entry = read_manifest(s3_client, BUCKET)[0]["tables"]["sales_order"]
+        size, ids = 0, []
+        for key in entry["keys"]:
+            body = s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+            size += len(body)
+            ids += [row["sales_order_id"] for row in json.loads(body)]
+        return entry["row_count"], size, elapsed, sorted(ids)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    changed_percent = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    boto3.setup_default_session(region_name="eu-west-2")
+
+    results = {mode: run(rows, changed_percent, mode) for mode in (False, True)}
+
+    print(f"sales_order rows={rows}, all touched, {changed_percent}% changed")
+    print(f"{'mode':>9} {'rows out':>9} {'bytes':>11} {'extract s':>10}")
+    for suppress_unchanged, (row_count, size, elapsed, _) in results.items():
+        label = "suppress" if suppress_unchanged else "plain"
+        print(f"{label:>9} {row_count:>9} {size:>11} {elapsed:>10.2f}")
+
+    changed = [i for i in range(1, rows + 1) if i % 100 < changed_percent]
+    assert results[True][3] == changed
+    assert results[False][3] == list(range(1, rows + 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark: the transform engine building every warehouse table from synthetic ingested
+tables serially (one thread), on threads, and on worker processes, at several sizes.
+
+The ingested tables are written as JSON to a bucket mocked by moto, and run_transforms
+is timed for each mode; the outputs of the modes are checked to be identical. Process
+mode can only beat the others with more than one CPU (the transform lambda has about
+two at 3008 MB).
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_transform_processes.py [rows ...]
+"""
+
+import io
+import os
+import sys
+import time
+
+import boto3
+import numpy as np
+import pandas as pd
+from moto import mock_aws
+
+from src.transform_lambda.main import TRANSFORMS, TransformConfig, run_transforms
+from utils.common import manifest_entry
+
+
+INGEST_BUCKET = "data-squid-ingest-bucket-bench"
+TRANSFORM_BUCKET = "data-squid-transform-bench"
+MODES = {
+    "serial": TransformConfig(max_workers=1),
+    "threads": TransformConfig(max_workers=4),
+    "processes": TransformConfig(processes=2),
+}
+
+
+def synthetic_tables(rows):
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, rows + 1)
+    stamps = pd.Timestamp("2024-01-01") + pd.to_timedelta(
+        rng.integers(0, 10**8, rows), unit="s"
+    )
+    stamps = stamps.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    words = np.array(["alpha", "bravo", "charlie", "delta", "echo", "foxtrot"])
+
+    def text():
+        return words[rng.integers(0, len(words), rows)]
+
+    return {
+        "design": pd.DataFrame(
+            {
+                "design_id": ids,
+                "design_name": text(),
+                "file_location": "/usr/share",
+                "file_name": text(),
+            }
+        ),
+        "address": pd.DataFrame(
+            {
+                "address_id": ids,
+                "address_line_1": text(),
+                "address_line_2": None,
+                "district": text(),
+                "city": text(),
+                "postal_code": "28441",
+                "country": text(),
+                "phone": "1803 637401",
+            }
+        ),
+        "counterparty": pd.DataFrame(
+            {
+                "counterparty_id": ids,
+                "counterparty_legal_name": text(),
+                "legal_address_id": rng.integers(1, rows + 1, rows),
+            }
+        ),
+        "currency": pd.DataFrame(
+            {
+                "currency_id": [1, 2, 3],
+                "currency_code": ["GBP", "USD", "EUR"],
+                "created_at": stamps[:3],
+                "last_updated": stamps[:3],
+            }
+        ),
+        "department": pd.DataFrame(
+            {
+                "department_id": range(1, 9),
+                "department_name": words[rng.integers(0, len(words), 8)],
+                "location": "Leeds",
+            }
+        ),
+        "staff": pd.DataFrame(
+            {
+                "staff_id": ids,
+                "first_name": text(),
+                "last_name": text(),
+                "department_id": rng.integers(1, 9, rows),
+                "email_address": "someone@terrifictotes.com",
+            }
+        ),
+        "sales_order": pd.DataFrame(
+            {
+                "sales_order_id": ids,
+                "created_at": stamps,
+                "last_updated": stamps,
+                "design_id": rng.integers(1, rows + 1, rows),
+                "staff_id": rng.integers(1, rows + 1, rows),
+                "counterparty_id": rng.integers(1, rows + 1, rows),
+                "units_sold": rng.integers(1, 100_000, rows),
+                "unit_price": rng.integers(100, 400, rows) / 100,
+                "currency_id": rng.integers(1, 4, rows),
+                "agreed_delivery_date": "2024-03-01",
+                "agreed_payment_date": "2024-03-02",
+                "agreed_delivery_location_id": rng.integers(1, rows + 1, rows),
+            }
+        ),
+    }
+
+
+def read_outputs(s3_client, entries):
+    return {
+        output: pd.read_parquet(
+            io.BytesIO(
+                s3_client.get_object(Bucket=TRANSFORM_BUCKET, Key=entry["keys"][0])[
+                    "Body"
+                ].read()
+            )
+        )
+        for output, entry in entries.items()
+    }
+
+
+def run(rows):
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        for bucket in (INGEST_BUCKET, TRANSFORM_BUCKET):
+            s3_client.create_bucket(
+                Bucket=bucket,
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+        manifest = {"tables": {}}
+        for table, df in synthetic_tables(rows).items():
+            key = f"{table}/bench.json"
+            body = df.to_json(orient="records")
+            s3_client.put_object(Bucket=INGEST_BUCKET, Key=key, Body=body)
+            manifest["tables"][table] = manifest_entry(
+                [key], len(df), None, None, "json"
+            )
+
+        results = {}
+        for mode, config in MODES.items():
+            start = time.perf_counter()
+            entries, timings = run_transforms(
+                s3_client,
+                INGEST_BUCKET,
+                TRANSFORM_BUCKET,
+                list(manifest["tables"]),
+                f"bench/{mode}",
+                config,
+                manifest=manifest,
+                include_static=True,
+            )
+            elapsed = time.perf_counter() - start
+            results[mode] = elapsed, timings, read_outputs(s3_client, entries)
+        return results
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 300_000]
+    boto3.setup_default_session(region_name="eu-west-2")
+    print(f"cpus={os.cpu_count()} outputs={len(TRANSFORMS)}")
+    print(f"{'rows':>8} {'mode':>10} {'total s':>8}  slowest builds")
+    for rows in sizes:
+        results = run(rows)
+        for mode, (elapsed, timings, _) in results.items():
+            slowest = sorted(timings["build"].items(), key=lambda item: -item[1])[:2]
+            slowest = ", ".join(
+                f"{output} {seconds:.2f}" for output, seconds in slowest
+            )
+            print(f"{rows:>8} {mode:>10} {elapsed:>8.2f}  {slowest}")
+        serial = results["serial"][2]
+        for mode in ("threads", "processes"):
+            for output, df in serial.items():
+                pd.testing.assert_frame_equal(results[mode][2][output], df)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Synthetic stand-in for the totesys source database, used by the benchmarks.
+
+The tables mirror the columns of the real totesys schema and are filled with
+generate_series so a few hundred thousand rows can be created in seconds.
+Connection details are read from the standard libpq environment variables
+(PGHOST, PGPORT, PGUSER, PGPASSWORD, PGDATABASE); set PGHOST to a directory
+to connect over the Unix socket in that directory instead of TCP.
+"""
+
+import os
+from pg8000.native import Connection
+
+
+TABLE_DDL = {
+    "address": """
+        CREATE TABLE address (
+            address_id SERIAL PRIMARY KEY,
+            address_line_1 VARCHAR NOT NULL,
+            address_line_2 VARCHAR,
+            district VARCHAR,
+            city VARCHAR NOT NULL,
+            postal_code VARCHAR NOT NULL,
+            country VARCHAR NOT NULL,
+            phone VARCHAR NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "counterparty": """
+        CREATE TABLE counterparty (
+            counterparty_id SERIAL PRIMARY KEY,
+            counterparty_legal_name VARCHAR NOT NULL,
+            legal_address_id INT NOT NULL,
+            commercial_contact VARCHAR,
+            delivery_contact VARCHAR,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "design": """
+        CREATE TABLE design (
+            design_id SERIAL PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            design_name VARCHAR NOT NULL,
+            file_location VARCHAR NOT NULL,
+            file_name VARCHAR NOT NULL,
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "sales_order": """
+        CREATE TABLE sales_order (
+            sales_order_id SERIAL PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now(),
+            design_id INT NOT NULL,
+            staff_id INT NOT NULL,
+            counterparty_id INT NOT NULL,
+            units_sold INT NOT NULL,
+            unit_price NUMERIC(10, 2) NOT NULL,
+            currency_id INT NOT NULL,
+            agreed_delivery_date VARCHAR NOT NULL,
+            agreed_payment_date VARCHAR NOT NULL,
+            agreed_delivery_location_id INT NOT NULL
+        )""",
+    "transaction": """
+        CREATE TABLE transaction (
+            transaction_id SERIAL PRIMARY KEY,
+            transaction_type VARCHAR NOT NULL,
+            sales_order_id INT,
+            purchase_order_id INT,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "payment": """
+        CREATE TABLE payment (
+            payment_id SERIAL PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now(),
+            transaction_id INT NOT NULL,
+            counterparty_id INT NOT NULL,
+            payment_amount NUMERIC NOT NULL,
+            currency_id INT NOT NULL,
+            payment_type_id INT NOT NULL,
+            paid BOOLEAN NOT NULL,
+            payment_date VARCHAR NOT NULL,
+            company_ac_number INT NOT NULL,
+            counterparty_ac_number INT NOT NULL
+        )""",
+    "payment_type": """
+        CREATE TABLE payment_type (
+            payment_type_id SERIAL PRIMARY KEY,
+            payment_type_name VARCHAR NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "currency": """
+        CREATE TABLE currency (
+            currency_id SERIAL PRIMARY KEY,
+            currency_code VARCHAR(3) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "staff": """
+        CREATE TABLE staff (
+            staff_id SERIAL PRIMARY KEY,
+            first_name VARCHAR NOT NULL,
+            last_name VARCHAR NOT NULL,
+            department_id INT NOT NULL,
+            email_address VARCHAR NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "department": """
+        CREATE TABLE department (
+            department_id SERIAL PRIMARY KEY,
+            department_name VARCHAR NOT NULL,
+            location VARCHAR,
+            manager VARCHAR,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now()
+        )""",
+    "purchase_order": """
+        CREATE TABLE purchase_order (
+            purchase_order_id SERIAL PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            last_updated TIMESTAMP NOT NULL DEFAULT now(),
+            staff_id INT NOT NULL,
+            counterparty_id INT NOT NULL,
+            item_code VARCHAR NOT NULL,
+            item_quantity INT NOT NULL,
+            item_unit_price NUMERIC NOT NULL,
+            currency_id INT NOT NULL,
+            agreed_delivery_date VARCHAR NOT NULL,
+            agreed_payment_date VARCHAR NOT NULL,
+            agreed_delivery_location_id INT NOT NULL
+        )""",
+}
+
+# {n} is replaced with the number of rows to generate
+TABLE_SEED = {
+    "address": """
+        INSERT INTO address (address_line_1, address_line_2, district, city,
+            postal_code, country, phone, created_at, last_updated)
+        SELECT g || ' Herzog Via', NULL, 'Avon', 'City ' || (g % 500),
+            lpad((g % 99999)::text, 5, '0'), 'Country ' || (g % 50),
+            '1803 ' || lpad(g::text, 6, '0'),
+            timestamp '2022-11-03 14:20:49.962' + g * interval '1 minute',
+            timestamp '2022-11-03 14:20:49.962' + g * interval '1 minute'
+        FROM generate_series(1, {n}) g""",
+    "counterparty": """
+        INSERT INTO counterparty (counterparty_legal_name, legal_address_id,
+            commercial_contact, delivery_contact, created_at, last_updated)
+        SELECT 'Counterparty ' || g, 1 + (g % {n}), 'Contact ' || g, 'Delivery ' || g,
+            timestamp '2022-11-03 14:20:51.563' + g * interval '1 minute',
+            timestamp '2022-11-03 14:20:51.563' + g * interval '1 minute'
+        FROM generate_series(1, {n}) g""",
+    "design": """
+        INSERT INTO design (created_at, design_name, file_location, file_name,
+            last_updated)
+        SELECT timestamp '2022-11-03 14:20:49.962' + g * interval '1 minute',
+            'Design ' || g, '/usr/share/design' || (g % 100),
+            'design-' || g || '.json',
+            timestamp '2022-11-03 14:20:49.962' + g * interval '1 minute'
+        FROM generate_series(1, {n}) g""",
+    "sales_order": """
+        INSERT INTO sales_order (created_at, last_updated, design_id, staff_id,
+            counterparty_id, units_sold, unit_price, currency_id,
+            agreed_delivery_date, agreed_payment_date, agreed_delivery_location_id)
+        SELECT timestamp '2022-11-03 14:20:52.186' + g * interval '1 second',
+            timestamp '2022-11-03 14:20:52.186' + g * interval '1 second',
+            1 + (g % 300), 1 + (g % 20), 1 + (g % 20), 1 + (g % 100000),
+            round((2 + (g % 300) / 100.0)::numeric, 2), 1 + (g % 3),
+            '2022-11-10', '2022-11-08', 1 + (g % 30)
+        FROM generate_series(1, {n}) g""",
+    "transaction": """
+        INSERT INTO transaction (transaction_type, sales_order_id,
+            purchase_order_id, created_at, last_updated)
+        SELECT CASE WHEN g % 2 = 0 THEN 'SALE' ELSE 'PURCHASE' END,
+            CASE WHEN g % 2 = 0 THEN g END, CASE WHEN g % 2 = 1 THEN g END,
+            timestamp '2022-11-03 14:20:52.186' + g * interval '1 second',
+            timestamp '2022-11-03 14:20:52.186' + g * interval '1 second'
+        FROM generate_series(1, {n}) g""",
+    "payment": """
+        INSERT INTO payment (created_at, last_updated, transaction_id,
+            counterparty_id, payment_amount, currency_id, payment_type_id, paid,
+            payment_date, company_ac_number, counterparty_ac_number)
+        SELECT timestamp '2022-11-03 14:20:52.187' + g * interval '1 second',
+            timestamp '2022-11-03 14:20:52.187' + g * interval '1 second',
+            g, 1 + (g % 20), round((g % 100000) / 3.0, 2), 1 + (g % 3),
+            1 + (g % 4), g % 2 = 0, '2022-11-03', 67305502, 31622269
+        FROM generate_series(1, {n}) g""",
+    "payment_type": """
+        INSERT INTO payment_type (payment_type_name)
+        SELECT name FROM unnest(ARRAY['SALES_RECEIPT', 'SALES_REFUND',
+            'PURCHASE_PAYMENT', 'PURCHASE_REFUND']) name""",
+    "currency": """
+        INSERT INTO currency (currency_code)
+        SELECT code FROM unnest(ARRAY['GBP', 'USD', 'EUR']) code""",
+    "staff": """
+        INSERT INTO staff (first_name, last_name, department_id, email_address)
+        SELECT 'First' || g, 'Last' || g, 1 + (g % 8), 'staff' || g || '@example.com'
+        FROM generate_series(1, 20) g""",
+    "department": """
+        INSERT INTO department (department_name, location, manager)
+        SELECT 'Department ' || g, 'Location ' || g, 'Manager ' || g
+        FROM generate_series(1, 8) g""",
+    "purchase_order": """
+        INSERT INTO purchase_order (created_at, last_updated, staff_id,
+            counterparty_id, item_code, item_quantity, item_unit_price,
+            currency_id, agreed_delivery_date, agreed_payment_date,
+            agreed_delivery_location_id)
+        SELECT timestamp '2022-11-03 14:20:52.187' + g * interval '1 second',
+            timestamp '2022-11-03 14:20:52.187' + g * interval '1 second',
+            1 + (g % 20), 1 + (g % 20), 'ITEM' || (g % 1000), 1 + (g % 1000),
+            round((g % 100000) / 7.0, 2), 1 + (g % 3), '2022-11-09',
+            '2022-11-07', 1 + (g % 30)
+        FROM generate_series(1, {n}) g""",
+}
+
+
+def connect():
+    """Returns a pg8000 native connection built from the PG* environment variables."""
+    host = os.environ.get("PGHOST", "localhost")
+    kwargs = {
+        "user": os.environ.get("PGUSER", "postgres"),
+        "password": os.environ.get("PGPASSWORD"),
+        "database": os.environ.get("PGDATABASE", "postgres"),
+    }
+    port = int(os.environ.get("PGPORT", 5432))
+    if host.startswith("/"):
+        kwargs["unix_sock"] = f"{host}/.s.PGSQL.{port}"
+    else:
+        kwargs["host"] = host
+        kwargs["port"] = port
+    return Connection(**kwargs)
+
+
+def create_totesys(conn, rows_per_table):
+    """
+    Drops and recreates the totesys tables and fills the large ones with
+    rows_per_table rows each; the lookup tables keep their real sizes.
+    """
+    for table, ddl in TABLE_DDL.items():
+        conn.run(f"DROP TABLE IF EXISTS {table}")
+        conn.run(ddl)
+        conn.run(TABLE_SEED[table].format(n=int(rows_per_table)))
+    conn.run("ANALYZE")
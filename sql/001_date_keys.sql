@@ -0,0 +1,25 @@
+-- Integer date keys (the day as YYYYMMDD) for joining the sales facts to
+-- dim_date. Apply to the warehouse before deploying the transform and load
+-- Lambdas that write them; until then the loader leaves the columns out.
+
+BEGIN;
+
+ALTER TABLE dim_date ADD COLUMN IF NOT EXISTS date_key int;
+UPDATE dim_date
+SET date_key = CAST(to_char(date_id, 'YYYYMMDD') AS int)
+WHERE date_key IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS dim_date_date_key_idx ON dim_date (date_key);
+
+ALTER TABLE fact_sales_order
+    ADD COLUMN IF NOT EXISTS created_date_key int,
+    ADD COLUMN IF NOT EXISTS last_updated_date_key int,
+    ADD COLUMN IF NOT EXISTS agreed_payment_date_key int,
+    ADD COLUMN IF NOT EXISTS agreed_delivery_date_key int;
+UPDATE fact_sales_order
+SET created_date_key = CAST(to_char(created_date, 'YYYYMMDD') AS int),
+    last_updated_date_key = CAST(to_char(last_updated_date, 'YYYYMMDD') AS int),
+    agreed_payment_date_key = CAST(to_char(agreed_payment_date, 'YYYYMMDD') AS int),
+    agreed_delivery_date_key = CAST(to_char(agreed_delivery_date, 'YYYYMMDD') AS int)
+WHERE created_date_key IS NULL;
+
+COMMIT;
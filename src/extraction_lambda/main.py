@@ -1,16 +1,43 @@
 import boto3
+import hashlib
+import os
 from botocore.exceptions import ClientError, NoCredentialsError
 import json
+from dataclasses import dataclass
 from datetime import datetime
-from utils.lambda_utils import (
+from utils.common import (
     upload_to_s3,
+    compress_data,
     check_for_data,
-    format_data_to_json,
     create_filename,
     connection_to_database,
+    connection_is_alive,
     get_s3_bucket_name,
+    read_manifest,
+    update_manifest,
+    manifest_entry,
+    parse_watermark,
+    TRANSFORM_COLUMNS,
 )
+from utils.extract import (
+    encode_rows_to_json,
+    format_data_to_parquet,
+    stream_table_to_s3,
+    probe_table_changes,
+    export_snapshot,
+    start_read_transaction,
+    read_wire_text,
+    table_watermark,
+    WatermarkTracker,
+    TimeBudget,
+    read_row_hash_index,
+    row_hash_segments,
+    write_row_hash_index,
+)
+from utils.schema import primary_key
 import logging
+import multiprocessing
+import multiprocessing.connection
 
 
 logger = logging.getLogger()
@@ -19,12 +46,137 @@ logger.setLevel("INFO")
 # logging.basicConfig(level=logging.INFO)
 
 
-s3_client = boto3.client("s3")
-conn = connection_to_database()
-bucket_name = get_s3_bucket_name("data-squid-ingest-bucket-")
+# Database connection kept open between warm invocations (see get_connection)
+_connection = None
+
+
+TABLE_NAMES = [
+    "address",
+    "counterparty",
+    "design",
+    "sales_order",
+    "transaction",
+    "payment",
+    "payment_type",
+    "currency",
+    "staff",
+    "department",
+    "purchase_order",
+]
+
+# Rows re-read inside the overlap window are recognised by these columns
+TABLE_PRIMARY_KEYS = {table: primary_key(table) for table in TABLE_NAMES}
+
+# Small, rarely edited tables: the change probe compares a checksum of their whole
+# content, and they are read again in full whenever it changes
+CHECKSUM_PROBE_TABLES = ["currency", "department", "payment_type"]
+
+# Join-shaped dimensions the pushdown mode builds in the source database, with the
+# tables each is joined from; the queries mirror dim_staff and dim_counterparty
+PUSHDOWN_DIMENSIONS = {
+    "dim_staff": (
+        ["staff", "department"],
+        "SELECT staff_id, first_name, last_name, department_name, location, "
+        "email_address FROM staff JOIN department USING (department_id) "
+        "ORDER BY staff_id;",
+    ),
+    "dim_counterparty": (
+        ["counterparty", "address"],
+        "SELECT counterparty_id, counterparty_legal_name, "
+        "address_line_1 AS counterparty_legal_address_line_1, "
+        "address_line_2 AS counterparty_legal_address_line_2, "
+        "district AS counterparty_legal_district, "
+        "city AS counterparty_legal_city, "
+        "postal_code AS counterparty_legal_postal_code, "
+        "country AS counterparty_legal_country, "
+        "phone AS counterparty_legal_phone_number "
+        "FROM counterparty JOIN address ON address_id = legal_address_id "
+        "ORDER BY counterparty_id;",
+    ),
+}
+
+# Tables only the pushed-down joins read. Pushdown runs do not extract them; their
+# changes are detected by content checksum, like CHECKSUM_PROBE_TABLES
+PUSHDOWN_ONLY_TABLES = ["staff", "department", "counterparty"]
+
+
+@dataclass(frozen=True)
+class ExtractionConfig:
+    """
+    Settings of an extraction run, read from the environment by
+    lambda_handler and passed down to every table it extracts.
+
+    Attributes:
+    batch_size (int): When set, each table is streamed through a
+    server-side cursor in batches of this many rows and written with a
+    multipart upload, so peak memory depends on the batch size instead
+    of the table size.
+    max_workers (int): Number of tables extracted at the same time.
+    Above 1, the run's connection exports a snapshot and each worker
+    process opens its own connection and attaches to that snapshot, so
+    all tables are read from one consistent view of the database.
+    file_format (str): "json" (default) or "parquet". Parquet files are
+    built straight from the rows with column types taken from the
+    database. Streamed tables are always written as JSON.
+    overlap (int): Seconds before each table's watermark that are read
+    again, to pick up rows committed late with an older last_updated.
+    Rows already extracted by the previous run are dropped, so the
+    overlap never produces duplicates.
+    chunk_size (int): When set, the initial extraction walks each table
+    in primary-key order and writes it as numbered part objects of this
+    many rows, recording its progress in the manifest after every part;
+    a run that times out is resumed by the next one.
+    compression (str): "gzip" or "zstd" compresses the JSON objects
+    (recorded as their Content-Encoding); for Parquet it is used as the
+    Parquet codec instead.
+    all_columns (bool): Select every column ("*") instead of only those
+    the transforms use (see select_list), for full-fidelity audit runs.
+    pushdown (bool): Build the join-shaped dimensions in
+    PUSHDOWN_DIMENSIONS with one query each in the source database and
+    upload them, already joined, under their dimension names. The tables
+    only those joins read (PUSHDOWN_ONLY_TABLES) are then not extracted;
+    a dimension is rebuilt whenever one of its source tables changed.
+    suppress_unchanged (bool): Compare every extracted row with the
+    content hash recorded for its primary key in the table's row-hash
+    index (see RowHashIndex) and drop the rows that are unchanged apart
+    from last_updated. The watermark still moves past them. Each table's
+    index is stored in the bucket as a base and the deltas of later
+    runs, recorded in its manifest entry, and replaced only by the
+    manifest write that delivers the rows it describes.
+    """
 
+    batch_size: int | None = None
+    max_workers: int = 1
+    file_format: str = "json"
+    overlap: int = 0
+    chunk_size: int | None = None
+    compression: str | None = None
+    all_columns: bool = False
+    pushdown: bool = False
+    suppress_unchanged: bool = False
 
-def extract_data(s3_client, conn, bucket_name):
+
+def select_list(table, all_columns=False):
+    """
+    Returns the select list for extracting a table: the columns the transforms
+    use (TRANSFORM_COLUMNS) plus the primary key and last_updated, or "*" for
+    tables no transform reads and when all_columns is set.
+    """
+    columns = TRANSFORM_COLUMNS.get(table)
+    if all_columns or columns is None:
+        return "*"
+    required = [TABLE_PRIMARY_KEYS[table], "last_updated"]
+    return ", ".join(columns + [column for column in required if column not in columns])
+
+
+def extract_data(
+    s3_client,
+    conn,
+    bucket_name,
+    config=None,
+    connection_factory=None,
+    budget=None,
+):
     """
     Extracts data from a database and uploads it to an S3 bucket.
 
@@ -35,87 +187,902 @@ def extract_data(s3_client, conn, bucket_name):
     used to run queries and retrieve data.
     bucket_name (str): The name of the S3 bucket where the
     extracted data will be uploaded.
+    config (ExtractionConfig, optional): The run's settings; the
+    defaults read every table in one query and write it as JSON.
+    connection_factory (callable, optional): Returns a new database
+    connection; required when config.max_workers is above 1.
+    budget (TimeBudget, optional): Checked before every table and,
+    for streamed and chunked tables, after every batch or chunk. Once
+    it expires no further work is started; what was extracted so far
+    is recorded, and the tables left unfinished are stored in
+    budget.pending and in the manifest's "checkpoint", which the next
+    run extracts first.
 
     Returns:
     tuple: A tuple containing the type of
-    extraction ('Initial extraction' or 'Continuous extraction')
-           and a message indicating which tables were extracted,
-           or a message indicating that no tables were extracted.
+    extraction ('Initial extraction' or 'Continuous extraction'),
+           the list of tables that were extracted and a dict
+           mapping each of those tables to the format it was
+           written in.
 
     This function performs the following steps:
     1. Checks if data exists in the S3 bucket by
     calling the check_for_data function.
-    2. If data exists, it retrieves the last extraction
-    timestamp from 'last_extracted.txt' in the S3 bucket.
-    3. Iterates through a list of table names and
-    runs queries to extract data from each table.
+    2. Reads the bucket's state manifest once; if data exists,
+    each table's watermark, the highest last_updated extracted
+    so far, comes from it (or from the legacy 'last_extracted.txt'
+    for tables it does not know yet).
+    3. Runs the change probe (see probe_changes) and iterates
+    through the tables it reports as changed, running queries
+    to extract data from each table.
        - For continuous extraction, it queries for data
-       updated after the last extraction timestamp.
+       updated since the watermark minus the overlap window,
+       dropping rows the previous run already extracted.
        - For initial extraction, it queries for all data in the table.
-    4. Formats the extracted data to JSON and uploads it to the S3 bucket.
-    5. Updates 'last_extracted.txt' in
-    the S3 bucket with the current timestamp.
+    4. Formats the extracted data to JSON and uploads it to the S3 bucket
+       (batch by batch when streaming).
+    5. Records the new watermark, object key, row count and
+    checksum of every extracted table in the manifest with a
+    single conditional write.
     6. Returns the type of extraction and a message
     indicating which tables were extracted,
     or a message indicating that no tables were extracted.
     """
 
-    table_names = [
-        "address",
-        "counterparty",
-        "design",
-        "sales_order",
-        "transaction",
-        "payment",
-        "payment_type",
-        "currency",
-        "staff",
-        "department",
-        "purchase_order",
-    ]
-    updated_tables = []
-
+    config = config or ExtractionConfig()
     is_data = check_for_data(s3_client, bucket_name)
+    manifest, manifest_etag = read_manifest(s3_client, bucket_name)
+    extraction_type = "Continuous extraction" if is_data else "Initial extraction"
 
     timestamp = datetime.now()
     timestamp_for_filename = timestamp.strftime("%Y/%m/%d/%H:%M")
-    timestamp_for_last_extracted = timestamp_for_filename.encode("utf-8")
-    for table in table_names:
-        if is_data:
-            last_extracted_obj = s3_client.get_object(
-                Bucket=bucket_name, Key=f"{table}/last_extracted.txt"
-            )
-            last_extracted_str = last_extracted_obj["Body"].read().decode("utf-8")
-            dt = datetime.strptime(last_extracted_str, "%Y/%m/%d/%H:%M")
-            last_extracted = dt.isoformat()
-            query = f"SELECT * FROM {table} WHERE last_updated > '{last_extracted};'"
-            extraction_type = "Continuous extraction"
 
+    checksum_tables = CHECKSUM_PROBE_TABLES
+    if config.pushdown:
+        checksum_tables = CHECKSUM_PROBE_TABLES + [
+            table for table in PUSHDOWN_ONLY_TABLES if table not in checksum_tables
+        ]
+    tables, content_checksums = probe_changes(
+        s3_client,
+        conn,
+        bucket_name,
+        manifest,
+        is_data,
+        overlap=config.overlap,
+        checksum_tables=checksum_tables,
+    )
+    # tables a run stopped by its time budget left unfinished go first
+    resume_first = (manifest.get("checkpoint") or {}).get("pending", [])
+    tables = sorted(tables, key=lambda table: table not in resume_first)
+    stopped = []
+
+    dimensions = []
+    if config.pushdown:
+        dimensions = [
+            dimension
+            for dimension, (sources, _) in PUSHDOWN_DIMENSIONS.items()
+            if dimension in resume_first or any(source in tables for source in sources)
+        ]
+        tables = [table for table in tables if table not in PUSHDOWN_ONLY_TABLES]
+
+    if not tables:
+        entries = {}
+    elif config.max_workers > 1:
+        entries = extract_tables_in_parallel(
+            conn,
+            connection_factory,
+            bucket_name,
+            is_data,
+            timestamp_for_filename,
+            config,
+            manifest=manifest,
+            tables=tables,
+            content_checksums=content_checksums,
+            budget=budget,
+            stopped=stopped,
+        )
+    else:
+        entries = {}
+        for table in tables:
+            if budget is not None and budget.expired():
+                break
+            entries[table] = extract_table(
+                s3_client,
+                conn,
+                bucket_name,
+                table,
+                is_data,
+                timestamp_for_filename,
+                config,
+                manifest=manifest,
+                content_checksum=content_checksums.get(table),
+                budget=budget,
+            )
+            if budget is not None and budget.stopped:
+                # the budget ran out while this table was read
+                stopped.append(table)
+
+    for dimension in dimensions:
+        if budget is not None and budget.expired():
+            break
+        entries[dimension] = extract_pushdown_dimension(
+            s3_client,
+            conn,
+            bucket_name,
+            dimension,
+            timestamp_for_filename,
+            file_format=config.file_format,
+            compression=config.compression,
+        )
+        # the source tables' checksums are recorded only with the dimension
+        # built from them, so one left for the next run is still seen as changed
+        for source in PUSHDOWN_DIMENSIONS[dimension][0]:
+            if source in PUSHDOWN_ONLY_TABLES and source in content_checksums:
+                entries[source] = manifest_entry(
+                    [],
+                    0,
+                    None,
+                    None,
+                    config.file_format,
+                    content_checksum=content_checksums[source],
+                )
+
+    pending = [
+        table
+        for table in tables + dimensions
+        if table not in entries
+        or table in stopped
+        or "bootstrap" in (entries[table] or {})
+    ]
+    fields = None
+    if pending or manifest.get("checkpoint"):
+        checkpoint = None
+        if pending:
+            checkpoint = {"pending": pending, "stopped_at": datetime.now().isoformat()}
+            logger.warning(f"Time budget ran out, left for the next run: {pending}")
+        fields = {"checkpoint": checkpoint}
+    if budget is not None:
+        budget.pending = pending
+
+    entries = {table: entry for table, entry in entries.items() if entry}
+    if entries or fields:
+        previous, current = set(), set()
+        for table, entry in entries.items():
+            previous_entry = manifest.get("tables", {}).get(table, {})
+            previous.update(row_hash_segments(previous_entry.get("row_hashes")))
+            current.update(row_hash_segments(entry.get("row_hashes")))
+        try:
+            update_manifest(
+                s3_client,
+                bucket_name,
+                entries,
+                manifest=manifest,
+                etag=manifest_etag,
+                fields=fields,
+            )
+        except Exception:
+            # the row-hash segments written by this run are not referenced
+            delete_row_hash_segments(s3_client, bucket_name, current - previous)
+            raise
+        # nor are the ones the new entries replaced (merged deltas, old bases)
+        delete_row_hash_segments(s3_client, bucket_name, previous - current)
+
+    # a table still being bootstrapped is only reported once it is complete
+    updated_tables = [
+        table
+        for table in TABLE_NAMES + list(PUSHDOWN_DIMENSIONS)
+        if table in entries
+        and entries[table]["keys"]
+        and "bootstrap" not in entries[table]
+    ]
+    table_formats = {table: entries[table]["format"] for table in updated_tables}
+
+    return extraction_type, updated_tables, table_formats
+
+
+def probe_changes(
+    s3_client,
+    conn,
+    bucket_name,
+    manifest,
+    is_data,
+    overlap=0,
+    checksum_tables=CHECKSUM_PROBE_TABLES,
+):
+    """
+    Decides which tables a run has to extract, with one aggregate query over
+    all of them (probe_table_changes) instead of a full query per table.
+
+    A table is unchanged when the rows at or after its watermark minus the
+    overlap are all boundary rows recorded by the previous run, with the
+    same primary key and last_updated (see WatermarkTracker), so both a
+    late commit inside the window and a boundary row updated again are
+    found. The tables in checksum_tables (CHECKSUM_PROBE_TABLES, plus
+    PUSHDOWN_ONLY_TABLES in pushdown runs) are compared by the checksum of
+    their content instead. Tables with an unfinished bootstrap are always extracted, and
+    on the initial extraction every table is, but the checksums of the static
+    tables are still probed so the next run has something to compare with.
+
+    Returns:
+    tuple: The tables to extract, in TABLE_NAMES order, and a dict with
+    the new content checksum of each static table among them.
+    """
+    tables = manifest.get("tables", {})
+    since, boundaries = {}, {}
+    for table in TABLE_NAMES:
+        if "bootstrap" in tables.get(table, {}):
+            continue
+        if table in checksum_tables:
+            since[table] = None
+        elif is_data:
+            watermark, boundary = table_watermark(
+                s3_client, bucket_name, table, manifest=manifest
+            )
+            tracker = WatermarkTracker(
+                TABLE_PRIMARY_KEYS[table], watermark, boundary, overlap=overlap
+            )
+            since[table] = tracker.since()
+            boundaries[table] = TABLE_PRIMARY_KEYS[table], boundary
+
+    probe = probe_table_changes(
+        conn,
+        since,
+        {table: TABLE_PRIMARY_KEYS[table] for table in checksum_tables},
+        boundaries,
+    )
+    content_checksums = {
+        table: probe[table][2] for table in checksum_tables if table in probe
+    }
+    if not is_data:
+        return list(TABLE_NAMES), content_checksums
+
+    changed = []
+    for table in TABLE_NAMES:
+        if table not in probe:
+            changed.append(table)
+        elif table in checksum_tables:
+            if tables.get(table, {}).get("content_checksum") != probe[table][2]:
+                changed.append(table)
+        elif probe[table][0]:
+            # rows the previous run did not deliver
+            changed.append(table)
+
+    unchanged = [table for table in TABLE_NAMES if table not in changed]
+    if unchanged:
+        logger.info(f"Change probe: no changes in {unchanged}")
+    return changed, {
+        table: checksum
+        for table, checksum in content_checksums.items()
+        if table in changed
+    }
+
+
+def extract_table(
+    s3_client,
+    conn,
+    bucket_name,
+    table,
+    is_data,
+    timestamp_for_filename,
+    config=None,
+    snapshot_id=None,
+    manifest=None,
+    started_at=None,
+    content_checksum=None,
+    budget=None,
+):
+    """
+    Extracts a single table and uploads it to the S3 bucket.
+
+    Parameters:
+    s3_client (boto3.client): S3 client used for the uploads.
+    conn (database connection): Connection the table is read with.
+    bucket_name (str): The name of the ingestion bucket.
+    table (str): The table to extract.
+    is_data (bool): False on the initial extraction, when the whole
+    table is read; otherwise only rows updated since the table's
+    watermark are read.
+    timestamp_for_filename (str): Timestamp used in the object key.
+    config (ExtractionConfig, optional): The run's settings. With
+    batch_size the table is streamed instead of read in one query,
+    and always written as JSON; JSON extractions fetch timestamps and
+    numerics as wire text, which is written out as is. With
+    chunk_size, tables without a watermark are read in chunks with
+    bootstrap_table. A bootstrap left unfinished by an earlier run is
+    always resumed.
+    snapshot_id (str, optional): Exported snapshot the read is
+    attached to.
+    manifest (dict, optional): The bucket's state manifest, used to
+    look up the table's watermark.
+    started_at (datetime, optional): Passed on to bootstrap_table.
+    content_checksum (str, optional): The change probe's checksum of
+    a static table (see CHECKSUM_PROBE_TABLES). When given, the table
+    is read again in full and the checksum recorded in its entry.
+    budget (TimeBudget, optional): Checked between the batches of a
+    streamed table and the chunks of a bootstrap. A stream is then
+    read in last_updated order, so that one cut short still ends on a
+    watermark the next run can carry on from.
+
+    Returns:
+    dict or None: The table's new manifest entry, or None if there
+    were no new rows. On the initial extraction an empty table still
+    gets an entry (with no keys) so that its watermark is recorded,
+    and so does a table whose new rows were all suppressed as
+    unchanged.
+    """
+    config = config or ExtractionConfig()
+    entry = (manifest or {}).get("tables", {}).get(table)
+    resuming = entry is not None and "bootstrap" in entry
+    row_hashes = None
+    if config.suppress_unchanged:
+        row_hashes = read_row_hash_index(
+            s3_client,
+            bucket_name,
+            table,
+            TABLE_PRIMARY_KEYS[table],
+            (entry or {}).get("row_hashes"),
+        )
+    if content_checksum is not None:
+        # a static table whose content changed is small enough to read again
+        watermark, boundary = None, []
+    elif is_data and not resuming:
+        watermark, boundary = table_watermark(
+            s3_client, bucket_name, table, manifest=manifest
+        )
+    else:
+        watermark, boundary = None, []
+
+    # tables with nothing extracted yet are read in full, in chunks if configured
+    if resuming or (
+        config.chunk_size and watermark is None and content_checksum is None
+    ):
+        return bootstrap_table(
+            s3_client,
+            conn,
+            bucket_name,
+            table,
+            timestamp_for_filename,
+            config,
+            snapshot_id=snapshot_id,
+            progress=entry,
+            started_at=started_at,
+            budget=budget,
+            row_hashes=row_hashes,
+        )
+
+    tracker = WatermarkTracker(
+        TABLE_PRIMARY_KEYS[table], watermark, boundary, overlap=config.overlap
+    )
+    row_filter = tracker.filter
+    if row_hashes is not None:
+
+        def row_filter(rows, columns):
+            # the tracker sees every row, so the watermark moves past suppressed ones
+            return row_hashes.filter(tracker.filter(rows, columns), columns)
+
+    columns = select_list(table, config.all_columns)
+    if tracker.since() is None:
+        query, params = f"SELECT {columns} FROM {table}", {}
+    else:
+        query = f"SELECT {columns} FROM {table} WHERE last_updated >= :since"
+        params = {"since": tracker.since()}
+    if config.batch_size and budget is not None:
+        query += f" ORDER BY last_updated, {TABLE_PRIMARY_KEYS[table]}"
+    query += ";"
+
+    keys, checksum = [], None
+    file_format, compression = config.file_format, config.compression
+    if config.batch_size:
+        file_format = "json"
+        filename = create_filename(
+            table, timestamp_for_filename, compression=compression
+        )
+        digest = hashlib.sha256()
+        row_count = stream_table_to_s3(
+            s3_client,
+            conn,
+            query,
+            bucket_name,
+            filename,
+            config.batch_size,
+            snapshot_id=snapshot_id,
+            digest=digest,
+            params=params,
+            row_filter=row_filter,
+            compression=compression,
+            raw=True,
+            stop=budget.expired if budget is not None else None,
+        )
+        if row_count:
+            keys, checksum = [filename], digest.hexdigest()
+    else:
+        rows, column_descriptions = run_query(
+            conn, query, params, snapshot_id, raw=file_format == "json"
+        )
+        rows = row_filter(rows, column_descriptions)
+
+        row_count = len(rows)
+        if row_count:
+            data, content_encoding = encode_table_data(
+                rows, column_descriptions, file_format, compression
+            )
+            filename = create_filename(
+                table,
+                timestamp_for_filename,
+                file_format=file_format,
+                compression=compression,
+            )
+            upload_to_s3(
+                data=data,
+                bucket_name=bucket_name,
+                object_name=filename,
+                content_encoding=content_encoding,
+            )
+            keys, checksum = [filename], hashlib.sha256(data).hexdigest()
+
+    suppressed = row_hashes.suppressed if row_hashes is not None else 0
+    if not row_count and not suppressed and is_data:
+        return None
+    new_entry = manifest_entry(
+        keys,
+        row_count,
+        checksum,
+        tracker.watermark.isoformat() if tracker.watermark else None,
+        file_format,
+        boundary=tracker.boundary(),
+        content_checksum=content_checksum,
+    )
+    if row_hashes is not None:
+        if suppressed:
+            logger.info(f"{table}: {suppressed} unchanged rows suppressed")
+        new_entry["row_hashes"] = store_row_hashes(
+            s3_client, bucket_name, table, row_hashes, entry
+        )
+    return new_entry
+
+
+def store_row_hashes(s3_client, bucket_name, table, row_hashes, entry=None):
+    """
+    Returns the record of a table's row-hash index for its new manifest
+    entry: the rows added to the index are uploaded as a new segment
+    (see write_row_hash_index), otherwise the previous entry's record
+    still holds it.
+    """
+    return write_row_hash_index(
+        s3_client, bucket_name, table, row_hashes, (entry or {}).get("row_hashes")
+    )
+
+
+def delete_row_hash_segments(s3_client, bucket_name, keys):
+    """
+    Deletes row-hash index segments no manifest entry refers to. Failing
+    to delete one only leaves an orphan, so it must not fail the run.
+    """
+    for key in sorted(keys):
+        try:
+            s3_client.delete_object(Bucket=bucket_name, Key=key)
+        except ClientError as e:
+            logger.warning(f"Could not delete row-hash index segment {key}: {e}")
+
+
+def bootstrap_table(
+    s3_client,
+    conn,
+    bucket_name,
+    table,
+    timestamp_for_filename,
+    config,
+    snapshot_id=None,
+    progress=None,
+    started_at=None,
+    budget=None,
+    row_hashes=None,
+):
+    """
+    Extracts a whole table in primary-key order, config.chunk_size rows at
+    a time (or as many as the bootstrap being resumed used).
+
+    Each chunk is read with a keyset query
+    (WHERE <pk> > :last_id ORDER BY <pk> LIMIT :chunk_size), uploaded
+    as its own numbered part object and recorded in the manifest,
+    under the entry's "bootstrap" key, before the next chunk is read.
+    When the lambda times out, the next run finds that progress and
+    carries on after the last part written; the table is only
+    reported once it has been read to the end.
+
+    Parameters:
+    config (ExtractionConfig): The run's settings.
+    progress (dict, optional): The table's manifest entry; resumed
+    from if it holds bootstrap progress.
+    started_at (datetime, optional): Database time at which the
+    bootstrap started. Queried from conn when not given.
+    budget (TimeBudget, optional): Checked after every chunk; once it
+    expires the entry is returned with its bootstrap progress, to be
+    resumed by the next run.
+    row_hashes (RowHashIndex, optional): Filled with the hashes of the
+    rows read, and stored once the table has been read to the end (a
+    resumed bootstrap only indexes the rows read after resuming; rows
+    missing from an index are never suppressed).
+
+    The watermark handed over to continuous extraction is the earlier
+    of the highest last_updated read and started_at, so rows changed
+    while the table was being walked are read again by the next run
+    (rows changed during the walk may therefore be delivered twice).
+
+    Returns:
+    dict: The table's complete manifest entry, listing every part (or
+    its entry so far, with the bootstrap progress, when the budget ran
+    out).
+    """
+    primary_key = TABLE_PRIMARY_KEYS[table]
+    columns = select_list(table, config.all_columns)
+    file_format, compression = config.file_format, config.compression
+    chunk_size, overlap = config.chunk_size, config.overlap
+    if progress and "bootstrap" in progress:
+        state = progress["bootstrap"]
+        chunk_size = chunk_size or state["chunk_size"]
+        started_at = parse_watermark(state["started_at"])
+        last_id = state["last_id"]
+        keys = list(progress["keys"])
+        part_checksums = list(progress["part_checksums"])
+        row_count = progress["row_count"]
+        tracker = WatermarkTracker(
+            primary_key,
+            parse_watermark(progress["watermark"]),
+            progress["boundary"],
+            overlap=overlap,
+        )
+    else:
+        if started_at is None:
+            started_at = conn.run("SELECT LOCALTIMESTAMP")[0][0]
+        last_id = None
+        keys, part_checksums, row_count = [], [], 0
+        tracker = WatermarkTracker(primary_key, overlap=overlap)
+
+    while True:
+        params = {"chunk_size": chunk_size}
+        if last_id is None:
+            query = (
+                f"SELECT {columns} FROM {table} "
+                f"ORDER BY {primary_key} LIMIT :chunk_size"
+            )
         else:
-            query = f"SELECT * FROM {table};"
-            s3_client.put_object(
-                Bucket=bucket_name,
-                Key=f"{table}/last_extracted.txt",
-                Body=timestamp_for_last_extracted,
+            query = (
+                f"SELECT {columns} FROM {table} WHERE {primary_key} > :last_id "
+                f"ORDER BY {primary_key} LIMIT :chunk_size"
             )
-            extraction_type = "Initial extraction"
+            params["last_id"] = last_id
+        rows, column_descriptions = run_query(
+            conn, query, params, snapshot_id, raw=file_format == "json"
+        )
+        if rows:
+            names = [column["name"] for column in column_descriptions]
+            last_id = rows[-1][names.index(primary_key)]
+        fetched = len(rows)
+        rows = tracker.filter(rows, column_descriptions)
+        if row_hashes is not None:
+            rows = row_hashes.filter(rows, column_descriptions)
 
-        rows = conn.run(query)
-        columns = [col["name"] for col in conn.columns]
-        data_json = format_data_to_json(rows, columns)
-        filename = create_filename(table, timestamp_for_filename)
-        data_json_str = json.loads(data_json.decode("utf-8"))
+        if rows:
+            data, content_encoding = encode_table_data(
+                rows, column_descriptions, file_format, compression
+            )
+            filename = create_filename(
+                table,
+                timestamp_for_filename,
+                file_format=file_format,
+                part=len(keys) + 1,
+                compression=compression,
+            )
+            upload_to_s3(
+                data=data,
+                bucket_name=bucket_name,
+                object_name=filename,
+                content_encoding=content_encoding,
+            )
+            keys.append(filename)
+            part_checksums.append(hashlib.sha256(data).hexdigest())
+            row_count += len(rows)
 
-        if data_json_str:
-            s3_client.put_object(
-                Bucket=bucket_name,
-                Key=f"{table}/last_extracted.txt",
-                Body=timestamp_for_last_extracted,
+        entry = manifest_entry(
+            keys,
+            row_count,
+            hashlib.sha256("".join(part_checksums).encode("utf-8")).hexdigest(),
+            tracker.watermark.isoformat() if tracker.watermark else None,
+            file_format,
+            boundary=tracker.boundary(),
+        )
+        entry["part_checksums"] = part_checksums
+        if fetched < chunk_size:
+            break
+        entry["bootstrap"] = {
+            "last_id": last_id,
+            "chunk_size": chunk_size,
+            "started_at": started_at.isoformat(),
+        }
+        update_manifest(s3_client, bucket_name, {table: entry}, attempts=10)
+        if budget is not None and budget.expired():
+            return entry
+
+    if tracker.watermark and started_at < tracker.watermark:
+        since = started_at - tracker.overlap
+        entry["watermark"] = started_at.isoformat()
+        entry["boundary"] = [
+            [key, last_updated]
+            for key, last_updated in entry["boundary"]
+            if datetime.fromisoformat(last_updated) >= since
+        ]
+    if row_hashes is not None:
+        entry["row_hashes"] = store_row_hashes(
+            s3_client, bucket_name, table, row_hashes
+        )
+    return entry
+
+
+def extract_pushdown_dimension(
+    s3_client,
+    conn,
+    bucket_name,
+    dimension,
+    timestamp_for_filename,
+    file_format="json",
+    compression=None,
+):
+    """
+    Runs the join of a dimension in PUSHDOWN_DIMENSIONS in the source
+    database and uploads the result, in full, as the dimension's object.
+
+    Returns:
+    dict: The dimension's manifest entry (with no keys when the join
+    returned no rows). Dimensions have no watermark; they are rebuilt
+    whenever one of their source tables changes.
+    """
+    _, query = PUSHDOWN_DIMENSIONS[dimension]
+    rows, column_descriptions = run_query(conn, query, {}, raw=file_format == "json")
+    if not rows:
+        return manifest_entry([], 0, None, None, file_format)
+
+    data, content_encoding = encode_table_data(
+        rows, column_descriptions, file_format, compression
+    )
+    filename = create_filename(
+        dimension,
+        timestamp_for_filename,
+        file_format=file_format,
+        compression=compression,
+    )
+    upload_to_s3(
+        data=data,
+        bucket_name=bucket_name,
+        object_name=filename,
+        content_encoding=content_encoding,
+    )
+    return manifest_entry(
+        [filename], len(rows), hashlib.sha256(data).hexdigest(), None, file_format
+    )
+
+
+def encode_table_data(rows, column_descriptions, file_format, compression=None):
+    """
+    Encodes extracted rows as JSON or Parquet.
+
+    JSON is compressed afterwards when compression is set; Parquet uses
+    the compression as its codec, because its pages are compressed
+    anyway.
+
+    Returns:
+    tuple: The bytes to upload and their Content-Encoding (None when
+    the object is not compressed as a whole).
+    """
+    if file_format == "parquet":
+        data = format_data_to_parquet(
+            rows, column_descriptions, compression or "snappy"
+        )
+        return data, None
+    data, _ = encode_rows_to_json(rows, column_descriptions)
+    return compress_data(data, compression)
+
+
+def run_query(conn, query, params, snapshot_id=None, raw=False):
+    """
+    Runs a query, inside the exported snapshot if one is given, and
+    returns its rows together with their column descriptions.
+
+    With raw set, timestamps and numerics come back as the text
+    Postgres sent (see read_wire_text), for rows that are only
+    written out as JSON.
+    """
+    if snapshot_id:
+        start_read_transaction(conn, snapshot_id)
+        try:
+            with read_wire_text(conn, raw):
+                return conn.run(query, **params), conn.columns
+        finally:
+            conn.run("COMMIT")
+    with read_wire_text(conn, raw):
+        return conn.run(query, **params), conn.columns
+
+
+def extract_tables_in_parallel(
+    conn,
+    connection_factory,
+    bucket_name,
+    is_data,
+    timestamp_for_filename,
+    config,
+    manifest=None,
+    tables=None,
+    content_checksums=None,
+    budget=None,
+    stopped=None,
+):
+    """
+    Extracts tables (every table by default) on a pool of config.max_workers
+    worker processes, each with its own database connection and S3 client.
+
+    conn exports a snapshot and keeps its transaction open until all
+    workers have finished; every worker attaches to that snapshot
+    before reading, so the tables are mutually consistent (for
+    example sales_order against staff) even though they are read
+    over different connections. Each table is uploaded by its worker
+    as soon as it has been read.
+
+    Processes are used rather than threads because decoding rows and
+    encoding JSON hold the GIL. Tables are handed out one at a time
+    over pipes (Lambda has no /dev/shm, so multiprocessing.Pool and
+    Queue are unavailable), so a worker that finishes a small table
+    immediately picks up the next one.
+
+    With a budget, no table is handed out once it has expired, and the
+    workers check it between batches and chunks; tables during which
+    it ran out are appended to stopped.
+
+    Returns:
+    dict: Maps each table name to its new manifest entry (see
+    extract_table), or None if it had no new rows.
+    """
+    snapshot_id = export_snapshot(conn)
+    # start of the snapshot's transaction, and so no later than the snapshot itself
+    started_at = None
+    if config.chunk_size:
+        started_at = conn.run("SELECT LOCALTIMESTAMP")[0][0]
+    mp_context = multiprocessing.get_context("fork")
+    pending = list(TABLE_NAMES if tables is None else tables)
+    if budget is not None and budget.expired():
+        pending = []
+    results = {}
+    workers = []
+
+    try:
+        for _ in range(min(config.max_workers, len(pending))):
+            parent_pipe, child_pipe = mp_context.Pipe()
+            process = mp_context.Process(
+                target=extraction_worker,
+                args=(child_pipe, connection_factory, bucket_name, config),
+                kwargs={
+                    "is_data": is_data,
+                    "timestamp_for_filename": timestamp_for_filename,
+                    "snapshot_id": snapshot_id,
+                    "manifest": manifest,
+                    "started_at": started_at,
+                    "content_checksums": content_checksums or {},
+                    "budget": budget,
+                },
             )
-            upload_to_s3(data=data_json, bucket_name=bucket_name, object_name=filename)
-            updated_tables.append(table)
+            process.start()
+            child_pipe.close()
+            workers.append((process, parent_pipe))
+            parent_pipe.send(pending.pop(0))
 
-    return extraction_type, updated_tables
+        busy = [parent_pipe for _, parent_pipe in workers]
+        while busy:
+            for pipe in multiprocessing.connection.wait(busy):
+                try:
+                    status, table, value = pipe.recv()
+                except EOFError:
+                    raise RuntimeError("Extraction worker exited unexpectedly")
+                if status == "error":
+                    raise RuntimeError(f"Extraction of {table} failed: {value}")
+                results[table] = value
+                if status == "stopped" and stopped is not None:
+                    stopped.append(table)
+                if pending and not (budget is not None and budget.expired()):
+                    pipe.send(pending.pop(0))
+                else:
+                    pipe.send(None)
+                    busy.remove(pipe)
+        return results
+    finally:
+        for process, parent_pipe in workers:
+            parent_pipe.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        conn.run("COMMIT")
+
+
+def extraction_worker(
+    pipe,
+    connection_factory,
+    bucket_name,
+    config,
+    is_data,
+    timestamp_for_filename,
+    snapshot_id,
+    manifest,
+    started_at,
+    content_checksums,
+    budget,
+):
+    """
+    Worker process loop for extract_tables_in_parallel.
+
+    Receives table names over pipe until it gets None, extracts each
+    one inside the shared snapshot with extract_table, which the other
+    arguments are passed on to, and sends back
+    ("ok", table, entry), ("stopped", table, entry) when the budget
+    ran out during the table, or ("error", table, message).
+    """
+    table = None
+    worker_conn = None
+    try:
+        worker_conn = connection_factory()
+        s3_client = boto3.client("s3")
+        for table in iter(pipe.recv, None):
+            entry = extract_table(
+                s3_client,
+                worker_conn,
+                bucket_name,
+                table,
+                is_data,
+                timestamp_for_filename,
+                config,
+                snapshot_id=snapshot_id,
+                manifest=manifest,
+                started_at=started_at,
+                content_checksum=content_checksums.get(table),
+                budget=budget,
+            )
+            status = "stopped" if budget is not None and budget.stopped else "ok"
+            pipe.send((status, table, entry))
+    except Exception as e:
+        pipe.send(("error", table, repr(e)))
+    finally:
+        if worker_conn is not None:
+            worker_conn.close()
+        pipe.close()
+
+
+def get_connection():
+    """
+    Returns the database connection left open by an earlier invocation in
+    this execution environment if it still answers a liveness check,
+    otherwise opens (and keeps) a new one.
+    """
+    global _connection
+    if _connection is not None:
+        if connection_is_alive(_connection):
+            logger.info("Reusing database connection from a previous invocation")
+            return _connection
+        logger.warning("Database connection is no longer usable, reconnecting")
+        close_connection()
+
+    _connection = connection_to_database()
+    logger.info("Opened a new database connection")
+    return _connection
+
+
+def close_connection():
+    """Closes and forgets the kept database connection, ignoring errors from a dead socket."""
+    global _connection
+    if _connection is None:
+        return
+    try:
+        _connection.close()
+    except Exception as e:
+        logger.warning(f"Error closing database connection: {e}")
+    _connection = None
+    logger.info("Database connection closed.")
 
 
 def lambda_handler(event, context):
@@ -130,20 +1097,61 @@ def lambda_handler(event, context):
         logger.error(f"Error creating S3 client: {e}")
         return {"result": "Failure", "error": "Error creating S3 client"}
 
-    conn = connection_to_database()
+    conn = get_connection()
     bucket_name = get_s3_bucket_name("data-squid-ingest-bucket-")
+    # "transform" selects only the columns the transforms use; "all" (for
+    # audit runs, also accepted as {"columns": "all"} in the event) selects every one
+    columns = (event or {}).get("columns") or os.environ.get(
+        "EXTRACTION_COLUMNS", "transform"
+    )
+    config = ExtractionConfig(
+        batch_size=int(os.environ.get("EXTRACTION_BATCH_SIZE", 0)) or None,
+        max_workers=int(os.environ.get("EXTRACTION_WORKERS", 1)),
+        file_format=os.environ.get("INGESTION_FORMAT", "json"),
+        overlap=int(os.environ.get("EXTRACTION_OVERLAP_SECONDS", 0)),
+        chunk_size=int(os.environ.get("EXTRACTION_CHUNK_SIZE", 0)) or None,
+        compression=os.environ.get("INGESTION_COMPRESSION", "none"),
+        all_columns=columns == "all",
+        # "true" joins dim_staff and dim_counterparty in the source database
+        pushdown=os.environ.get("EXTRACTION_PUSHDOWN", "false") == "true",
+        # "true" drops rows whose last_updated moved without any other change
+        suppress_unchanged=(
+            os.environ.get("EXTRACTION_SUPPRESS_UNCHANGED", "false") == "true"
+        ),
+    )
+    # stop starting work this many seconds before the Lambda timeout; what is
+    # left over is resumed by the next scheduled run
+    budget = None
+    if hasattr(context, "get_remaining_time_in_millis"):
+        budget = TimeBudget(
+            context.get_remaining_time_in_millis,
+            reserve=int(os.environ.get("EXTRACTION_TIME_RESERVE_SECONDS", 60)),
+        )
 
     try:
-        extraction_type, updated_tables = extract_data(s3_client, conn, bucket_name)
+        extraction_type, updated_tables, table_formats = extract_data(
+            s3_client,
+            conn,
+            bucket_name,
+            config,
+            connection_factory=connection_to_database,
+            budget=budget,
+        )
+        pending_tables = budget.pending if budget is not None else []
 
-        if updated_tables:
+        if updated_tables or pending_tables:
 
             report = {
-                "status": "Success",
+                "status": "Partial" if pending_tables else "Success",
                 "extraction_type": extraction_type,
                 "updated_tables": updated_tables,
+                "table_formats": table_formats,
             }
-            report_file_name = f"reports/{datetime.now().isoformat()}_success.json"
+            # only a report with updated tables triggers the transform lambda
+            suffix = "success" if updated_tables else "partial"
+            if pending_tables:
+                report["pending_tables"] = pending_tables
+            report_file_name = f"reports/{datetime.now().isoformat()}_{suffix}.json"
 
             s3_client.put_object(
                 Body=json.dumps(report, indent=4),
@@ -157,22 +1165,23 @@ def lambda_handler(event, context):
             )
 
             return {
-                "result": "Success",
+                "result": report["status"],
                 "report_file": f"s3://{bucket_name}/{report_file_name}",
             }
 
     except ClientError as e:
-        logger.error(f"Error updating last_extracted.txt: {e}")
-        return {"result": "Failure", "error": "Error updating last_extracted.txt"}
+        # uploads, secrets, checkpoints and the manifest write all end up here,
+        # so report which AWS call failed
+        logger.error(f"Error during {e.operation_name}: {e}")
+        close_connection()
+        return {"result": "Failure", "error": f"Error during {e.operation_name}"}
 
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
+        # the connection may be mid-transaction; start clean next time
+        close_connection()
         return {"result": "Failure", "error": "Unexpected error"}
 
-    finally:
-        conn.close()
-        logger.info("Database connection closed.")
-
 
 if __name__ == "__main__":
     lambda_handler({}, {})
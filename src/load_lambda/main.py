@@ -1,12 +1,16 @@
+import boto3
 import json
 import logging
 import urllib
-from utils.lambda_utils import (
+from utils.load import (
     insert_data_to_table,
     connect_to_warehouse,
     extract_tablenames_load,
     parquet_to_dataframe,
 )
+from utils.common import (
+    read_manifest,
+)
 
 
 logger = logging.getLogger()
@@ -37,10 +41,12 @@ def lambda_handler(event, context):
             "body": json.dumps(f"Invalid event format: {str(e)}"),
         }
 
-    # Extract table names from the report file
+    # Extract table names from the report file, and read the bucket's state manifest
+    # once to resolve where each of those tables was written
     try:
         transformed_table_names = extract_tablenames_load(bucket_name, key)
         logger.info("Extracted table names: %s", transformed_table_names)
+        manifest, _ = read_manifest(boto3.client("s3"), bucket_name)
     except Exception as e:
         logger.error("Error extracting table names: %s", str(e))
         return {
@@ -70,7 +76,9 @@ def lambda_handler(event, context):
                 try:
                     logger.info("Bucket name: %s", bucket_name)
                     logger.info("Processing table: %s", table_name)
-                    df = parquet_to_dataframe(bucket_name, table_name)
+                    df = parquet_to_dataframe(
+                        bucket_name, table_name, manifest=manifest
+                    )
                     insert_data_to_table(conn, table_name, df)
                     logger.info("Successfully loaded table: %s", table_name)
                 except Exception as e:
@@ -1,11 +1,37 @@
 import boto3
+import hashlib
+import io
 import json
-from datetime import datetime
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from graphlib import TopologicalSorter
 import logging
 import urllib
 from botocore.exceptions import ClientError, NoCredentialsError
-from utils.lambda_utils import (
+import pandas as pd
+from utils.common import (
+    create_filename_for_parquet,
+    upload_to_s3,
+    get_s3_bucket_name,
+    check_for_data,
+    read_manifest,
+    update_manifest,
+    manifest_entry,
+)
+from utils.schema import primary_key
+from utils.transform import (
+    DIM_DATE_END,
+    DIM_DATE_START,
+    compact_dataframe,
     convert_json_to_df_from_s3,
+    dataframe_to_parquet,
     dim_design,
     dim_date,
     dim_counterparty,
@@ -13,17 +39,93 @@ from utils.lambda_utils import (
     dim_location,
     dim_staff,
     fact_sales_order,
-    dataframe_to_parquet,
-    create_filename_for_parquet,
-    upload_to_s3,
-    get_s3_bucket_name,
-    check_for_data,
+    frame_memory_mib,
+    merge_snapshot,
+    parse_parquet_profiles,
+    read_ingested_history,
+    read_snapshot,
+    write_snapshot,
 )
 
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+# Warehouse tables built by the transform lambda: each maps to the tables it
+# is built from and the function building it, which is called with their
+# DataFrames in that order. Inputs are ingested tables or other entries of
+# TRANSFORMS. Entries with no inputs are static and only built into an empty
+# bucket, unless they are in CALENDAR_TRANSFORMS. This is also the order of
+# the transform report, which the load lambda inserts in, so dimensions come
+# before facts.
+TRANSFORMS = {
+    "dim_date": ([], dim_date),
+    "dim_design": (["design"], dim_design),
+    "dim_location": (["address"], dim_location),
+    "dim_currency": (["currency"], dim_currency),
+    "dim_counterparty": (["address", "counterparty"], dim_counterparty),
+    "dim_staff": (["department", "staff"], dim_staff),
+    "fact_sales_order": (["sales_order"], fact_sales_order),
+}
+
+# Outputs joining ingested tables that change independently. They are rebuilt
+# whenever any one of their inputs changed, from snapshots of all of them kept
+# in the transform bucket, and only for the rows the changes affect. Each maps
+# to the input it has one row per and, for each other input, the column of
+# that one referencing its primary key (see utils.schema).
+INCREMENTAL_TRANSFORMS = {
+    "dim_counterparty": ("counterparty", {"address": "legal_address_id"}),
+    "dim_staff": ("staff", {"department": "department_id"}),
+}
+
+# Outputs with no inputs covering a range of days, which are extended forward
+# instead of being built once: whenever the last day they cover is less than a
+# horizon ahead, their function is called with the first and last of the days
+# missing, and only those are written, as a new part the load lambda appends.
+# Each maps to the first day it covers and the last day covered by the versions
+# written before it was extended, which recorded no calendar_end.
+CALENDAR_TRANSFORMS = {
+    "dim_date": (DIM_DATE_START, DIM_DATE_END),
+}
+
+
+@dataclass(frozen=True)
+class TransformConfig:
+    """
+    Settings of a transform run, read from the environment by
+    lambda_handler and passed to run_transforms.
+
+    Attributes:
+    parquet_compression (str): Codec of the Parquet files, overriding
+    the profiles'.
+    parquet_profile (str): Writer profile of the outputs (see
+    PARQUET_PROFILES).
+    parquet_profiles (dict): Writer profile of particular outputs, by
+    name, overriding parquet_profile.
+    max_workers (int): Number of build threads.
+    processes (int): Number of worker processes; 0 (the default) builds
+    in threads.
+    io_concurrency (int): Number of S3 transfers at a time; also used
+    for the objects of a table written in several parts.
+    prefetch (int): Number of ingested tables held at a time.
+    cache_dir (str): Local directory the snapshots are cached in; see
+    read_snapshot.
+    compact (bool): Whether to compact the frames read.
+    calendar_horizon_days (int): How many days ahead of today the
+    calendars are kept extended to.
+    """
+
+    parquet_compression: str | None = None
+    parquet_profile: str = "default"
+    parquet_profiles: dict = field(default_factory=dict)
+    max_workers: int = 4
+    processes: int = 0
+    io_concurrency: int = 4
+    prefetch: int = 2
+    cache_dir: str | None = None
+    compact: bool = True
+    calendar_horizon_days: int = 365
+
 
 def lambda_handler(event, context):
     try:
@@ -37,171 +139,89 @@ def lambda_handler(event, context):
 
     timestamp = datetime.now()
     timestamp_for_filename = timestamp.strftime("%Y/%m/%d/%H:%M")
-    timestamp_for_last_extracted = timestamp_for_filename.encode("utf-8")
     ingestion_bucket_name = event["Records"][0]["s3"]["bucket"]["name"]
     report_file = urllib.parse.unquote_plus(
         event["Records"][0]["s3"]["object"]["key"], encoding="utf-8"
     )
     transform_bucket_name = get_s3_bucket_name("data-squid-transform")
-
-    # These variable names are for use in creation of dim tables which require 2 dataframes in order to be created.
-    # The dataframe is stored in {tablename}_df and the {tablename}_df_exists is changed to True.
-    # The {tablename}_df_exists variables are required as dataframes themselves do not have boolean values.
-    address_df = None
-    address_df_exists = False
-    counterparty_df = None
-    counterparty_df_exists = False
-
-    department_df = None
-    department_df_exists = False
-    staff_df = None
-    staff_df_exists = False
-
-    # This variable has been created for the purposes of ensuring that the fact_sales_order table is appended to last
-    # in the transformed_tables list. This is important for how we process the relevant tables in the load_lambda function.
-    fact_sales_order_table_created = False
-    transformed_tables = []
+    config = TransformConfig(
+        # Codec overriding the profiles': "snappy", "zstd", "gzip" or "none"
+        parquet_compression=os.environ.get("PARQUET_COMPRESSION") or None,
+        # Parquet writer profile of the processed files (see PARQUET_PROFILES), for all
+        # tables and per table as "table=profile,..."
+        parquet_profile=os.environ.get("PARQUET_PROFILE", "default"),
+        parquet_profiles=parse_parquet_profiles(
+            os.environ.get("PARQUET_TABLE_PROFILES", "")
+        ),
+        # Threads reading ingested tables and building warehouse tables at the same time
+        max_workers=int(os.environ.get("TRANSFORM_WORKERS", 4)),
+        # Processes building warehouse tables (pandas holds the GIL); 0 builds in the threads
+        processes=int(os.environ.get("TRANSFORM_PROCESSES", 0)),
+        # S3 transfers at a time, and ingested tables fetched ahead of the builds using them
+        io_concurrency=int(os.environ.get("TRANSFORM_IO_CONCURRENCY", 4)),
+        prefetch=int(os.environ.get("TRANSFORM_PREFETCH", 2)),
+        # Local copies of the snapshots of INCREMENTAL_TRANSFORMS' inputs, kept while the container is warm
+        cache_dir=os.environ.get("TRANSFORM_SNAPSHOT_CACHE", "/tmp/snapshots") or None,
+        # Days ahead of today that dim_date is kept extended to
+        calendar_horizon_days=int(os.environ.get("DIM_DATE_HORIZON_DAYS", 365)),
+    )
 
     # Checks for presence of data in transform bucket, if no data present we need to create dim_date table
-    # If data is present, we do not need to create this table again as the dates will not change and are for a set period
-    if check_for_data(s3_client, transform_bucket_name) == False:
-        dim_date_tab = dim_date()
-        parquet_file = dataframe_to_parquet(dim_date_tab)
-        filename = create_filename_for_parquet("dim_date", timestamp_for_filename)
-        upload_to_s3(
-            data=parquet_file, bucket_name=transform_bucket_name, object_name=filename
-        )
-        s3_client.put_object(
-            Bucket=transform_bucket_name,
-            Key="dim_date/last_transformed.txt",
-            Body=timestamp_for_last_extracted,
-        )
-        transformed_tables.append("dim_date")
+    # If data is present, dim_date is only extended with the days it is missing (see CALENDAR_TRANSFORMS)
+    include_static = check_for_data(s3_client, transform_bucket_name) == False
 
-    tables = extract_tablenames(s3_client, ingestion_bucket_name, report_file)
-    
-
-    # Iterates through all of the tables that have recently been ingested by the ingestion lambda function
-    # and stores the converted dataframe to parquet file in the transform bucket.
-    # If two tables are required for the formation of a dim table, we assign the {table} dataframe to a variable
-    # and then call the relevant dataframe util with both relevant variable names as args.
-    for table in tables:
-        try:
-            dataframe = convert_json_to_df_from_s3(table, ingestion_bucket_name)
-        except ClientError as e:
-            logger.warning("Invalid table name")
-
-        if table == "design":
-            dim_design_tab = dim_design(dataframe)
-            parquet_file = dataframe_to_parquet(dim_design_tab)
-            filename = create_filename_for_parquet("dim_design", timestamp_for_filename)
-            upload_to_s3(
-                data=parquet_file,
-                bucket_name=transform_bucket_name,
-                object_name=filename,
-            )
-            s3_client.put_object(
-                Bucket=transform_bucket_name,
-                Key="dim_design/last_transformed.txt",
-                Body=timestamp_for_last_extracted,
-            )
-            transformed_tables.append("dim_design")
-        elif table == "address":
-            dim_location_tab = dim_location(dataframe)
-            parquet_file = dataframe_to_parquet(dim_location_tab)
-            filename = create_filename_for_parquet(
-                "dim_location", timestamp_for_filename
-            )
-            upload_to_s3(
-                data=parquet_file,
-                bucket_name=transform_bucket_name,
-                object_name=filename,
-            )
-            s3_client.put_object(
-                Bucket=transform_bucket_name,
-                Key="dim_location/last_transformed.txt",
-                Body=timestamp_for_last_extracted,
-            )
-            transformed_tables.append("dim_location")
-            address_df = dataframe
-            address_df_exists = True
-        elif table == "currency":
-            dim_currency_tab = dim_currency(dataframe)
-            parquet_file = dataframe_to_parquet(dim_currency_tab)
-            filename = create_filename_for_parquet(
-                "dim_currency", timestamp_for_filename
-            )
-            upload_to_s3(
-                data=parquet_file,
-                bucket_name=transform_bucket_name,
-                object_name=filename,
-            )
-            s3_client.put_object(
-                Bucket=transform_bucket_name,
-                Key="dim_currency/last_transformed.txt",
-                Body=timestamp_for_last_extracted,
-            )
-            transformed_tables.append("dim_currency")
-        elif table == "sales_order":
-            fact_sales_tab = fact_sales_order(dataframe)
-            parquet_file = dataframe_to_parquet(fact_sales_tab)
-            filename = create_filename_for_parquet(
-                "fact_sales_order", timestamp_for_filename
-            )
-            upload_to_s3(
-                data=parquet_file,
-                bucket_name=transform_bucket_name,
-                object_name=filename,
-            )
-            s3_client.put_object(
-                Bucket=transform_bucket_name,
-                Key="fact_sales_order/last_transformed.txt",
-                Body=timestamp_for_last_extracted,
-            )
-            fact_sales_order_table_created = True
-        elif table == "counterparty":
-            counterparty_df = dataframe
-            counterparty_df_exists = True
-        elif table == "department":
-            department_df = dataframe
-            department_df_exists = True
-        elif table == "staff":
-            staff_df = dataframe
-            staff_df_exists = True
-
-    if address_df_exists and counterparty_df_exists:
-        dim_counterparty_tab = dim_counterparty(address_df, counterparty_df)
-        parquet_file = dataframe_to_parquet(dim_counterparty_tab)
-        filename = create_filename_for_parquet(
-            "dim_counterparty", timestamp_for_filename
-        )
-        upload_to_s3(
-            data=parquet_file, bucket_name=transform_bucket_name, object_name=filename
-        )
-        s3_client.put_object(
-            Bucket=transform_bucket_name,
-            Key="dim_counterparty/last_transformed.txt",
-            Body=timestamp_for_last_extracted,
-        )
-        transformed_tables.append("dim_counterparty")
-    if department_df_exists and staff_df_exists:
-        dim_staff_tab = dim_staff(department_df, staff_df)
-        parquet_file = dataframe_to_parquet(dim_staff_tab)
-        filename = create_filename_for_parquet("dim_staff", timestamp_for_filename)
-        upload_to_s3(
-            data=parquet_file, bucket_name=transform_bucket_name, object_name=filename
-        )
-        s3_client.put_object(
-            Bucket=transform_bucket_name,
-            Key="dim_staff/last_transformed.txt",
-            Body=timestamp_for_last_extracted,
-        )
-        transformed_tables.append("dim_staff")
+    extraction_report = read_extraction_report(
+        s3_client, ingestion_bucket_name, report_file
+    )
+    tables = extraction_report["updated_tables"]
+    # Reports written before the Parquet ingestion format existed have no table_formats
+    table_formats = extraction_report.get("table_formats", {})
+    ingestion_manifest, _ = read_manifest(s3_client, ingestion_bucket_name)
+    transform_manifest, transform_etag = read_manifest(s3_client, transform_bucket_name)
 
-    if fact_sales_order_table_created:
-        transformed_tables.append("fact_sales_order")
+    # Manifest entries of the tables written by this run, and of the snapshots it updated;
+    # recorded in the transform bucket's state manifest in a single write before the
+    # report that triggers the load lambda.
+    transformed_entries, timings = run_transforms(
+        s3_client,
+        ingestion_bucket_name,
+        transform_bucket_name,
+        tables,
+        timestamp_for_filename,
+        config,
+        table_formats=table_formats,
+        manifest=ingestion_manifest,
+        include_static=include_static,
+        transform_manifest=transform_manifest,
+        today=timestamp.date(),
+    )
+    transformed_tables = [table for table in transformed_entries if table in TRANSFORMS]
 
-   
+    snapshot_tables = [
+        table for table in transformed_entries if table not in TRANSFORMS
+    ]
+    if snapshot_tables:
+        # the snapshots were merged into the versions this run read: if another run
+        # has committed newer ones since, fail (to be retried) rather than drop its rows
+        update_manifest(
+            s3_client,
+            transform_bucket_name,
+            transformed_entries,
+            manifest=transform_manifest,
+            etag=transform_etag,
+            attempts=1,
+        )
+        # the snapshots the new entries replaced are no longer referenced; failing
+        # to delete one only leaves an orphan, so it must not fail the run
+        for table in snapshot_tables:
+            previous = transform_manifest["tables"].get(table, {}).get("keys", [])
+            for key in set(previous) - set(transformed_entries[table]["keys"]):
+                try:
+                    s3_client.delete_object(Bucket=transform_bucket_name, Key=key)
+                except ClientError as e:
+                    logger.warning(f"Could not delete snapshot {key}: {e}")
+    elif transformed_entries:
+        update_manifest(s3_client, transform_bucket_name, transformed_entries)
 
     # If transformed_tables list has been appended to, then we will create a report documenting the tables that have been transformed.
     # Else, we will return and log an error message that this lambda has been triggered erroneously.
@@ -210,6 +230,7 @@ def lambda_handler(event, context):
         report = {
             "status": "Success",
             "transformed_tables": transformed_tables,
+            "timings": timings,
         }
         report_file_name = f"reports/{datetime.now().isoformat()}_success.json"
 
@@ -236,14 +257,778 @@ def lambda_handler(event, context):
         return "Lambda was called without valid tables. Extraction report should not have been created"
 
 
+def plan_transforms(
+    tables,
+    include_static=False,
+    transforms=TRANSFORMS,
+    incremental=INCREMENTAL_TRANSFORMS,
+    extended=(),
+):
+    """
+    Works out which entries of transforms a run builds and what each of
+    them waits for.
+
+    An output is built when all of its inputs are available in this run:
+    ingested tables that were updated, or outputs built by the same run.
+    An output of incremental is built when any one of its inputs was
+    updated, from the snapshots of all of them. An output that was itself
+    ingested (a dimension joined in the source database by the
+    extraction's pushdown mode) is written as it is.
+
+    Parameters:
+    tables (list): The ingested tables the extraction updated.
+    include_static (bool, optional): Also build the outputs with no
+    inputs.
+    transforms (dict, optional): The registry; see TRANSFORMS.
+    incremental (dict, optional): The outputs built from snapshots; see
+    INCREMENTAL_TRANSFORMS.
+    extended (iterable, optional): Outputs with no inputs to build even
+    without include_static: the calendars to extend.
+
+    Returns:
+    dict: A graphlib graph mapping each node to the set of nodes it
+    depends on. Nodes are ("read", table) for the ingested tables to
+    read, ("snapshot", table) for the snapshots to bring up to date with
+    them (or just load) and ("build", output) for the outputs to build.
+    """
+    dependencies = {
+        output: [table for table in inputs if table in transforms]
+        for output, (inputs, _) in transforms.items()
+    }
+    graph = {}
+    for output in TopologicalSorter(dependencies).static_order():
+        inputs, _ = transforms[output]
+        if output in tables:
+            graph[("read", output)] = set()
+            graph[("build", output)] = {("read", output)}
+            continue
+        if output in incremental:
+            if any(table in tables for table in inputs):
+                for table in inputs:
+                    graph.setdefault(("snapshot", table), set())
+                    if table in tables:
+                        graph.setdefault(("read", table), set())
+                        graph[("snapshot", table)].add(("read", table))
+                graph[("build", output)] = {("snapshot", table) for table in inputs}
+            continue
+        if not inputs and not include_static and output not in extended:
+            continue
+        nodes = {
+            ("build", table) if table in transforms else ("read", table)
+            for table in inputs
+        }
+        # outputs come in dependency order, so the outputs used here are planned already
+        if all(
+            node in graph if node[0] == "build" else node[1] in tables for node in nodes
+        ):
+            for node in nodes:
+                graph.setdefault(node, set())
+            graph[("build", output)] = nodes
+    return graph
+
+
+def run_transforms(
+    s3_client,
+    ingestion_bucket_name,
+    transform_bucket_name,
+    tables,
+    timestamp_for_filename,
+    config=None,
+    table_formats=None,
+    manifest=None,
+    include_static=False,
+    transform_manifest=None,
+    today=None,
+    transforms=TRANSFORMS,
+    incremental=INCREMENTAL_TRANSFORMS,
+    calendars=CALENDAR_TRANSFORMS,
+):
+    """
+    Builds the warehouse tables that the updated ingested tables call
+    for and uploads each of them to the transform bucket as Parquet.
+
+    The nodes planned by plan_transforms run as soon as the nodes they
+    depend on have finished: builds on a pool of config.max_workers
+    threads, S3 reads and uploads on a separate pool of
+    config.io_concurrency threads,
+    so network waits overlap with the builds. Ingested tables are
+    fetched ahead of the builds that use them, in the order those builds
+    come in transforms, but at most prefetch of them are held (fetched or
+    being fetched, and still needed) at a time; each one is released
+    once every build using it is done. The bound is only exceeded when
+    nothing else is running, so that a build waiting for more inputs than
+    prefetch allows still gets them. An output is uploaded in the
+    background while the builds depending on it go ahead. Every ingested
+    table is read once, however many outputs use it. A table that cannot
+    be read is logged and the outputs built from it are skipped.
+
+    The outputs of incremental are built from snapshots of their inputs
+    (see build_incremental). Each snapshot is loaded from the transform
+    bucket (or cache_dir), merged with the table's update if it has one,
+    and the merged snapshot written back in the background. A table with
+    no snapshot yet is seeded from all of its batches in the ingestion
+    bucket, and all of its rows count as changed.
+
+    With processes set, the builds, which are CPU-bound pandas work
+    holding the GIL, run on that many worker processes instead (see
+    transform_worker). Each worker reads the ingested tables its output
+    needs itself and sends back only the Parquet bytes, so no DataFrame
+    is pickled; outputs built from other outputs get those as Parquet
+    bytes too. A table used by two outputs is then read by both.
+    Incremental builds, which only handle the rows affected by a change,
+    stay in the threads, and so do the reads of their snapshots' updates.
+
+    When transform_manifest is given and the run builds other outputs,
+    the outputs of calendars are built, with only the days they are
+    missing, if the last day they cover (the calendar_end of their entry
+    in transform_manifest) is less than calendar_horizon_days after
+    today; see calendar_extension. With include_static they are built
+    whole, up to that horizon.
+
+    With compact set, the ingested tables and snapshots are compacted
+    (see compact_dataframe) as they are read, so the frames held ahead
+    of and during the builds take less memory. The memory each table's
+    frame takes is returned with the timings, with the peak RSS of this
+    process (and of the largest worker process) since it started, which
+    is logged once. A run with one build thread, one S3 transfer at a
+    time and no processes also takes the peak RSS of each read, snapshot
+    and build on its own: they are run one at a time, and the process's
+    high-water mark is reset before each (see reset_peak_rss). Uploads
+    of earlier outputs may still overlap them.
+
+    Parameters:
+    s3_client (boto3.client): S3 client shared by all the threads.
+    ingestion_bucket_name (str): The bucket the tables are read from.
+    transform_bucket_name (str): The bucket the outputs are written to.
+    tables (list): The ingested tables the extraction updated.
+    timestamp_for_filename (str): Timestamp used in the object keys.
+    config (TransformConfig, optional): The run's settings; see
+    TransformConfig for those named here.
+    table_formats (dict, optional): The format each ingested table was
+    written in, from the extraction report.
+    manifest (dict, optional): The ingestion bucket's state manifest.
+    include_static (bool, optional): See plan_transforms.
+    transform_manifest (dict, optional): The transform bucket's state
+    manifest, which records the snapshots.
+    today (date, optional): The day the horizon counts from; the current
+    date by default.
+    calendars (dict, optional): See CALENDAR_TRANSFORMS.
+    transforms (dict, optional): The registry; see TRANSFORMS.
+    incremental (dict, optional): See INCREMENTAL_TRANSFORMS.
+
+    Returns:
+    tuple: The manifest entries of the outputs written, in transforms
+    order, followed by those of the snapshots written, and the seconds
+    each node took, as {"read": {table: seconds}, "snapshot": {table:
+    seconds}, "build": {output: seconds}, "upload": {name: seconds},
+    "memory": {"read": {table: MiB}, "snapshot": {table: MiB},
+    "peak_rss": MiB}}, in plan and transforms order. With processes, a
+    table read by several workers gets the longest read and the largest
+    frame, and "memory" also has "worker_peak_rss": the peak RSS of the
+    largest worker, which includes what it shared with this process when
+    forked. A run measuring each node on its own also has
+    "table_peak_rss": {"read": {table: MiB}, "snapshot": {table: MiB},
+    "build": {output: MiB}}.
+    """
+    config = config or TransformConfig()
+    graph = plan_transforms(tables, include_static, transforms, incremental)
+    horizon = (today or date.today()) + timedelta(days=config.calendar_horizon_days)
+    # the days already written are only known from the manifest, and only runs
+    # building something else extend the calendars
+    extend = transform_manifest is not None and any(
+        node[0] == "build" for node in graph
+    )
+    calendar_ranges = {}
+    for output, (first_day, legacy_end) in calendars.items():
+        if output not in transforms or not (include_static or extend):
+            continue
+        entry = (transform_manifest or {}).get("tables", {}).get(output)
+        days = calendar_extension(first_day, legacy_end, entry, include_static, horizon)
+        if days is not None:
+            calendar_ranges[output] = days
+    if calendar_ranges:
+        graph = plan_transforms(
+            tables, include_static, transforms, incremental, calendar_ranges
+        )
+    sorter = TopologicalSorter(graph)
+    sorter.prepare()
+    # how many builds still need each node's frame
+    consumers = {node: 0 for node in graph}
+    for dependencies in graph.values():
+        for dependency in dependencies:
+            consumers[dependency] += 1
+    # the order the reads are wanted in: by the first build using them
+    read_order = {}
+    for output in transforms:
+        for dependency in sorted(graph.get(("build", output), ())):
+            if dependency[0] == "snapshot":
+                for read in graph[dependency]:
+                    read_order.setdefault(read, len(read_order))
+            elif dependency[0] == "read":
+                read_order.setdefault(dependency, len(read_order))
+    # reads made here even with processes, for the snapshots
+    parent_reads = {
+        dependency
+        for node, dependencies in graph.items()
+        if node[0] == "snapshot"
+        for dependency in dependencies
+    }
+    frames, entries, snapshot_entries = {}, {}, {}
+    timings = {"read": {}, "snapshot": {}, "build": {}, "upload": {}}
+    memory = {"read": {}, "snapshot": {}}
+
+    def read_table(table, client):
+        try:
+            df = convert_json_to_df_from_s3(
+                table,
+                ingestion_bucket_name,
+                file_format=(table_formats or {}).get(table, "json"),
+                manifest=manifest,
+                s3_client=client,
+                max_concurrency=config.io_concurrency,
+            )
+        except ClientError as e:
+            logger.warning(f"Could not read ingested table {table}: {e}")
+            return None
+        return compact_dataframe(df) if config.compact else df
+
+    def read_node(table):
+        start = time.perf_counter()
+        return read_table(table, s3_client), time.perf_counter() - start
+
+    def snapshot_node(table):
+        start = time.perf_counter()
+        key = primary_key(table)
+        delta = frames.get(("read", table))
+        entry = (transform_manifest or {}).get("tables", {}).get(table)
+        if table in tables and delta is None:
+            return None, None, time.perf_counter() - start
+        try:
+            if entry:
+                stored = read_snapshot(
+                    s3_client,
+                    transform_bucket_name,
+                    entry["keys"][0],
+                    config.cache_dir,
+                )
+            else:
+                stored = read_ingested_history(
+                    s3_client, ingestion_bucket_name, table, config.io_concurrency
+                )
+        except ClientError as e:
+            logger.warning(f"Could not read the snapshot of {table}: {e}")
+            return None, None, time.perf_counter() - start
+        if stored is None and delta is None:
+            return None, None, time.perf_counter() - start
+        snapshot = merge_snapshot(stored, delta, key)
+        if config.compact:
+            snapshot = compact_dataframe(snapshot)
+        if not entry:
+            changed = snapshot[key]
+        elif delta is not None:
+            changed = delta[key]
+        else:
+            changed = snapshot[key].iloc[:0]
+        # written back when it changed or was just seeded
+        store = snapshot if delta is not None or not entry else None
+        return (snapshot, changed), store, time.perf_counter() - start
+
+    def write_parquet(frame, name):
+        profile = config.parquet_profiles.get(name, config.parquet_profile)
+        return dataframe_to_parquet(frame, config.parquet_compression, name, profile)
+
+    def store_node(table, snapshot):
+        start = time.perf_counter()
+        entry = write_snapshot(
+            s3_client,
+            transform_bucket_name,
+            table,
+            snapshot,
+            timestamp_for_filename,
+            config.parquet_compression,
+            config.cache_dir,
+        )
+        return entry, time.perf_counter() - start
+
+    def build_node(node):
+        start = time.perf_counter()
+        name = node[1]
+        passthrough = ("read", name) in graph[node]
+        from_snapshots = any(dependency[0] == "snapshot" for dependency in graph[node])
+        parquet_file, row_count, read_seconds, read_memory = None, 0, {}, {}
+        if workers and not from_snapshots and name not in calendar_ranges:
+            derived = {
+                dependency[1]: frames[dependency]
+                for dependency in graph[node]
+                if dependency[0] == "build"
+            }
+            reads = [
+                dependency[1] for dependency in graph[node] if dependency[0] == "read"
+            ]
+            parquet_file, row_count, read_seconds, read_memory = run_in_worker(
+                idle_workers, (name, reads, derived, passthrough)
+            )
+            # outputs built from this one get it as Parquet bytes
+            frame = parquet_file
+        else:
+            inputs = {dependency[1]: frames[dependency] for dependency in graph[node]}
+            if from_snapshots:
+                frame = build_incremental(name, inputs, incremental, transforms)
+            elif name in calendar_ranges:
+                frame = transforms[name][1](*calendar_ranges[name])
+            else:
+                frame = build_output(name, inputs, passthrough, transforms)
+            if frame is not None:
+                parquet_file = write_parquet(frame, name)
+                row_count = len(frame)
+        if frame is None:
+            logger.warning(f"Skipping {name}: one of its inputs could not be read")
+        return (
+            frame,
+            parquet_file,
+            row_count,
+            (read_seconds, read_memory),
+            time.perf_counter() - start,
+        )
+
+    def upload_node(name, parquet_file, row_count):
+        start = time.perf_counter()
+        filename = create_filename_for_parquet(name, timestamp_for_filename)
+        upload_to_s3(
+            data=parquet_file,
+            bucket_name=transform_bucket_name,
+            object_name=filename,
+            s3_client=s3_client,
+        )
+        entry = manifest_entry(
+            [filename],
+            row_count,
+            hashlib.sha256(parquet_file).hexdigest(),
+            timestamp_for_filename,
+            "parquet",
+            calendar_end=(
+                calendar_ranges[name][1].isoformat()
+                if name in calendar_ranges
+                else None
+            ),
+        )
+        return entry, time.perf_counter() - start
+
+    # the workers are forked before any thread of the pools below is started
+    builds = sum(1 for kind, _ in graph if kind == "build")
+    workers = start_transform_workers(
+        min(config.processes, builds),
+        read_table,
+        write_parquet,
+        transforms,
+    )
+    idle_workers = queue.Queue()
+    for _, pipe in workers:
+        idle_workers.put(pipe)
+    held = 0
+
+    # the high-water mark can only be split between nodes that run one at a time
+    process_peak = peak_rss_mib()
+    serial = not workers and config.max_workers == 1 and config.io_concurrency == 1
+    measure = serial and reset_peak_rss()
+    table_peaks = {"read": {}, "snapshot": {}, "build": {}}
+    measuring = threading.Lock()
+
+    def measured(kind, name, function, *args):
+        nonlocal process_peak
+        if not measure:
+            return function(*args)
+        with measuring:
+            # keep what ran since the last reset in the process's peak
+            process_peak = max(process_peak, peak_rss_mib())
+            reset_peak_rss()
+            try:
+                return function(*args)
+            finally:
+                table_peaks[kind][name] = peak_rss_mib()
+
+    def release(node):
+        # frees the frames no remaining node needs
+        nonlocal held
+        for dependency in graph[node]:
+            consumers[dependency] -= 1
+            if not consumers[dependency]:
+                del frames[dependency]
+                if dependency[0] == "read" and (
+                    not workers or dependency in parent_reads
+                ):
+                    held -= 1
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=len(workers) or config.max_workers
+        ) as build_pool, ThreadPoolExecutor(
+            max_workers=config.io_concurrency
+        ) as io_pool:
+            running = {}
+            wanted_reads = []
+            while sorter.is_active() or running:
+                for node in sorter.get_ready():
+                    if node[0] == "build":
+                        future = build_pool.submit(
+                            measured, "build", node[1], build_node, node
+                        )
+                        running[future] = node
+                    elif node[0] == "snapshot":
+                        future = io_pool.submit(
+                            measured, "snapshot", node[1], snapshot_node, node[1]
+                        )
+                        running[future] = node
+                    elif workers and node not in parent_reads:
+                        # with processes the workers read their own inputs
+                        frames[node] = None
+                        sorter.done(node)
+                    else:
+                        wanted_reads.append(node)
+                wanted_reads.sort(key=read_order.get)
+                while wanted_reads and (held < config.prefetch or not running):
+                    node = wanted_reads.pop(0)
+                    held += 1
+                    future = io_pool.submit(
+                        measured, "read", node[1], read_node, node[1]
+                    )
+                    running[future] = node
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    kind, name = node
+                    if kind == "read":
+                        frames[node], elapsed = future.result()
+                        timings["read"][name] = round(elapsed, 3)
+                        if frames[node] is not None:
+                            memory["read"][name] = frame_memory_mib(frames[node])
+                        sorter.done(node)
+                    elif kind == "snapshot":
+                        snapshot, store, elapsed = future.result()
+                        timings["snapshot"][name] = round(elapsed, 3)
+                        frames[node] = snapshot
+                        if snapshot is not None:
+                            memory["snapshot"][name] = frame_memory_mib(snapshot[0])
+                        release(node)
+                        if store is not None:
+                            running[io_pool.submit(store_node, name, store)] = (
+                                "store",
+                                name,
+                            )
+                        sorter.done(node)
+                    elif kind == "build":
+                        frame, parquet_file, row_count, usage, elapsed = future.result()
+                        read_seconds, read_memory = usage
+                        timings["build"][name] = round(elapsed, 3)
+                        for table, seconds in read_seconds.items():
+                            timings["read"][table] = max(
+                                timings["read"].get(table, 0), round(seconds, 3)
+                            )
+                        for table, mib in read_memory.items():
+                            memory["read"][table] = max(
+                                memory["read"].get(table, 0), mib
+                            )
+                        if consumers[node]:
+                            frames[node] = frame
+                        release(node)
+                        if parquet_file is not None:
+                            upload = io_pool.submit(
+                                upload_node, name, parquet_file, row_count
+                            )
+                            running[upload] = ("upload", name)
+                        sorter.done(node)
+                    elif kind == "store":
+                        snapshot_entries[name], elapsed = future.result()
+                        timings["upload"][name] = round(elapsed, 3)
+                    else:
+                        entries[name], elapsed = future.result()
+                        timings["upload"][name] = round(elapsed, 3)
+    finally:
+        stop_transform_workers(workers)
+
+    # ru_maxrss covers the whole process; in a measured run it was reset
+    # before every node, so the process's peak is the largest seen
+    peak_rss = {
+        "peak_rss": max(
+            [process_peak, peak_rss_mib()]
+            + [mib for peaks in table_peaks.values() for mib in peaks.values()]
+        )
+    }
+    if workers:
+        peak_rss["worker_peak_rss"] = peak_rss_mib(children=True)
+    if measure:
+        peak_rss["table_peak_rss"] = table_peaks
+    logger.info(f"Transform peak RSS (MiB): {peak_rss}")
+
+    read_tables = [name for kind, name in graph if kind == "read"]
+    snapshot_tables = [name for kind, name in graph if kind == "snapshot"]
+    names = [output for output in transforms if output in entries]
+    names += [table for table in snapshot_tables if table in snapshot_entries]
+    return {name: entries.get(name) or snapshot_entries[name] for name in names}, {
+        "read": {
+            table: timings["read"][table]
+            for table in read_tables
+            if table in timings["read"]
+        },
+        "snapshot": {
+            table: timings["snapshot"][table]
+            for table in snapshot_tables
+            if table in timings["snapshot"]
+        },
+        "build": {
+            output: timings["build"][output]
+            for output in transforms
+            if output in timings["build"]
+        },
+        "upload": {
+            name: timings["upload"][name] for name in names if name in timings["upload"]
+        },
+        "memory": {
+            "read": {
+                table: memory["read"][table]
+                for table in read_tables
+                if table in memory["read"]
+            },
+            "snapshot": {
+                table: memory["snapshot"][table]
+                for table in snapshot_tables
+                if table in memory["snapshot"]
+            },
+            **peak_rss,
+        },
+    }
+
+
+def peak_rss_mib(children=False):
+    """
+    Returns the peak resident set size of this process so far, in MiB.
+
+    Parameters:
+    children (bool, optional): Return that of its largest child process
+    that has been waited for instead.
+    """
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    # Linux reports ru_maxrss in KiB
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of this process (Linux's VmHWM, which ru_maxrss
+    reports) to its current RSS, so that peak_rss_mib measures from now.
+
+    Returns:
+    bool: False where it cannot be reset (no /proc/self/clear_refs).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def calendar_extension(first_day, legacy_end, entry, rebuild, horizon):
+    """
+    Works out which days an output of CALENDAR_TRANSFORMS must be built
+    with to cover every day up to horizon.
+
+    Parameters:
+    first_day (str): The first day the calendar covers.
+    legacy_end (str): The last day covered by versions that recorded no
+    calendar_end.
+    entry (dict): The output's entry in the transform manifest, or None.
+    rebuild (bool): Build the whole calendar, into an empty bucket.
+    horizon (date): The last day to cover.
+
+    Returns:
+    tuple: The first and last day to build, as dates, or None when the
+    calendar already reaches horizon.
+    """
+    if rebuild:
+        start = date.fromisoformat(first_day)
+    else:
+        end = (entry or {}).get("calendar_end") or legacy_end
+        start = date.fromisoformat(end) + timedelta(days=1)
+    if start > horizon:
+        return None
+    return start, horizon
+
+
+def build_output(name, frames, passthrough, transforms=TRANSFORMS):
+    """
+    Builds one output of transforms from the DataFrames of its inputs
+    (frames, by table name), or returns the ingested table of the same
+    name when passthrough is set. Returns None if an input is missing.
+    """
+    if passthrough:
+        return frames[name]
+    inputs, function = transforms[name]
+    args = [frames[table] for table in inputs]
+    if any(arg is None for arg in args):
+        return None
+    return function(*args)
+
+
+def build_incremental(
+    name, snapshots, incremental=INCREMENTAL_TRANSFORMS, transforms=TRANSFORMS
+):
+    """
+    Builds the rows of an output of incremental that the changes to its
+    inputs affect, from (snapshot, changed primary keys) of each input
+    (snapshots, by table name). Returns None if a snapshot is missing.
+
+    The rows affected are those of the input the output has one row per
+    whose key changed or that reference a changed row of another input.
+    The other inputs are cut down to the rows those reference before the
+    output's function joins them.
+    """
+    if any(snapshot is None for snapshot in snapshots.values()):
+        return None
+    driving, references = incremental[name]
+    inputs, function = transforms[name]
+    df, changed = snapshots[driving]
+    affected = df[primary_key(driving)].isin(changed)
+    for table, column in references.items():
+        affected |= df[column].isin(snapshots[table][1])
+    df = df[affected]
+    args = []
+    for table in inputs:
+        if table == driving:
+            args.append(df)
+        else:
+            referenced, _ = snapshots[table]
+            args.append(
+                referenced[referenced[primary_key(table)].isin(df[references[table]])]
+            )
+    return function(*args)
+
+
+def start_transform_workers(processes, read_table, write_parquet, transforms):
+    """
+    Forks the worker processes of run_transforms, each running
+    transform_worker on its own end of a pipe.
+
+    Processes and pipes are used as in the extraction lambda, because
+    Lambda has no /dev/shm for multiprocessing.Pool. The workers are
+    forked, so they inherit the registry, read_table and write_parquet
+    without pickling them.
+
+    Returns:
+    list: (process, pipe) for every worker.
+    """
+    mp_context = multiprocessing.get_context("fork")
+    workers = []
+    for _ in range(processes):
+        parent_pipe, child_pipe = mp_context.Pipe()
+        process = mp_context.Process(
+            target=transform_worker,
+            args=(child_pipe, read_table, write_parquet, transforms),
+        )
+        process.start()
+        child_pipe.close()
+        workers.append((process, parent_pipe))
+    return workers
+
+
+def stop_transform_workers(workers):
+    """Tells the workers to exit and waits for them, terminating any that hang."""
+    for process, pipe in workers:
+        try:
+            pipe.send(None)
+        except OSError:
+            pass
+        pipe.close()
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+def run_in_worker(idle_workers, task):
+    """
+    Sends a task to the next idle worker, waits for its result and hands
+    the worker back.
+
+    Returns:
+    tuple: The output's Parquet bytes (None if an input could not be
+    read), its row count, the seconds each of its reads took and the MiB
+    each of the frames read takes.
+    """
+    pipe = idle_workers.get()
+    try:
+        pipe.send(task)
+        try:
+            status, value = pipe.recv()
+            if status == "parquet":
+                value = (pipe.recv_bytes(), *value)
+        except EOFError:
+            raise RuntimeError("Transform worker exited unexpectedly")
+    finally:
+        idle_workers.put(pipe)
+    if status == "error":
+        raise RuntimeError(f"Transform of {task[0]} failed: {value}")
+    return value
+
+
+def transform_worker(pipe, read_table, write_parquet, transforms):
+    """
+    Worker process loop for run_transforms.
+
+    Receives (output, tables to read, {output: Parquet bytes} of the
+    outputs it is built from, passthrough) over pipe until it gets None,
+    builds the output with build_output and sends back
+    ("ok", (None, 0, {table: read seconds}, {table: frame MiB})) when an
+    input could not be read, ("error", message) when the build failed, or
+    ("parquet", (row count, {table: read seconds}, {table: frame MiB}))
+    followed by the Parquet file as a message of its own, sent straight
+    from the writer's buffer with send_bytes.
+    """
+    try:
+        s3_client = boto3.client("s3")
+        for name, reads, derived, passthrough in iter(pipe.recv, None):
+            try:
+                frames, read_seconds, read_memory = {}, {}, {}
+                for table in reads:
+                    start = time.perf_counter()
+                    frames[table] = read_table(table, s3_client)
+                    read_seconds[table] = time.perf_counter() - start
+                    if frames[table] is not None:
+                        read_memory[table] = frame_memory_mib(frames[table])
+                for table, parquet_file in derived.items():
+                    frames[table] = pd.read_parquet(io.BytesIO(parquet_file))
+                frame = build_output(name, frames, passthrough, transforms)
+                if frame is None:
+                    pipe.send(("ok", (None, 0, read_seconds, read_memory)))
+                    continue
+                parquet_file = write_parquet(frame, name)
+                pipe.send(("parquet", (len(frame), read_seconds, read_memory)))
+                pipe.send_bytes(parquet_file)
+            except Exception as e:
+                pipe.send(("error", repr(e)))
+    finally:
+        pipe.close()
+
+
+def read_extraction_report(s3_client, bucket_name, report_file):
+    """
+    Retrieves the most recent report file from the ingest s3 bucket and returns its JSON body as a dict.
+    The lambda handler reads the updated tables ("updated_tables") and the format each of them was
+    written in ("table_formats") from it.
+    """
+    report_file_obj = s3_client.get_object(Bucket=bucket_name, Key=report_file)
+    report_file_str = report_file_obj["Body"].read().decode("utf-8")
+    return json.loads(report_file_str)
+
+
 def extract_tablenames(s3_client, bucket_name, report_file):
-    '''
+    """
     Retrieves the most recent report file from the ingest s3 bucket that contains a JSON formatted
     body. Returns the tablenames in a list stored on the key of "updated_tables", which the lambda handler uses
     to iterate through and perform relevant processing on each tablename stored in the list.
-    '''
-    report_file_obj = s3_client.get_object(Bucket=bucket_name, Key=report_file)
-    report_file_str = report_file_obj["Body"].read().decode("utf-8")
-    report_file = json.loads(report_file_str)
+    """
+    report_file = read_extraction_report(s3_client, bucket_name, report_file)
     tables = report_file["updated_tables"]
     return tables
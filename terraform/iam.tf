@@ -28,6 +28,8 @@ data "aws_iam_policy_document" "read_write_s3" {
       "s3:Get*",
       "s3:List*",
       "s3:Put*",
+      # superseded row-hash indexes and snapshots are deleted once replaced
+      "s3:DeleteObject",
       "s3-object-lambda:Get*",
       "s3-object-lambda:List*",
       "s3-object-lambda:Put*"
@@ -23,6 +23,16 @@ resource "aws_lambda_function" "extract_lambda" {
     environment {
     variables = {
       BUCKET_INGEST = aws_s3_bucket.ingest_bucket.bucket
+      EXTRACTION_BATCH_SIZE = var.extraction_batch_size
+      EXTRACTION_WORKERS = var.extraction_workers
+      INGESTION_FORMAT = var.ingestion_format
+      EXTRACTION_OVERLAP_SECONDS = var.extraction_overlap_seconds
+      EXTRACTION_CHUNK_SIZE = var.extraction_chunk_size
+      INGESTION_COMPRESSION = var.ingestion_compression
+      EXTRACTION_COLUMNS = var.extraction_columns
+      EXTRACTION_TIME_RESERVE_SECONDS = var.extraction_time_reserve_seconds
+      EXTRACTION_PUSHDOWN = var.extraction_pushdown
+      EXTRACTION_SUPPRESS_UNCHANGED = var.extraction_suppress_unchanged
     }
   }
 }
@@ -53,6 +63,15 @@ resource "aws_lambda_function" "transform_lambda" {
       variables = {
         BUCKET_TRANSFORM = aws_s3_bucket.transform_bucket.bucket
         BUCKET_INGEST = aws_s3_bucket.ingest_bucket.bucket
+        PARQUET_PROFILE = var.parquet_profile
+        PARQUET_TABLE_PROFILES = var.parquet_table_profiles
+        PARQUET_COMPRESSION = var.parquet_compression
+        TRANSFORM_WORKERS = var.transform_workers
+        TRANSFORM_PROCESSES = var.transform_processes
+        TRANSFORM_IO_CONCURRENCY = var.transform_io_concurrency
+        TRANSFORM_PREFETCH = var.transform_prefetch
+        TRANSFORM_SNAPSHOT_CACHE = var.transform_snapshot_cache
+        DIM_DATE_HORIZON_DAYS = var.dim_date_horizon_days
       }
     }
 }
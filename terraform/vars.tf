@@ -35,3 +35,126 @@ variable "transform_zip_filename" {
     # Manual workaround etag/source_hash error to force uploads to S3:
     default = "transform.zip"
 }
+
+variable "extraction_batch_size" {
+    type = string
+    # Rows fetched per server-side cursor batch; "0" extracts each table in one query
+    default = "50000"
+}
+
+variable "extraction_workers" {
+    type = string
+    # Worker processes for snapshot-parallel extraction; 1 extracts serially.
+    # Left at 1 until more workers are measured on Lambda. On one local CPU
+    # (benchmarks/bench_parallel_extraction.py, 100000 rows a table) 2 workers
+    # ran at 0.87x and 4 at 0.73x of serial
+    default = "1"
+}
+
+variable "ingestion_format" {
+    type = string
+    # "json" or "parquet"; the extraction report records the format of every table
+    default = "json"
+}
+
+variable "extraction_overlap_seconds" {
+    type = string
+    # Seconds before each table's watermark that are read again to catch late commits
+    default = "60"
+}
+
+variable "extraction_chunk_size" {
+    type = string
+    # Rows per part object when a table is first extracted; "0" reads it in one query
+    default = "100000"
+}
+
+variable "ingestion_compression" {
+    type = string
+    # "none", "gzip" or "zstd"; JSON objects record it as their Content-Encoding
+    default = "zstd"
+}
+
+variable "extraction_columns" {
+    type = string
+    # "transform" extracts only the columns the transforms use; "all" extracts every column
+    default = "transform"
+}
+
+variable "extraction_time_reserve_seconds" {
+    type = number
+    # The extraction stops starting tables and batches this long before the
+    # lambda timeout and leaves the rest to the next scheduled run
+    default = 60
+}
+
+variable "extraction_pushdown" {
+    type = string
+    # "true" builds dim_staff and dim_counterparty with joins in the source database
+    # instead of extracting staff, department and counterparty for the transform
+    default = "false"
+}
+
+variable "parquet_profile" {
+    type = string
+    # Parquet writer profile of the transform bucket's files: "default",
+    # "fast-write", "small-object" or "query-friendly" (see PARQUET_PROFILES)
+    default = "small-object"
+}
+
+variable "parquet_table_profiles" {
+    type = string
+    # writer profiles of particular tables, as "table=profile,..."
+    default = "fact_sales_order=query-friendly"
+}
+
+variable "parquet_compression" {
+    type = string
+    # Parquet codec overriding the profiles': "snappy", "zstd", "gzip" or "none";
+    # "" keeps each profile's own
+    default = ""
+}
+
+variable "extraction_suppress_unchanged" {
+    type = string
+    # "true" keeps a per-table index of row content hashes in the ingest bucket and
+    # drops rows whose last_updated moved without any other column changing
+    default = "false"
+}
+
+variable "transform_workers" {
+    type = number
+    # threads reading ingested tables and building warehouse tables at the same time
+    default = 4
+}
+
+variable "transform_processes" {
+    type = number
+    # worker processes building warehouse tables, to use the second vCPU of the
+    # transform lambda; 0 builds them in its threads
+    default = 0
+}
+
+variable "transform_io_concurrency" {
+    type = number
+    # S3 downloads and uploads the transform lambda runs at a time
+    default = 4
+}
+
+variable "transform_prefetch" {
+    type = number
+    # ingested tables the transform lambda holds in memory ahead of the builds using them
+    default = 2
+}
+
+variable "transform_snapshot_cache" {
+    type = string
+    # where a warm transform lambda keeps the dimension source snapshots; "" turns it off
+    default = "/tmp/snapshots"
+}
+
+variable "dim_date_horizon_days" {
+    type = number
+    # days ahead of today that the transform lambda keeps dim_date extended to
+    default = 365
+}
@@ -1,23 +1,74 @@
 from utils.lambda_utils import (
     collect_credentials_from_AWS,
+    get_credentials,
+    clear_credentials_cache,
+    connection_is_alive,
+    convert_json_to_df_from_s3,
+    compress_data,
+    compress_chunks,
+    open_s3_object,
     connection_to_database,
     check_for_data,
     upload_to_s3,
     create_filename,
     format_data_to_json,
+    format_data_to_parquet,
+    encode_rows_to_json,
     get_s3_bucket_name,
+    stream_query_batches,
+    upload_stream_to_s3,
+    stream_table_to_s3,
+    probe_table_changes,
+    start_read_transaction,
+    read_manifest,
+    write_manifest,
+    update_manifest,
+    manifest_entry,
+    WatermarkTracker,
+    read_wire_text,
+    TimeBudget,
+    RowHashIndex,
+    read_row_hash_index,
+    write_row_hash_index,
+    row_hash_segments,
+    ROW_HASH_MAX_DELTAS,
+    MIN_MULTIPART_PART_SIZE,
+    MANIFEST_KEY,
 )
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 import unittest
 from moto import mock_aws
 from botocore.exceptions import ClientError, NoCredentialsError
 from decimal import Decimal
-from src.extraction_lambda.main import extract_data, lambda_handler
+from src.extraction_lambda.main import (
+    ExtractionConfig,
+    extract_data,
+    extract_tables_in_parallel,
+    lambda_handler,
+    get_connection,
+    close_connection,
+    select_list,
+    run_query,
+    TABLE_NAMES,
+    PUSHDOWN_DIMENSIONS,
+    PUSHDOWN_ONLY_TABLES,
+    TABLE_PRIMARY_KEYS,
+)
 import boto3
+import cramjam
+import gc
+import gzip
+import hashlib
 import pytest
+import re
 import os
+import time
+import pg8000
+import io
 import json
+import pandas as pd
 
 
 @pytest.fixture(scope="function", autouse=False)
@@ -43,178 +94,1722 @@ class TestCollectCredentialsFromAWS:
 
             response = collect_credentials_from_AWS(sm_client, secret_id="Test_Name")
 
-            assert response["user_id"] == "test_user"
-            assert response["password"] == "test_password"
+            assert response["user_id"] == "test_user"
+            assert response["password"] == "test_password"
+
+
+class TestGetCredentials:
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):
+        clear_credentials_cache()
+        yield
+        clear_credentials_cache()
+
+    @mock_aws
+    def test_secret_is_fetched_once_within_ttl(self):
+        sm_client = boto3.client("secretsmanager")
+        sm_client.create_secret(
+            Name="totesys", SecretString=json.dumps({"username": "first"})
+        )
+
+        with patch(
+            "utils.common.collect_credentials_from_AWS",
+            wraps=collect_credentials_from_AWS,
+        ) as mock_collect:
+            assert get_credentials("totesys")["username"] == "first"
+            sm_client.put_secret_value(
+                SecretId="totesys", SecretString=json.dumps({"username": "second"})
+            )
+            assert get_credentials("totesys")["username"] == "first"
+
+        assert mock_collect.call_count == 1
+
+    @mock_aws
+    def test_secret_is_refetched_after_ttl(self):
+        sm_client = boto3.client("secretsmanager")
+        sm_client.create_secret(
+            Name="totesys", SecretString=json.dumps({"username": "first"})
+        )
+
+        get_credentials("totesys")
+        sm_client.put_secret_value(
+            SecretId="totesys", SecretString=json.dumps({"username": "rotated"})
+        )
+
+        assert get_credentials("totesys", ttl=0)["username"] == "rotated"
+
+
+class TestConnectionToDatabase:
+
+    # Use the collect credentials to obtain database AWS Secret
+
+    def test_connection_to_database_can_run_query(self):
+        db = connection_to_database()
+        query = "SELECT * FROM payment LIMIT 2;"
+        result = db.run(query)
+
+        assert type(result) == list
+        assert len(result) == 2
+
+
+class TestCheckForData:
+
+    def test_check_for_data_returns_false_if_bucket_empty(self):
+        with mock_aws():
+            # create mock s3 bucket
+            s3_client = boto3.client("s3")
+            # function checks for data in mock s3 bucket
+            s3_client.create_bucket(
+                Bucket="TestBucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            # call check for data
+            result = check_for_data(s3_client, bucket_name="TestBucket")
+
+            assert result == False
+
+    def test_check_for_data_returns_true_if_bucket_occupied(self):
+        with mock_aws():
+            # create mock s3 bucket
+            s3_client = boto3.client("s3")
+            # function checks for data in mock s3 bucket
+            s3_client.create_bucket(
+                Bucket="TestBucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            # add data to mock s3 bucket
+            s3_client.put_object(Body="Test.txt", Bucket="TestBucket", Key="TestKey")
+            # call check for data
+            result = check_for_data(s3_client, bucket_name="TestBucket")
+            assert result == True
+
+
+class TestUploadToS3:
+
+    @mock_aws
+    def test_upload_to_s3_success(self):
+        """
+        Tests that `upload_to_s3` successfully uploads data to an S3 bucket and verifies
+        the uploaded content matches the original data.
+        """
+        bucket_name = "test-bucket"
+        object_name = "test-object.txt"
+        data = b"Sample data"
+
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket=bucket_name,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+
+        upload_to_s3(data, bucket_name, object_name)
+
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_name)
+        assert response["Body"].read() == data
+
+    @mock_aws
+    def test_upload_to_s3_uploads_a_memoryview_in_place(self):
+        """
+        Tests that a memoryview, as dataframe_to_parquet returns, uploads the bytes
+        it views.
+        """
+        buffer = io.BytesIO()
+        buffer.write(b"Sample data" * 1000)
+
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+
+        upload_to_s3(buffer.getbuffer(), "test-bucket", "test-object.pqt")
+
+        response = s3_client.get_object(Bucket="test-bucket", Key="test-object.pqt")
+        assert response["Body"].read() == b"Sample data" * 1000
+
+    @mock_aws
+    def test_upload_to_s3_failure(self):
+        """
+        Verifies that `upload_to_s3` raises a `ClientError` when attempting to upload
+        to a non-existent S3 bucket.
+        """
+        bucket_name = "nonexistent-bucket"
+        object_name = "test-object.txt"
+        data = b"Sample data"
+
+        with pytest.raises(ClientError):
+            upload_to_s3(data, bucket_name, object_name)
+
+
+class TestCreateFilename:
+
+    def test_create_filename(self):
+        """
+        Tests that `create_filename` generates the correct filename with a timestamp-based directory structure.
+        """
+        table_name = "test_table"
+        mock_datetime = datetime(2025, 2, 25, 15, 9, 26, 123456).strftime(
+            "%Y/%m/%d/%H:%M"
+        )
+        expected_filename = "test_table/2025/02/25/15:09.json"
+        result = create_filename(table_name, mock_datetime)
+        assert result == expected_filename
+
+
+class TestFormatDataToJson:
+
+    def test_format_data_to_json(self):
+        """
+        Verify that format_data_to_json correctly converts rows and columns into
+        a JSON-formatted bytes object, handling various data types such as datetime
+        and Decimal.
+        """
+        rows = [
+            (1, "Alice", datetime(2025, 2, 26, 14, 33), Decimal("100.00")),
+            (2, "Bob", datetime(2025, 2, 27, 15, 40), Decimal("200.50")),
+        ]
+        columns = ["id", "name", "timestamp", "amount"]
+        expected_data = [
+            {
+                "id": 1,
+                "name": "Alice",
+                "timestamp": "2025-02-26T14:33:00",
+                "amount": 100.00,
+            },
+            {
+                "id": 2,
+                "name": "Bob",
+                "timestamp": "2025-02-27T15:40:00",
+                "amount": 200.50,
+            },
+        ]
+
+        result = format_data_to_json(rows, columns)
+
+        # Decode the result back to JSON object
+        result_data = json.loads(result.decode("utf-8"))
+
+        # Assert that the resulting JSON data matches the expected data
+        assert result_data == expected_data
+
+
+class FakeCursorConnection:
+    """Stands in for a pg8000 connection serving a result set through a cursor."""
+
+    def __init__(self, rows, columns):
+        self.rows = list(rows)
+        self.columns = [{"name": name} for name in columns]
+        self.statements = []
+
+    def run(self, sql):
+        self.statements.append(sql)
+        if sql.startswith("FETCH FORWARD"):
+            batch_size = int(sql.split()[2])
+            batch, self.rows = self.rows[:batch_size], self.rows[batch_size:]
+            return batch
+        return None
+
+
+class TestEncodeRowsToJson:
+
+    columns = [
+        {"name": "id", "type_oid": 23},
+        {"name": "name", "type_oid": 1043},
+        {"name": "timestamp", "type_oid": 1114},
+        {"name": "amount", "type_oid": 1700},
+        {"name": "paid", "type_oid": 16},
+        {"name": "ratio", "type_oid": 701},
+    ]
+
+    def test_output_matches_format_data_to_json(self):
+        rows = [
+            [1, "Alice", datetime(2025, 2, 26, 14, 33), Decimal("100.00"), True, 0.5],
+            [
+                2,
+                'Bob "B" \u00e9%s',
+                datetime(2025, 2, 27, 15, 40, 1, 5),
+                Decimal("200.50"),
+                False,
+                None,
+            ],
+            [3, None, None, None, None, float("nan")],
+        ]
+        names = [column["name"] for column in self.columns]
+
+        payload, row_count = encode_rows_to_json(rows, self.columns)
+
+        assert row_count == 3
+        assert payload == format_data_to_json(rows, names)
+
+    def test_empty_rows_return_empty_array_and_zero_count(self):
+        payload, row_count = encode_rows_to_json([], self.columns)
+
+        assert payload == b"[]"
+        assert row_count == 0
+
+    def test_unknown_types_fall_back_to_custom_encoder(self):
+        rows = [[{"nested": [1, 2]}, Decimal("1.5")]]
+        columns = [{"name": "doc", "type_oid": 3802}, {"name": "amount"}]
+
+        payload, _ = encode_rows_to_json(rows, columns)
+
+        assert json.loads(payload) == [{"doc": {"nested": [1, 2]}, "amount": 1.5}]
+
+    def test_rows_are_encoded_in_chunks(self):
+        rows = [[i, f"name {i}", None, None, None, None] for i in range(25001)]
+        names = [column["name"] for column in self.columns]
+
+        payload, row_count = encode_rows_to_json(rows, self.columns)
+
+        assert row_count == 25001
+        assert payload == format_data_to_json(rows, names)
+
+
+class FakeWireConnection:
+    """Stands in for a pg8000 connection: wire text goes through its input adapters."""
+
+    def __init__(self, rows, columns):
+        self.pg_types = defaultdict(
+            lambda: str, {1114: datetime.fromisoformat, 1700: Decimal, 23: int}
+        )
+        self.wire_rows = rows
+        self.columns = columns
+
+    def register_in_adapter(self, oid, in_func):
+        self.pg_types[oid] = in_func
+
+    def run(self, sql, **params):
+        adapters = [self.pg_types[column["type_oid"]] for column in self.columns]
+        return [
+            [
+                None if value is None else adapt(value)
+                for adapt, value in zip(adapters, row)
+            ]
+            for row in self.wire_rows
+        ]
+
+
+class TestReadWireText:
+
+    columns = [
+        {"name": "id", "type_oid": 23},
+        {"name": "last_updated", "type_oid": 1114},
+        {"name": "unit_price", "type_oid": 1700},
+    ]
+    wire_rows = [
+        ["1", "2022-11-03 14:20:49.962", "12345678901234567890.123456789"],
+        ["2", "2022-11-03 14:20:49", "0.10"],
+        ["3", "2025-03-06 13:39:12.345678", "NaN"],
+        ["4", None, None],
+    ]
+
+    def test_numerics_round_trip_without_losing_precision(self):
+        conn = FakeWireConnection(self.wire_rows, self.columns)
+
+        with read_wire_text(conn):
+            rows = conn.run("SELECT * FROM sales_order")
+        payload, _ = encode_rows_to_json(rows, conn.columns)
+        typed_payload, _ = encode_rows_to_json(conn.run("SELECT"), conn.columns)
+
+        prices = [row["unit_price"] for row in json.loads(payload, parse_float=Decimal)]
+        assert prices[0] == Decimal("12345678901234567890.123456789")
+        assert prices[1] == Decimal("0.10")
+        assert prices[2] != prices[2]  # NaN
+        assert prices[3] is None
+        # the float path drops the digits past float precision
+        typed_price = json.loads(typed_payload, parse_float=Decimal)[0]["unit_price"]
+        assert typed_price != Decimal("12345678901234567890.123456789")
+
+    def test_timestamps_are_encoded_as_the_datetime_path_encodes_them(self):
+        conn = FakeWireConnection(self.wire_rows, self.columns[:2])
+
+        with read_wire_text(conn):
+            raw_payload, _ = encode_rows_to_json(
+                conn.run("SELECT * FROM sales_order"), conn.columns
+            )
+        typed_payload, _ = encode_rows_to_json(conn.run("SELECT"), conn.columns)
+
+        assert raw_payload == typed_payload
+
+    def test_adapters_are_restored_after_the_block(self):
+        conn = FakeWireConnection(self.wire_rows, self.columns)
+        del conn.pg_types[1700]
+
+        with pytest.raises(RuntimeError):
+            with read_wire_text(conn):
+                assert conn.run("SELECT")[0][1] == "2022-11-03 14:20:49.962"
+                raise RuntimeError("query failed")
+
+        assert conn.pg_types[1114] == datetime.fromisoformat
+        assert 1700 not in conn.pg_types
+        assert conn.run("SELECT")[0][1] == datetime(2022, 11, 3, 14, 20, 49, 962000)
+
+    def test_connections_without_adapters_are_left_alone(self):
+        conn = MagicMock()
+
+        with read_wire_text(conn):
+            pass
+        with read_wire_text(FakeWireConnection([], self.columns), enabled=False):
+            pass
+
+        conn.register_in_adapter.assert_not_called()
+
+    def test_run_query_reads_wire_text_only_when_raw(self):
+        conn = FakeWireConnection(self.wire_rows, self.columns)
+
+        raw_rows, _ = run_query(conn, "SELECT", {}, raw=True)
+        typed_rows, _ = run_query(conn, "SELECT", {})
+
+        assert raw_rows[0][1:] == self.wire_rows[0][1:]
+        assert typed_rows[0][2] == Decimal("12345678901234567890.123456789")
+
+
+class TestStreamQueryBatches:
+
+    def test_yields_rows_in_fixed_size_batches(self):
+        conn = FakeCursorConnection(
+            [[i, f"name {i}"] for i in range(5)], ["id", "name"]
+        )
+
+        batches = list(stream_query_batches(conn, "SELECT * FROM staff;", 2))
+
+        assert [len(rows) for rows, _ in batches] == [2, 2, 1]
+        assert batches[0][1] == [{"name": "id"}, {"name": "name"}]
+
+    def test_declares_cursor_inside_a_committed_transaction(self):
+        conn = FakeCursorConnection([[1]], ["id"])
+
+        list(stream_query_batches(conn, "SELECT * FROM staff;", 10))
+
+        assert conn.statements[0] == "START TRANSACTION READ ONLY"
+        assert (
+            conn.statements[1]
+            == "DECLARE extract_cursor NO SCROLL CURSOR FOR SELECT * FROM staff"
+        )
+        assert conn.statements[-2] == "CLOSE extract_cursor"
+        assert conn.statements[-1] == "COMMIT"
+
+    def test_rolls_back_when_closed_early(self):
+        conn = FakeCursorConnection([[i] for i in range(5)], ["id"])
+
+        batches = stream_query_batches(conn, "SELECT * FROM staff", 2)
+        next(batches)
+        batches.close()
+
+        assert conn.statements[-1] == "ROLLBACK"
+
+
+class TestUploadStreamToS3:
+
+    @mock_aws
+    def test_small_stream_is_written_with_single_put(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+
+        total = upload_stream_to_s3(
+            s3_client, [b"[", b"{}", b"]"], "test-bucket", "table/file.json"
+        )
+
+        response = s3_client.get_object(Bucket="test-bucket", Key="table/file.json")
+        assert total == 4
+        assert response["Body"].read() == b"[{}]"
+
+    @mock_aws
+    def test_large_stream_is_written_as_multipart_upload(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        chunk = b"x" * (1024 * 1024)
+        chunks = [chunk] * 11
+
+        total = upload_stream_to_s3(s3_client, chunks, "test-bucket", "big.json")
+
+        response = s3_client.head_object(Bucket="test-bucket", Key="big.json")
+        assert total == 11 * len(chunk)
+        assert response["ContentLength"] == total
+        # multipart ETags end with the number of parts
+        assert response["ETag"].strip('"').endswith("-3")
+
+    @mock_aws
+    def test_failed_stream_aborts_multipart_upload(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+
+        def failing_chunks():
+            yield b"x" * MIN_MULTIPART_PART_SIZE
+            raise RuntimeError("database went away")
+
+        with pytest.raises(RuntimeError):
+            upload_stream_to_s3(s3_client, failing_chunks(), "test-bucket", "big.json")
+
+        uploads = s3_client.list_multipart_uploads(Bucket="test-bucket")
+        assert "Uploads" not in uploads
+
+
+class TestCompression:
+
+    @pytest.mark.parametrize("compression", ["gzip", "zstd"])
+    @mock_aws
+    def test_compressed_object_is_decoded_by_its_content_encoding(self, compression):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        payload = b'[{"staff_id": 1, "first_name": "Jeremie"}]' * 100
+
+        data, content_encoding = compress_data(payload, compression)
+        s3_client.put_object(
+            Bucket="test-bucket",
+            Key="staff/data.json",
+            Body=data,
+            ContentEncoding=content_encoding,
+        )
+
+        assert content_encoding == compression
+        assert len(data) < len(payload)
+        assert open_s3_object(s3_client, "test-bucket", "staff/data.json").read() == (
+            payload
+        )
+
+    @pytest.mark.parametrize("compression", ["gzip", "zstd"])
+    def test_chunks_compress_to_one_stream(self, compression):
+        chunks = [b"[", b'{"id": 1}', b", ", b'{"id": 2}', b"]"]
+
+        data = b"".join(compress_chunks(iter(chunks), compression))
+
+        assert compress_data(b"", compression)[1] == compression
+        if compression == "gzip":
+            assert gzip.decompress(data) == b"".join(chunks)
+        else:
+            assert bytes(cramjam.zstd.decompress(data)) == b"".join(chunks)
+
+    def test_zstd_objects_are_written_and_read_a_frame_at_a_time(self):
+        payload = b'{"staff_id": 1, "first_name": "Jeremie"}, ' * 1000
+        chunks = [payload[i : i + 1000] for i in range(0, len(payload), 1000)]
+
+        with patch("utils.common.ZSTD_FRAME_SIZE", 4096):
+            data = b"".join(compress_chunks(iter(chunks), "zstd"))
+        body = MagicMock(wraps=io.BytesIO(data))
+        s3_client = MagicMock()
+        s3_client.get_object.return_value = {"ContentEncoding": "zstd", "Body": body}
+        with patch("utils.common.ZSTD_READ_SIZE", 512):
+            decoded = open_s3_object(s3_client, "test-bucket", "staff/data.json").read()
+
+        # one frame per 4096 bytes of content, one valid zstd stream
+        assert data.count((0xFD2FB528).to_bytes(4, "little")) == 11
+        assert bytes(cramjam.zstd.decompress(data)) == payload
+        assert decoded == payload
+        # the body is never read whole
+        assert {call.args for call in body.read.call_args_list} == {(512,)}
+
+    def test_unknown_compression_is_rejected(self):
+        with pytest.raises(ValueError):
+            compress_data(b"[]", "brotli")
+
+    @mock_aws
+    def test_extraction_writes_compressed_json_readable_by_transform(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection({"currency": [[1, "GBP", datetime(2025, 3, 6)]]})
+
+        extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(compression="zstd")
+        )
+        extract_data(
+            s3_client,
+            conn,
+            "test-bucket",
+            ExtractionConfig(batch_size=10, compression="gzip"),
+        )
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        key = manifest["tables"]["currency"]["keys"][0]
+        response = s3_client.get_object(Bucket="test-bucket", Key=key)
+        assert key.endswith(".json.zst")
+        assert response["ContentEncoding"] == "zstd"
+        assert hashlib.sha256(response["Body"].read()).hexdigest() == (
+            manifest["tables"]["currency"]["checksum"]
+        )
+        with patch("utils.lambda_utils.boto3.client", return_value=s3_client):
+            df = convert_json_to_df_from_s3(
+                "currency", "test-bucket", manifest=manifest
+            )
+        assert df["name"][0] == "GBP"
+
+
+class TestStreamTableToS3:
+
+    @mock_aws
+    def test_streamed_object_matches_format_data_to_json(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        rows = [
+            [i, f"name {i}", datetime(2025, 2, 26, 14, 33), Decimal("100.50")]
+            for i in range(7)
+        ]
+        columns = ["id", "name", "timestamp", "amount"]
+        conn = FakeCursorConnection(rows, columns)
+
+        row_count = stream_table_to_s3(
+            s3_client, conn, "SELECT * FROM t", "test-bucket", "t/file.json", 3
+        )
+
+        body = s3_client.get_object(Bucket="test-bucket", Key="t/file.json")[
+            "Body"
+        ].read()
+        assert row_count == 7
+        assert body == format_data_to_json(rows, columns)
+
+    @mock_aws
+    def test_empty_result_uploads_nothing(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeCursorConnection([], ["id"])
+
+        row_count = stream_table_to_s3(
+            s3_client, conn, "SELECT * FROM t", "test-bucket", "t/file.json", 3
+        )
+
+        assert row_count == 0
+        assert check_for_data(s3_client, "test-bucket") is False
+
+
+class FakeSnapshotConnection:
+    """Stands in for a pg8000 connection that only serves reads inside the exported snapshot."""
+
+    snapshot_id = "00000003-0000001B-1"
+
+    def __init__(self, fail_on=None):
+        self.statements = []
+        self.columns = []
+        self.attached = False
+        self.fail_on = fail_on
+
+    def run(self, sql, **params):
+        self.statements.append(sql)
+        if sql == "SELECT pg_export_snapshot()":
+            return [[self.snapshot_id]]
+        if sql.startswith("SET TRANSACTION SNAPSHOT"):
+            self.attached = sql == f"SET TRANSACTION SNAPSHOT '{self.snapshot_id}'"
+        elif sql == "COMMIT":
+            self.attached = False
+        elif sql.startswith("SELECT"):
+            # the change probe runs on the coordinator before the snapshot exists
+            if not self.attached and not sql.startswith("SELECT '"):
+                raise RuntimeError("query ran outside the exported snapshot")
+            if self.fail_on and self.fail_on in sql:
+                raise RuntimeError("relation does not exist")
+            database = FakeTotesysConnection(
+                {table: [[1, "example", datetime(2025, 3, 6)]] for table in TABLE_NAMES}
+            )
+            rows = database.run(sql, **params)
+            self.columns = database.columns
+            return rows
+
+    def close(self):
+        pass
+
+
+class FakeTotesysConnection:
+    """Stands in for the totesys database; every table has (<table>_id, name, last_updated) rows."""
+
+    def __init__(self, rows=None):
+        self.rows = {table: [] for table in TABLE_NAMES}
+        self.rows.update(rows or {})
+        self.columns = []
+        self.queries = []
+        self.cursor = []
+
+    def run(self, sql, since=None, last_id=None, chunk_size=None, **params):
+        if sql.startswith("SELECT '"):
+            return [
+                self.probe(select, params)
+                for select in sql.rstrip(";").split(" UNION ALL ")
+            ]
+        if sql.startswith("FETCH FORWARD"):
+            batch_size = int(sql.split()[2])
+            batch, self.cursor = self.cursor[:batch_size], self.cursor[batch_size:]
+            return batch
+        if sql == "SELECT LOCALTIMESTAMP":
+            return [[datetime(2025, 3, 7)]]
+        match = re.search(r"FROM (\w+)", sql)
+        if not match:
+            return None
+        self.queries.append((sql, last_id if "ORDER BY" in sql else since))
+        table = match.group(1)
+        self.columns = [
+            {"name": f"{table}_id", "type_oid": 23},
+            {"name": "name", "type_oid": 1043},
+            {"name": "last_updated", "type_oid": 1114},
+        ]
+        rows = [
+            list(row)
+            for row in sorted(self.rows[table])
+            if (since is None or row[2] >= since)
+            and (last_id is None or row[0] > last_id)
+        ][:chunk_size]
+        if sql.startswith("DECLARE"):
+            self.cursor = rows
+            return None
+        return rows
+
+    def probe(self, select, params):
+        table = re.search(r"FROM (\w+)", select).group(1)
+        since = params.get(f"{table}_since")
+        boundary = set(
+            zip(
+                params.get(f"{table}_boundary_ids", []),
+                params.get(f"{table}_boundary_updated", []),
+            )
+        )
+        rows = [
+            row
+            for row in self.rows[table]
+            if (since is None or row[2] >= since)
+            and (row[0], row[2].isoformat()) not in boundary
+        ]
+        checksum = None
+        if "md5(" in select and rows:
+            checksum = hashlib.md5(repr(sorted(rows)).encode("utf-8")).hexdigest()
+        return [table, len(rows), max((row[2] for row in rows), default=None), checksum]
+
+    def close(self):
+        pass
+
+
+class TestStartReadTransaction:
+
+    def test_attaches_to_exported_snapshot(self):
+        conn = FakeSnapshotConnection()
+
+        start_read_transaction(conn, "00000003-0000001B-1")
+
+        assert conn.statements == [
+            "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+            "SET TRANSACTION SNAPSHOT '00000003-0000001B-1'",
+        ]
+
+    def test_rejects_malformed_snapshot_id(self):
+        conn = FakeSnapshotConnection()
+
+        with pytest.raises(ValueError):
+            start_read_transaction(conn, "1'; DROP TABLE staff; --")
+
+        assert conn.statements == []
+
+
+class TestExtractTablesInParallel:
+
+    @mock_aws
+    def test_every_table_is_read_inside_the_shared_snapshot(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        coordinator = FakeSnapshotConnection()
+
+        extraction_type, updated_tables, table_formats = extract_data(
+            s3_client,
+            coordinator,
+            "test-bucket",
+            ExtractionConfig(max_workers=3),
+            connection_factory=FakeSnapshotConnection,
+        )
+
+        assert extraction_type == "Initial extraction"
+        assert updated_tables == TABLE_NAMES
+        assert "UNION ALL" in coordinator.statements[0]
+        assert coordinator.statements[1:] == [
+            "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+            "SELECT pg_export_snapshot()",
+            "COMMIT",
+        ]
+
+    @mock_aws
+    def test_worker_failure_is_raised_and_snapshot_released(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        coordinator = FakeSnapshotConnection()
+
+        with pytest.raises(RuntimeError, match="Extraction of payment failed"):
+            extract_tables_in_parallel(
+                coordinator,
+                lambda: FakeSnapshotConnection(fail_on="FROM payment;"),
+                "test-bucket",
+                False,
+                "2025/02/25/15:09",
+                ExtractionConfig(max_workers=2),
+            )
+
+        assert coordinator.statements[-1] == "COMMIT"
+
+
+class TestFormatDataToParquet:
+
+    def test_columns_are_typed_from_database_type_oids(self):
+        rows = [
+            [1, "Alice", datetime(2025, 2, 26, 14, 33, 0, 123000), Decimal("100.50")],
+            [2, None, None, None],
+        ]
+        columns = [
+            {"name": "id", "type_oid": 23},
+            {"name": "name", "type_oid": 1043},
+            {"name": "created_at", "type_oid": 1114},
+            {"name": "amount", "type_oid": 1700},
+        ]
+
+        df = pd.read_parquet(io.BytesIO(format_data_to_parquet(rows, columns)))
+
+        assert list(df.columns) == ["id", "name", "created_at", "amount"]
+        assert str(df["id"].dtype) == "Int64"
+        assert str(df["created_at"].dtype) == "datetime64[ns]"
+        assert df["amount"].dtype == "float64"
+        assert df["created_at"][0] == pd.Timestamp("2025-02-26 14:33:00.123")
+        assert df["amount"][0] == 100.5
+        assert df["name"][0] == "Alice"
+        assert df["name"].isna()[1]
+
+    def test_empty_rows_keep_column_names(self):
+        columns = [{"name": "id", "type_oid": 23}, {"name": "name", "type_oid": 25}]
+
+        df = pd.read_parquet(io.BytesIO(format_data_to_parquet([], columns)))
+
+        assert list(df.columns) == ["id", "name"]
+        assert df.empty
+
+
+class TestStateManifest:
+
+    @mock_aws
+    def test_missing_manifest_is_empty_and_created_once(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+
+        manifest, etag = read_manifest(s3_client, "test-bucket")
+        write_manifest(s3_client, "test-bucket", manifest, etag)
+
+        assert (manifest, etag) == ({"version": 0, "tables": {}}, None)
+        assert read_manifest(s3_client, "test-bucket")[0]["version"] == 1
+        with pytest.raises(ClientError, match="PreconditionFailed"):
+            write_manifest(s3_client, "test-bucket", manifest, etag)
+
+    @mock_aws
+    def test_conflicting_update_is_merged_into_newer_manifest(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        staff = manifest_entry(["staff/a.json"], 2, "abc", "2025/03/06/13:39")
+        design = manifest_entry(["design/a.json"], 3, "def", "2025/03/06/13:40")
+        stale_manifest, stale_etag = read_manifest(s3_client, "test-bucket")
+        update_manifest(s3_client, "test-bucket", {"staff": staff})
+
+        update_manifest(
+            s3_client,
+            "test-bucket",
+            {"design": design},
+            manifest=stale_manifest,
+            etag=stale_etag,
+        )
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        assert manifest["version"] == 2
+        assert manifest["tables"] == {"staff": staff, "design": design}
+
+    @mock_aws
+    def test_continuous_extraction_reads_watermarks_from_manifest(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        first_update = datetime(2025, 3, 6, 13, 39, 12, 345678)
+        conn = FakeTotesysConnection({"design": [[1, "Wooden", first_update]]})
+        extract_data(s3_client, conn, "test-bucket")
+        conn.rows["design"].append([2, "Bronze", first_update + timedelta(seconds=5)])
+        conn.queries.clear()
+
+        _, updated_tables, _ = extract_data(s3_client, conn, "test-bucket")
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        assert updated_tables == ["design"]
+        assert manifest["version"] == 2
+        # the change probe leaves every other table unread
+        assert conn.queries == [
+            (
+                "SELECT design_id, design_name, file_location, file_name, "
+                "last_updated FROM design WHERE last_updated >= :since;",
+                first_update,
+            )
+        ]
+        assert manifest["tables"]["staff"]["watermark"] is None
+        entry = manifest["tables"]["design"]
+        body = s3_client.get_object(Bucket="test-bucket", Key=entry["keys"][0])["Body"]
+        assert hashlib.sha256(body.read()).hexdigest() == entry["checksum"]
+        keys = [
+            obj["Key"]
+            for obj in s3_client.list_objects_v2(Bucket="test-bucket")["Contents"]
+        ]
+        assert not any(key.endswith("last_extracted.txt") for key in keys)
+
+
+class TestWatermarkTracker:
+
+    columns = [
+        {"name": "staff_id"},
+        {"name": "first_name"},
+        {"name": "last_updated"},
+    ]
+
+    def test_rows_from_previous_run_are_dropped_inside_overlap(self):
+        watermark = datetime(2025, 3, 6, 13, 39, 12, 500000)
+        tracker = WatermarkTracker(
+            "staff_id",
+            watermark,
+            [[7, "2025-03-06T13:39:12.500000"], [8, "2025-03-06T13:39:11"]],
+            overlap=60,
+        )
+        rows = [
+            [7, "Jeremie", watermark],
+            [8, "Deron", datetime(2025, 3, 6, 13, 39, 11)],
+            [9, "Jeanette", datetime(2025, 3, 6, 13, 39, 10)],  # committed late
+            [8, "Deron", watermark + timedelta(seconds=3)],  # updated again
+        ]
+
+        assert tracker.since() == watermark - timedelta(seconds=60)
+
+        new_rows = tracker.filter(rows, self.columns)
+
+        assert [row[0] for row in new_rows] == [9, 8]
+        assert tracker.watermark == watermark + timedelta(seconds=3)
+        assert tracker.boundary() == [
+            [7, "2025-03-06T13:39:12.500000"],
+            [8, "2025-03-06T13:39:11"],
+            [9, "2025-03-06T13:39:10"],
+            [8, "2025-03-06T13:39:15.500000"],
+        ]
+
+    def test_boundary_only_keeps_rows_at_watermark_without_overlap(self):
+        tracker = WatermarkTracker("staff_id")
+        rows = [
+            [1, "Jeremie", datetime(2025, 3, 6, 13, 39, 12)],
+            [2, "Deron", datetime(2025, 3, 6, 13, 40, 0)],
+        ]
+
+        assert tracker.since() is None
+        assert tracker.filter(rows, self.columns) == rows
+        assert tracker.boundary() == [[2, "2025-03-06T13:40:00"]]
+
+    def test_wire_text_timestamps_are_tracked_like_datetimes(self):
+        tracker = WatermarkTracker(
+            "staff_id",
+            datetime(2025, 3, 6, 13, 39, 12),
+            [[7, "2025-03-06T13:39:12"]],
+            overlap=60,
+        )
+        rows = [
+            [7, "Jeremie", "2025-03-06 13:39:12"],
+            [8, "Deron", "2025-03-06 13:40:00.5"],
+        ]
+
+        assert tracker.filter(rows, self.columns) == [rows[1]]
+        assert tracker.watermark == datetime(2025, 3, 6, 13, 40, 0, 500000)
+        assert tracker.boundary() == [
+            [7, "2025-03-06T13:39:12"],
+            [8, "2025-03-06T13:40:00.500000"],
+        ]
+
+    @mock_aws
+    def test_unchanged_tables_are_not_extracted_again(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        last_updated = datetime(2025, 3, 6, 13, 39, 12, 345678)
+        conn = FakeTotesysConnection(
+            {table: [[1, "example", last_updated]] for table in TABLE_NAMES}
+        )
+        extract_data(s3_client, conn, "test-bucket", ExtractionConfig(overlap=30))
+        conn.queries.clear()
+
+        _, updated_tables, _ = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(batch_size=100, overlap=30)
+        )
+
+        assert updated_tables == []
+        assert conn.queries == []
+        assert read_manifest(s3_client, "test-bucket")[0]["version"] == 1
+
+
+class TestRowHashIndex:
+
+    columns = [
+        {"name": "sales_order_id", "type_oid": 23},
+        {"name": "unit_price", "type_oid": 1700},
+        {"name": "created_at", "type_oid": 1114},
+        {"name": "last_updated", "type_oid": 1114},
+    ]
+
+    def test_rows_changed_only_in_last_updated_are_suppressed(self):
+        index = RowHashIndex("sales_order_id")
+        rows = [
+            [1, Decimal("2.50"), datetime(2025, 3, 6), datetime(2025, 3, 6)],
+            [2, Decimal("3.00"), datetime(2025, 3, 6), datetime(2025, 3, 6)],
+        ]
+        assert index.filter(rows, self.columns) == rows
+
+        touched = [
+            [1, Decimal("2.50"), datetime(2025, 3, 6), datetime(2025, 3, 7)],
+            [2, Decimal("3.10"), datetime(2025, 3, 6), datetime(2025, 3, 7)],
+            [3, None, datetime(2025, 3, 7), datetime(2025, 3, 7)],
+        ]
+
+        assert index.filter(touched, self.columns) == touched[1:]
+        assert index.suppressed == 1
+        assert index.changed
+
+    def test_wire_text_rows_hash_like_typed_rows(self):
+        index = RowHashIndex("sales_order_id")
+        index.filter(
+            [[1, Decimal("2.50"), datetime(2025, 3, 6, 12, 0, 0, 500000), None]],
+            self.columns,
+        )
+        # as the next run reads it back
+        index = RowHashIndex("sales_order_id", *index.merged())
+
+        wire_text = [[1, "2.50", "2025-03-06 12:00:00.5", "2025-03-07 09:00:00"]]
+
+        assert index.filter(wire_text, self.columns) == []
+        assert not index.changed
+
+    def test_segment_round_trips_through_bytes_sorted_by_id(self):
+        data = RowHashIndex.segment_to_bytes({7: 2**64 - 1, 3: 5, 12: 0})
+        ids, hashes = RowHashIndex.segment_from_bytes(data)
+
+        assert len(data) == 3 * 16
+        assert list(zip(ids, hashes)) == [(3, 5), (7, 2**64 - 1), (12, 0)]
+
+    def test_lookups_search_the_base_under_the_deltas_and_changes(self):
+        base = RowHashIndex.segment_from_bytes(
+            RowHashIndex.segment_to_bytes({1: 10, 3: 30, 5: 50, 7: 70})
+        )
+        delta = RowHashIndex.segment_from_bytes(
+            RowHashIndex.segment_to_bytes({3: 31, 4: 40})
+        )
+        index = RowHashIndex("staff_id", *base, [delta])
+        index.changes.update({5: 52, 9: 90})
+        expected = {1: 10, 3: 31, 4: 40, 5: 52, 7: 70, 9: 90}
+
+        assert {key: index.get(key) for key in range(11)} == {
+            key: expected.get(key) for key in range(11)
+        }
+        ids, hashes = index.merged()
+        assert list(ids) == sorted(expected)
+        assert dict(zip(ids, hashes)) == expected
+
+    @mock_aws
+    def test_runs_write_their_changes_as_deltas_merged_periodically(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        index = RowHashIndex("staff_id")
+        index.changes.update({key: key for key in range(100)})
+        stored = write_row_hash_index(s3_client, "test-bucket", "staff", index)
+        assert stored["deltas"] == []
+
+        for run in range(1, ROW_HASH_MAX_DELTAS + 2):
+            with patch.dict("utils.extract._row_hash_cache", clear=True):
+                index = read_row_hash_index(
+                    s3_client, "test-bucket", "staff", "staff_id", stored
+                )
+            if run > 1:
+                assert index.get(run - 1) == 1000 + run - 1
+            index.changes[run] = 1000 + run
+            stored = write_row_hash_index(
+                s3_client, "test-bucket", "staff", index, stored
+            )
+            keys = row_hash_segments(stored)
+            sizes = [
+                s3_client.head_object(Bucket="test-bucket", Key=key)["ContentLength"]
+                for key in keys
+            ]
+            if run <= ROW_HASH_MAX_DELTAS:
+                # one row changed: one 16-byte delta
+                assert len(stored["deltas"]) == run
+                assert sizes[-1] == 16
+            else:
+                assert stored["deltas"] == []
+                assert sizes == [100 * 16]
+
+        index = read_row_hash_index(
+            s3_client, "test-bucket", "staff", "staff_id", stored
+        )
+        assert [index.get(key) for key in (0, 1, 9, 99)] == [0, 1001, 1009, 99]
+        # indexes recorded as a single key are read as a base
+        assert row_hash_segments("state/row_hashes/staff/a.bin") == [
+            "state/row_hashes/staff/a.bin"
+        ]
+
+    @pytest.mark.parametrize("batch_size", [None, 100])
+    @mock_aws
+    def test_touched_but_unchanged_rows_are_not_extracted(self, batch_size):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection(
+            {
+                "staff": [
+                    [1, "Jeremie", datetime(2025, 3, 6)],
+                    [2, "Deron", datetime(2025, 3, 6)],
+                ]
+            }
+        )
+        extract_data(
+            s3_client,
+            conn,
+            "test-bucket",
+            ExtractionConfig(batch_size=batch_size, suppress_unchanged=True),
+        )
+        first_index = read_manifest(s3_client, "test-bucket")[0]["tables"]["staff"][
+            "row_hashes"
+        ]
+
+        conn.rows["staff"] = [
+            [1, "Jeremie", datetime(2025, 3, 7)],
+            [2, "Deron", datetime(2025, 3, 7)],
+        ]
+        with patch.dict("utils.extract._row_hash_cache", clear=True):
+            _, touched, _ = extract_data(
+                s3_client,
+                conn,
+                "test-bucket",
+                ExtractionConfig(batch_size=batch_size, suppress_unchanged=True),
+            )
+        entry = read_manifest(s3_client, "test-bucket")[0]["tables"]["staff"]
+
+        assert touched == []
+        assert entry["keys"] == []
+        assert entry["watermark"] == "2025-03-07T00:00:00"
+        assert entry["row_hashes"] == first_index
+
+        conn.rows["staff"][1] = [2, "Deron Smith", datetime(2025, 3, 8)]
+        conn.queries.clear()
+        _, updated_tables, _ = extract_data(
+            s3_client,
+            conn,
+            "test-bucket",
+            ExtractionConfig(batch_size=batch_size, suppress_unchanged=True),
+        )
+        entry = read_manifest(s3_client, "test-bucket")[0]["tables"]["staff"]
+        body = s3_client.get_object(Bucket="test-bucket", Key=entry["keys"][0])[
+            "Body"
+        ].read()
+        index_keys = [
+            obj["Key"]
+            for obj in s3_client.list_objects_v2(
+                Bucket="test-bucket", Prefix="state/row_hashes/staff/"
+            )["Contents"]
+        ]
+
+        assert len(conn.queries) == 1
+        assert updated_tables == ["staff"]
+        assert [row["name"] for row in json.loads(body)] == ["Deron Smith"]
+        # the base written by the first run was merged into a new one and deleted
+        assert index_keys == row_hash_segments(entry["row_hashes"])
+        assert entry["row_hashes"] != first_index
+
+    @mock_aws
+    def test_segments_are_deleted_when_the_manifest_write_fails(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection({"staff": [[1, "Jeremie", datetime(2025, 3, 6)]]})
+        failure = ClientError(
+            {"Error": {"Code": "PreconditionFailed", "Message": "Conflict"}},
+            "PutObject",
+        )
+
+        with patch("src.extraction_lambda.main.update_manifest", side_effect=failure):
+            with pytest.raises(ClientError):
+                extract_data(
+                    s3_client,
+                    conn,
+                    "test-bucket",
+                    ExtractionConfig(suppress_unchanged=True),
+                )
+
+        listing = s3_client.list_objects_v2(
+            Bucket="test-bucket", Prefix="state/row_hashes/"
+        )
+        assert "Contents" not in listing
+
+
+class TestColumnProjection:
+
+    def test_select_list_adds_primary_key_and_last_updated(self):
+        assert select_list("department") == (
+            "department_id, department_name, location, last_updated"
+        )
+        assert select_list("department", all_columns=True) == "*"
+        # no transform reads payment, so it is kept whole
+        assert select_list("payment") == "*"
+
+    @mock_aws
+    def test_all_columns_override_selects_everything(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection(
+            {table: [[1, "example", datetime(2025, 3, 6)]] for table in TABLE_NAMES}
+        )
+
+        extract_data(s3_client, conn, "test-bucket", ExtractionConfig(all_columns=True))
+
+        assert {sql for sql, _ in conn.queries} == {
+            f"SELECT * FROM {table};" for table in TABLE_NAMES
+        }
+
+    @patch.dict(os.environ, {"EXTRACTION_COLUMNS": "transform"})
+    @patch("src.extraction_lambda.main.get_s3_bucket_name")
+    @patch("src.extraction_lambda.main.boto3.client")
+    @patch("src.extraction_lambda.main.get_connection")
+    @patch("src.extraction_lambda.main.extract_data")
+    def test_audit_run_event_overrides_projection(
+        self,
+        mock_extract_data,
+        mock_get_connection,
+        mock_boto_client,
+        mock_get_s3_bucket_name,
+    ):
+        mock_extract_data.return_value = ("Continuous extraction", [], {})
+
+        lambda_handler({"columns": "all"}, {})
+
+        assert mock_extract_data.call_args[0][3].all_columns is True
+
+
+class TestChangeProbe:
+
+    def test_probe_is_one_query_for_all_tables(self):
+        conn = MagicMock()
+        conn.run.return_value = [
+            ["staff", 2, datetime(2025, 3, 6), None],
+            ["currency", 3, datetime(2025, 3, 1), "5d41402abc4b2a76"],
+        ]
+
+        probe = probe_table_changes(
+            conn,
+            {"staff": datetime(2025, 3, 5), "currency": None},
+            {"currency": "currency_id"},
+            {"staff": ("staff_id", [[7, "2025-03-05T10:00:00"]])},
+        )
+
+        conn.run.assert_called_once()
+        sql, params = conn.run.call_args[0][0], conn.run.call_args[1]
+        assert sql.count("UNION ALL") == 1
+        assert "WHERE last_updated >= :staff_since" in sql
+        assert "(staff_id, last_updated) NOT IN" in sql
+        assert "ORDER BY currency_id" in sql
+        assert params == {
+            "staff_since": datetime(2025, 3, 5),
+            "staff_boundary_ids": [7],
+            "staff_boundary_updated": ["2025-03-05T10:00:00"],
+        }
+        assert probe["staff"] == (2, datetime(2025, 3, 6), None)
+        assert probe["currency"][2] == "5d41402abc4b2a76"
+
+    @mock_aws
+    def test_late_commit_inside_overlap_window_is_detected(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        last_updated = datetime(2025, 3, 6, 13, 39, 12)
+        conn = FakeTotesysConnection({"staff": [[1, "Jeremie", last_updated]]})
+        extract_data(s3_client, conn, "test-bucket", ExtractionConfig(overlap=30))
+        # committed after the first run, with a last_updated before its watermark
+        conn.rows["staff"].append([2, "Deron", last_updated - timedelta(seconds=10)])
+
+        _, updated_tables, _ = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(overlap=30)
+        )
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        assert updated_tables == ["staff"]
+        assert manifest["tables"]["staff"]["row_count"] == 1
+
+    @mock_aws
+    def test_boundary_row_updated_again_inside_overlap_window_is_detected(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        last_updated = datetime(2025, 3, 6, 13, 39, 12)
+        conn = FakeTotesysConnection(
+            {
+                "staff": [
+                    [1, "Jeremie", last_updated],
+                    [2, "Deron", last_updated - timedelta(seconds=10)],
+                ]
+            }
+        )
+        extract_data(s3_client, conn, "test-bucket", ExtractionConfig(overlap=30))
+        # committed late: same number of rows, none after the watermark
+        conn.rows["staff"][1] = [2, "Deron", last_updated - timedelta(seconds=5)]
+
+        _, updated_tables, _ = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(overlap=30)
+        )
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        assert updated_tables == ["staff"]
+        assert manifest["tables"]["staff"]["row_count"] == 1
+
+    @mock_aws
+    def test_static_table_is_reread_when_its_content_changes(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        created = datetime(2022, 11, 3, 14, 20, 49)
+        conn = FakeTotesysConnection(
+            {"currency": [[1, "GBP", created], [2, "USD", created]]}
+        )
+        extract_data(s3_client, conn, "test-bucket")
+        first_checksum = read_manifest(s3_client, "test-bucket")[0]["tables"][
+            "currency"
+        ]["content_checksum"]
+
+        _, unchanged, _ = extract_data(s3_client, conn, "test-bucket")
+        # edited in place without touching last_updated
+        conn.rows["currency"][1] = [2, "EUR", created]
+        _, updated_tables, _ = extract_data(s3_client, conn, "test-bucket")
 
+        entry = read_manifest(s3_client, "test-bucket")[0]["tables"]["currency"]
+        assert unchanged == []
+        assert updated_tables == ["currency"]
+        assert entry["row_count"] == 2
+        assert entry["content_checksum"] != first_checksum
 
-class TestConnectionToDatabase:
 
-    # Use the collect credentials to obtain database AWS Secret
+class TestPushdown:
 
-    def test_connection_to_database_can_run_query(self):
-        db = connection_to_database()
-        query = "SELECT * FROM payment LIMIT 2;"
-        result = db.run(query)
+    @mock_aws
+    def test_joined_dimensions_replace_their_source_tables(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection(
+            {table: [[1, "example", datetime(2025, 3, 6)]] for table in TABLE_NAMES}
+        )
 
-        assert type(result) == list
-        assert len(result) == 2
+        _, updated_tables, table_formats = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(pushdown=True)
+        )
 
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        queries = [sql for sql, _ in conn.queries]
+        assert [sql for sql in queries if "JOIN" in sql] == [
+            query for _, query in PUSHDOWN_DIMENSIONS.values()
+        ]
+        assert not any(
+            f"FROM {table} " in sql or f"FROM {table};" in sql
+            for sql in queries
+            if "JOIN" not in sql
+            for table in PUSHDOWN_ONLY_TABLES
+        )
+        assert updated_tables == [
+            table for table in TABLE_NAMES if table not in PUSHDOWN_ONLY_TABLES
+        ] + ["dim_staff", "dim_counterparty"]
+        assert table_formats["dim_staff"] == "json"
+        assert manifest["tables"]["dim_staff"]["keys"][0].startswith("dim_staff/")
+        for table in PUSHDOWN_ONLY_TABLES:
+            assert manifest["tables"][table]["keys"] == []
+            assert manifest["tables"][table]["content_checksum"]
 
-class TestCheckForData:
+    @mock_aws
+    def test_dimension_is_rebuilt_only_when_a_source_changes(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection(
+            {table: [[1, "example", datetime(2025, 3, 6)]] for table in TABLE_NAMES}
+        )
+        extract_data(s3_client, conn, "test-bucket", ExtractionConfig(pushdown=True))
 
-    def test_check_for_data_returns_false_if_bucket_empty(self):
-        with mock_aws():
-            # create mock s3 bucket
-            s3_client = boto3.client("s3")
-            # function checks for data in mock s3 bucket
-            s3_client.create_bucket(
-                Bucket="TestBucket",
-                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
-            )
-            # call check for data
-            result = check_for_data(s3_client, bucket_name="TestBucket")
+        conn.queries.clear()
+        _, unchanged, _ = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(pushdown=True)
+        )
+        conn.rows["department"] = [[1, "renamed", datetime(2025, 3, 6)]]
+        _, updated_tables, _ = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(pushdown=True)
+        )
 
-            assert result == False
+        assert unchanged == []
+        assert updated_tables == ["dim_staff"]
+        assert [sql for sql, _ in conn.queries] == [PUSHDOWN_DIMENSIONS["dim_staff"][1]]
 
-    def test_check_for_data_returns_true_if_bucket_occupied(self):
-        with mock_aws():
-            # create mock s3 bucket
-            s3_client = boto3.client("s3")
-            # function checks for data in mock s3 bucket
-            s3_client.create_bucket(
-                Bucket="TestBucket",
-                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
-            )
-            # add data to mock s3 bucket
-            s3_client.put_object(Body="Test.txt", Bucket="TestBucket", Key="TestKey")
-            # call check for data
-            result = check_for_data(s3_client, bucket_name="TestBucket")
-            assert result == True
 
+class TestBootstrapTable:
 
-class TestUploadToS3:
+    staff_rows = [
+        [staff_id, f"staff {staff_id}", datetime(2025, 3, 6, 12, 0, staff_id)]
+        for staff_id in range(1, 8)
+    ]
 
     @mock_aws
-    def test_upload_to_s3_success(self):
-        """
-        Tests that `upload_to_s3` successfully uploads data to an S3 bucket and verifies
-        the uploaded content matches the original data.
-        """
-        bucket_name = "test-bucket"
-        object_name = "test-object.txt"
-        data = b"Sample data"
-
+    def test_initial_extraction_is_written_in_numbered_parts(self):
         s3_client = boto3.client("s3")
         s3_client.create_bucket(
-            Bucket=bucket_name,
+            Bucket="test-bucket",
             CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
         )
+        conn = FakeTotesysConnection({"staff": self.staff_rows})
 
-        upload_to_s3(data, bucket_name, object_name)
+        _, updated_tables, _ = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(chunk_size=3)
+        )
 
-        response = s3_client.get_object(Bucket=bucket_name, Key=object_name)
-        assert response["Body"].read() == data
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        entry = manifest["tables"]["staff"]
+        assert updated_tables == ["staff"]
+        assert [key.rsplit("/", 1)[1] for key in entry["keys"]] == [
+            "part-00001.json",
+            "part-00002.json",
+            "part-00003.json",
+        ]
+        assert entry["row_count"] == 7
+        assert entry["watermark"] == "2025-03-06T12:00:07"
+        assert "bootstrap" not in entry
+        staff_queries = [query for query in conn.queries if "FROM staff " in query[0]]
+        select = (
+            "SELECT staff_id, first_name, last_name, department_id, email_address, "
+            "last_updated FROM staff"
+        )
+        assert staff_queries == [
+            (f"{select} ORDER BY staff_id LIMIT :chunk_size", None),
+            (
+                f"{select} WHERE staff_id > :last_id ORDER BY staff_id LIMIT :chunk_size",
+                3,
+            ),
+            (
+                f"{select} WHERE staff_id > :last_id ORDER BY staff_id LIMIT :chunk_size",
+                6,
+            ),
+        ]
+        with patch("utils.lambda_utils.boto3.client", return_value=s3_client):
+            df = convert_json_to_df_from_s3("staff", "test-bucket", manifest=manifest)
+        assert list(df["staff_id"]) == list(range(1, 8))
 
     @mock_aws
-    def test_upload_to_s3_failure(self):
-        """
-        Verifies that `upload_to_s3` raises a `ClientError` when attempting to upload
-        to a non-existent S3 bucket.
-        """
-        bucket_name = "nonexistent-bucket"
-        object_name = "test-object.txt"
-        data = b"Sample data"
+    def test_interrupted_bootstrap_resumes_after_last_part(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection({"staff": self.staff_rows})
+
+        with patch(
+            "src.extraction_lambda.main.upload_to_s3",
+            side_effect=[None, TimeoutError("Task timed out")],
+        ):
+            with pytest.raises(TimeoutError):
+                extract_data(
+                    s3_client, conn, "test-bucket", ExtractionConfig(chunk_size=3)
+                )
+        progress, _ = read_manifest(s3_client, "test-bucket")
+        conn.queries.clear()
+
+        _, updated_tables, _ = extract_data(s3_client, conn, "test-bucket")
+
+        assert list(progress["tables"]) == ["staff"]
+        assert progress["tables"]["staff"]["bootstrap"]["last_id"] == 3
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        entry = manifest["tables"]["staff"]
+        assert "staff" in updated_tables
+        assert entry["row_count"] == 7
+        assert len(entry["keys"]) == 3
+        assert "bootstrap" not in entry
+        assert [query for query in conn.queries if "FROM staff " in query[0]][0][1] == 3
+
+
+class FakeLambdaContext:
+    """Stands in for the Lambda context; every look at the clock uses up ms_per_call."""
+
+    def __init__(self, remaining_ms, ms_per_call=1000):
+        self.remaining_ms = remaining_ms
+        self.ms_per_call = ms_per_call
+
+    def get_remaining_time_in_millis(self):
+        remaining, self.remaining_ms = (
+            self.remaining_ms,
+            self.remaining_ms - self.ms_per_call,
+        )
+        return remaining
 
-        with pytest.raises(ClientError):
-            upload_to_s3(data, bucket_name, object_name)
 
+class TestTimeBudget:
 
-class TestCreateFilename:
+    @pytest.fixture
+    def s3_client(self):
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            s3_client.create_bucket(
+                Bucket="test-bucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            yield s3_client
 
-    def test_create_filename(self):
-        """
-        Tests that `create_filename` generates the correct filename with a timestamp-based directory structure.
-        """
-        table_name = "test_table"
-        mock_datetime = datetime(2025, 2, 25, 15, 9, 26, 123456).strftime(
-            "%Y/%m/%d/%H:%M"
+    @staticmethod
+    def budget(checks):
+        """A budget that expires on its (checks + 1)th check."""
+        context = FakeLambdaContext(60500 + (checks - 1) * 1000)
+        return TimeBudget(context.get_remaining_time_in_millis, reserve=60)
+
+    @staticmethod
+    def extracted_tables(conn):
+        return [re.search(r"FROM (\w+)", sql).group(1) for sql, _ in conn.queries]
+
+    def test_budget_stays_expired_once_it_runs_out(self):
+        remaining = iter([61000, 60000, 59999, 120000])
+        budget = TimeBudget(lambda: next(remaining), reserve=60)
+
+        assert [budget.expired() for _ in range(4)] == [False, False, True, True]
+        assert budget.stopped
+
+    def test_tables_left_over_are_checkpointed_and_extracted_first(self, s3_client):
+        conn = FakeTotesysConnection(
+            {table: [[1, "example", datetime(2025, 3, 6)]] for table in TABLE_NAMES}
         )
-        expected_filename = "test_table/2025/02/25/15:09.json"
-        result = create_filename(table_name, mock_datetime)
-        assert result == expected_filename
+        budget = self.budget(checks=4)
 
+        _, updated_tables, _ = extract_data(
+            s3_client, conn, "test-bucket", budget=budget
+        )
 
-class TestFormatDataToJson:
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        assert updated_tables == TABLE_NAMES[:4]
+        assert budget.pending == TABLE_NAMES[4:]
+        assert manifest["checkpoint"]["pending"] == TABLE_NAMES[4:]
+        assert sorted(manifest["tables"]) == sorted(TABLE_NAMES[:4])
+
+        conn.rows["address"] = [[1, "example", datetime(2025, 3, 7)]]
+        conn.queries.clear()
+        _, updated_tables, _ = extract_data(s3_client, conn, "test-bucket")
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        assert self.extracted_tables(conn) == TABLE_NAMES[4:] + ["address"]
+        assert sorted(updated_tables) == sorted(TABLE_NAMES[4:] + ["address"])
+        assert manifest["checkpoint"] is None
+
+    def test_bootstrap_stops_between_chunks_and_resumes(self, s3_client):
+        conn = FakeTotesysConnection({"staff": TestBootstrapTable.staff_rows})
+        # one check before each table up to staff, the next after its first chunk
+        budget = self.budget(checks=TABLE_NAMES.index("staff") + 1)
+
+        _, updated_tables, _ = extract_data(
+            s3_client,
+            conn,
+            "test-bucket",
+            ExtractionConfig(chunk_size=3),
+            budget=budget,
+        )
 
-    def test_format_data_to_json(self):
-        """
-        Verify that format_data_to_json correctly converts rows and columns into
-        a JSON-formatted bytes object, handling various data types such as datetime
-        and Decimal.
-        """
+        progress, _ = read_manifest(s3_client, "test-bucket")
+        assert updated_tables == []
+        assert budget.pending == ["staff", "department", "purchase_order"]
+        assert progress["tables"]["staff"]["bootstrap"]["last_id"] == 3
+
+        conn.queries.clear()
+        _, updated_tables, _ = extract_data(s3_client, conn, "test-bucket")
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        entry = manifest["tables"]["staff"]
+        assert self.extracted_tables(conn)[0] == "staff"
+        assert conn.queries[0][1] == 3
+        assert "staff" in updated_tables
+        assert entry["row_count"] == 7
+        assert "bootstrap" not in entry
+        assert manifest["checkpoint"] is None
+
+    def test_stream_cut_short_ends_on_a_watermark(self, s3_client):
         rows = [
-            (1, "Alice", datetime(2025, 2, 26, 14, 33), Decimal("100.00")),
-            (2, "Bob", datetime(2025, 2, 27, 15, 40), Decimal("200.50")),
-        ]
-        columns = ["id", "name", "timestamp", "amount"]
-        expected_data = [
-            {
-                "id": 1,
-                "name": "Alice",
-                "timestamp": "2025-02-26T14:33:00",
-                "amount": 100.00,
-            },
-            {
-                "id": 2,
-                "name": "Bob",
-                "timestamp": "2025-02-27T15:40:00",
-                "amount": 200.50,
-            },
+            [order_id, "example", datetime(2025, 3, 6, 12, 0, order_id)]
+            for order_id in range(1, 4)
         ]
+        conn = FakeTotesysConnection({"sales_order": rows})
+        # one check before each table up to sales_order, the next after one batch
+        budget = self.budget(checks=TABLE_NAMES.index("sales_order") + 1)
+
+        _, updated_tables, _ = extract_data(
+            s3_client,
+            conn,
+            "test-bucket",
+            ExtractionConfig(batch_size=1),
+            budget=budget,
+        )
 
-        result = format_data_to_json(rows, columns)
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        entry = manifest["tables"]["sales_order"]
+        stream_query = [sql for sql, _ in conn.queries if "sales_order" in sql][0]
+        assert stream_query.endswith("ORDER BY last_updated, sales_order_id")
+        assert updated_tables == ["sales_order"]
+        assert budget.pending[0] == "sales_order"
+        assert entry["row_count"] == 1
+        assert entry["watermark"] == "2025-03-06T12:00:01"
+
+        extract_data(s3_client, conn, "test-bucket", ExtractionConfig(batch_size=1))
+
+        manifest, _ = read_manifest(s3_client, "test-bucket")
+        entry = manifest["tables"]["sales_order"]
+        body = s3_client.get_object(Bucket="test-bucket", Key=entry["keys"][0])["Body"]
+        assert [row["sales_order_id"] for row in json.loads(body.read())] == [2, 3]
+        assert entry["watermark"] == "2025-03-06T12:00:03"
+
+    def test_parallel_extraction_stops_handing_out_tables(self, s3_client):
+        budget = self.budget(checks=2)
+
+        _, updated_tables, _ = extract_data(
+            s3_client,
+            FakeSnapshotConnection(),
+            "test-bucket",
+            ExtractionConfig(max_workers=2),
+            connection_factory=FakeSnapshotConnection,
+            budget=budget,
+        )
 
-        # Decode the result back to JSON object
-        result_data = json.loads(result.decode("utf-8"))
+        assert updated_tables == TABLE_NAMES[:3]
+        assert budget.pending == TABLE_NAMES[3:]
 
-        # Assert that the resulting JSON data matches the expected data
-        assert result_data == expected_data
+    @patch("src.extraction_lambda.main.get_s3_bucket_name")
+    @patch("src.extraction_lambda.main.boto3.client")
+    @patch("src.extraction_lambda.main.connection_to_database")
+    @patch("src.extraction_lambda.main.extract_data")
+    def test_handler_writes_partial_report(
+        self,
+        mock_extract_data,
+        mock_connection_to_database,
+        mock_boto_client,
+        mock_get_s3_bucket_name,
+    ):
+        mock_get_s3_bucket_name.return_value = "data-squid-ingest-bucket-1"
+        mock_s3_client = MagicMock()
+        mock_boto_client.return_value = mock_s3_client
+        results = iter(
+            [
+                (["address"], ["staff"]),
+                ([], ["staff"]),
+            ]
+        )
+
+        def extract(*args, budget, **kwargs):
+            updated_tables, budget.pending = next(results)
+            return "Continuous extraction", updated_tables, {}
+
+        mock_extract_data.side_effect = extract
+        close_connection()
+
+        with patch.dict(os.environ, {"EXTRACTION_TIME_RESERVE_SECONDS": "90"}):
+            first = lambda_handler({}, FakeLambdaContext(900000))
+            second = lambda_handler({}, FakeLambdaContext(900000))
+        close_connection()
+
+        assert mock_extract_data.call_args.kwargs["budget"].reserve == 90
+        reports = [call.kwargs for call in mock_s3_client.put_object.call_args_list]
+        assert first["result"] == second["result"] == "Partial"
+        # only the report with updated tables triggers the transform lambda
+        assert reports[0]["Key"].endswith("_success.json")
+        assert reports[1]["Key"].endswith("_partial.json")
+        assert json.loads(reports[0]["Body"]) == {
+            "status": "Partial",
+            "extraction_type": "Continuous extraction",
+            "updated_tables": ["address"],
+            "table_formats": {},
+            "pending_tables": ["staff"],
+        }
 
 
 class TestExtractData:
 
     @patch("src.extraction_lambda.main.check_for_data")
-    @patch("src.extraction_lambda.main.s3_client")
-    @patch("src.extraction_lambda.main.conn")
-    @patch("src.extraction_lambda.main.format_data_to_json")
+    @patch("src.extraction_lambda.main.encode_rows_to_json")
     @patch("src.extraction_lambda.main.create_filename")
     @patch("src.extraction_lambda.main.upload_to_s3")
+    @patch("src.extraction_lambda.main.read_manifest")
     def test_extract_data(
         self,
+        mock_read_manifest,
         mock_upload_to_s3,
         mock_create_filename,
-        mock_format_data_to_json,
-        mock_conn,
-        mock_s3_client,
+        mock_encode_rows_to_json,
         mock_check_for_data,
     ):
         """
         Test the extract_data function for continuous extraction with mocks.
         """
-        mock_conn.run.return_value = [{"id": 1, "name": "example"}]
-        mock_conn.columns = [{"name": "id"}, {"name": "name"}]
+        mock_s3_client = MagicMock()
         mock_check_for_data.return_value = True
+        mock_read_manifest.return_value = ({"version": 0, "tables": {}}, None)
         mock_s3_client.get_object.return_value = {
             "Body": MagicMock(read=lambda: b"2023/02/24/10:00")
         }
-        mock_format_data_to_json.return_value = json.dumps(
-            [{"id": 1, "name": "example"}]
-        ).encode("utf-8")
+        mock_encode_rows_to_json.return_value = (
+            json.dumps([{"id": 1, "name": "example"}]).encode("utf-8"),
+            1,
+        )
         mock_create_filename.return_value = "testfile.json"
 
         bucket_name = "test-bucket"
         s3_client = mock_s3_client
-        conn = mock_conn
+        last_updated = datetime(2025, 3, 6, 13, 39, 12, 345678)
+        conn = FakeTotesysConnection(
+            {table: [[1, "example", last_updated]] for table in TABLE_NAMES}
+        )
 
         table_names = [
             "address",
@@ -230,7 +1825,9 @@ class TestExtractData:
             "purchase_order",
         ]
 
-        extraction_type, result_message = extract_data(s3_client, conn, bucket_name)
+        extraction_type, result_message, table_formats = extract_data(
+            s3_client, conn, bucket_name
+        )
 
         assert extraction_type == "Continuous extraction"
         assert result_message == table_names
@@ -238,47 +1835,49 @@ class TestExtractData:
         # Ensure that upload_to_s3 was called for each table
         assert mock_upload_to_s3.call_count == 11
 
-        # Verify that the last_extracted timestamp is correctly formatted
-        last_extracted = datetime.now().strftime("%Y/%m/%d/%H:%M")
-        actual_last_extracted_call = mock_s3_client.put_object.call_args[1][
-            "Body"
-        ].decode("utf-8")
-        print(actual_last_extracted_call, "<<< last extracted call")
-        print(
-            mock_s3_client.put_object.call_args[1],
-            "<<< mock s3 client put object call args",
-        )
-        assert actual_last_extracted_call.startswith(last_extracted[:15])
+        # Verify that the manifest was written once with the highest last_updated extracted
+        mock_s3_client.put_object.assert_called_once()
+        manifest_call = mock_s3_client.put_object.call_args[1]
+        assert manifest_call["Key"] == MANIFEST_KEY
+        assert manifest_call["IfNoneMatch"] == "*"
+        manifest = json.loads(manifest_call["Body"])
+        assert list(manifest["tables"]) == table_names
+        for entry in manifest["tables"].values():
+            assert entry["watermark"] == "2025-03-06T13:39:12.345678"
+            assert entry["boundary"] == [[1, "2025-03-06T13:39:12.345678"]]
+            assert entry["row_count"] == 1
 
     @patch("src.extraction_lambda.main.check_for_data")
-    @patch("src.extraction_lambda.main.s3_client")
-    @patch("src.extraction_lambda.main.conn")
-    @patch("src.extraction_lambda.main.format_data_to_json")
+    @patch("src.extraction_lambda.main.encode_rows_to_json")
     @patch("src.extraction_lambda.main.create_filename")
     @patch("src.extraction_lambda.main.upload_to_s3")
+    @patch("src.extraction_lambda.main.read_manifest")
     def test_initial_extraction(
         self,
+        mock_read_manifest,
         mock_upload_to_s3,
         mock_create_filename,
-        mock_format_data_to_json,
-        mock_conn,
-        mock_s3_client,
+        mock_encode_rows_to_json,
         mock_check_for_data,
     ):
         """
         Test the extract_data function for initial extraction with mocks.
         """
-        mock_conn.run.return_value = [{"id": 1, "name": "example"}]
-        mock_conn.columns = [{"name": "id"}, {"name": "name"}]
+        mock_s3_client = MagicMock()
         mock_check_for_data.return_value = False  # No data available
-        mock_format_data_to_json.return_value = json.dumps(
-            [{"id": 1, "name": "example"}]
-        ).encode("utf-8")
+        mock_read_manifest.return_value = ({"version": 0, "tables": {}}, None)
+        mock_encode_rows_to_json.return_value = (
+            json.dumps([{"id": 1, "name": "example"}]).encode("utf-8"),
+            1,
+        )
         mock_create_filename.return_value = "testfile.json"
 
         bucket_name = "test-bucket"
         s3_client = mock_s3_client
-        conn = mock_conn
+        last_updated = datetime(2025, 3, 6, 13, 39, 12, 345678)
+        conn = FakeTotesysConnection(
+            {table: [[1, "example", last_updated]] for table in TABLE_NAMES}
+        )
 
         table_names = [
             "address",
@@ -294,7 +1893,9 @@ class TestExtractData:
             "purchase_order",
         ]
 
-        extraction_type, result_message = extract_data(s3_client, conn, bucket_name)
+        extraction_type, result_message, table_formats = extract_data(
+            s3_client, conn, bucket_name
+        )
 
         assert extraction_type == "Initial extraction"
         assert result_message == table_names
@@ -302,16 +1903,216 @@ class TestExtractData:
         # Ensure that upload_to_s3 was called for each table
         assert mock_upload_to_s3.call_count == 11
 
-        # Verify that the last_extracted timestamp is correctly formatted
-        last_extracted = datetime.now().strftime("%Y/%m/%d/%H:%M")
-        actual_last_extracted_call = mock_s3_client.put_object.call_args[1][
-            "Body"
-        ].decode("utf-8")
-        assert actual_last_extracted_call.startswith(last_extracted[:15])
+        # Verify that the manifest was written once with the highest last_updated extracted
+        mock_s3_client.put_object.assert_called_once()
+        manifest_call = mock_s3_client.put_object.call_args[1]
+        assert manifest_call["Key"] == MANIFEST_KEY
+        assert manifest_call["IfNoneMatch"] == "*"
+        manifest = json.loads(manifest_call["Body"])
+        assert list(manifest["tables"]) == table_names
+        for entry in manifest["tables"].values():
+            assert entry["watermark"] == "2025-03-06T13:39:12.345678"
+            assert entry["boundary"] == [[1, "2025-03-06T13:39:12.345678"]]
+            assert entry["row_count"] == 1
+
+    @patch("src.extraction_lambda.main.check_for_data")
+    @patch("src.extraction_lambda.main.stream_table_to_s3")
+    def test_streaming_extraction_only_marks_tables_with_rows(
+        self, mock_stream_table_to_s3, mock_check_for_data
+    ):
+        """
+        Test that extract_data streams each table when a batch size is given.
+        """
+        mock_check_for_data.return_value = True
+        mock_s3_client = MagicMock()
+        manifest = {
+            "version": 4,
+            "tables": {
+                table: manifest_entry([], 0, None, "2023/02/24/10:00")
+                for table in TABLE_NAMES
+            },
+        }
+        mock_s3_client.get_object.return_value = {
+            "Body": MagicMock(read=lambda: json.dumps(manifest).encode("utf-8")),
+            "ETag": '"manifest-etag"',
+        }
+        mock_stream_table_to_s3.side_effect = lambda *args, **kwargs: (
+            5 if args[4].startswith("staff/") else 0
+        )
+        mock_conn = MagicMock()
+
+        extraction_type, updated_tables, table_formats = extract_data(
+            mock_s3_client, mock_conn, "test-bucket", ExtractionConfig(batch_size=1000)
+        )
+
+        assert extraction_type == "Continuous extraction"
+        assert updated_tables == ["staff"]
+        assert table_formats == {"staff": "json"}
+        assert mock_stream_table_to_s3.call_count == 11
+        assert mock_stream_table_to_s3.call_args[0][5] == 1000
+        assert mock_stream_table_to_s3.call_args[1]["params"] == {
+            "since": datetime(2023, 2, 24, 10, 0)
+        }
+        # the change probe, which a MagicMock answers with no rows
+        mock_conn.run.assert_called_once()
+        mock_s3_client.get_object.assert_called_once()
+        mock_s3_client.put_object.assert_called_once()
+        manifest_call = mock_s3_client.put_object.call_args[1]
+        assert manifest_call["Key"] == MANIFEST_KEY
+        assert manifest_call["IfMatch"] == '"manifest-etag"'
+        written = json.loads(manifest_call["Body"])
+        assert written["version"] == 5
+        assert written["tables"]["staff"]["row_count"] == 5
+        assert written["tables"]["staff"]["keys"][0].startswith("staff/")
+        assert written["tables"]["design"]["watermark"] == "2023/02/24/10:00"
+
+    @mock_aws
+    def test_parquet_extraction_writes_pqt_objects_and_reports_format(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        conn = FakeTotesysConnection(
+            {table: [[1, "GBP", datetime(2025, 3, 6)]] for table in TABLE_NAMES}
+        )
+
+        _, updated_tables, table_formats = extract_data(
+            s3_client, conn, "test-bucket", ExtractionConfig(file_format="parquet")
+        )
+
+        assert updated_tables == TABLE_NAMES
+        assert set(table_formats.values()) == {"parquet"}
+        keys = [
+            obj["Key"]
+            for obj in s3_client.list_objects_v2(
+                Bucket="test-bucket", Prefix="currency/"
+            )["Contents"]
+        ]
+        data_key = next(key for key in keys if key.endswith(".pqt"))
+        body = s3_client.get_object(Bucket="test-bucket", Key=data_key)["Body"].read()
+        df = pd.read_parquet(io.BytesIO(body))
+        assert df["name"][0] == "GBP"
+
+
+class FakeDatabaseConnection(FakeTotesysConnection):
+    """A totesys connection that takes connect_seconds to open and can be dropped."""
+
+    opened = 0
+
+    def __init__(self, connect_seconds=0, **credentials):
+        time.sleep(connect_seconds)
+        FakeDatabaseConnection.opened += 1
+        super().__init__()
+        self.credentials = credentials
+        self.alive = True
+        self.closed = False
+
+    def run(self, sql, **params):
+        if not self.alive:
+            raise pg8000.exceptions.InterfaceError("network error")
+        if sql == "SELECT 1":
+            return [[1]]
+        return super().run(sql, **params)
+
+    def close(self):
+        self.closed = True
+
+
+class TestWarmConnection:
+
+    @pytest.fixture(autouse=True)
+    def fresh_environment(self):
+        close_connection()
+        clear_credentials_cache()
+        FakeDatabaseConnection.opened = 0
+        yield
+        close_connection()
+        clear_credentials_cache()
+
+    def test_connection_is_alive(self):
+        conn = FakeDatabaseConnection()
+        assert connection_is_alive(conn)
+
+        conn.alive = False
+        assert not connection_is_alive(conn)
+
+    @patch("src.extraction_lambda.main.connection_to_database")
+    def test_connection_is_reused_while_alive(self, mock_connection_to_database):
+        mock_connection_to_database.side_effect = FakeDatabaseConnection
+
+        first = get_connection()
+        second = get_connection()
+
+        assert first is second
+        assert mock_connection_to_database.call_count == 1
+
+    @patch("src.extraction_lambda.main.connection_to_database")
+    def test_dead_connection_is_replaced(self, mock_connection_to_database):
+        mock_connection_to_database.side_effect = FakeDatabaseConnection
+        first = get_connection()
+        first.alive = False
+
+        second = get_connection()
+
+        assert second is not first
+        assert first.closed
+        assert connection_is_alive(second)
+
+    @mock_aws
+    @patch.dict(os.environ, {"EXTRACTION_OVERLAP_SECONDS": "0"})
+    def test_warm_invocation_skips_secret_and_connect(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="data-squid-ingest-bucket-1",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        secret = {
+            "username": "u",
+            "password": "p",
+            "dbname": "totesys",
+            "host": "localhost",
+            "port": 5432,
+        }
+        boto3.client("secretsmanager").create_secret(
+            Name="totesys", SecretString=json.dumps(secret)
+        )
+
+        def connect(**credentials):
+            return FakeDatabaseConnection(connect_seconds=0.5, **credentials)
+
+        latencies = []
+        # as timeit does, keep a garbage collection pause out of the timings
+        gc.disable()
+        with patch("pg8000.native.Connection", side_effect=connect), patch(
+            "utils.common.collect_credentials_from_AWS",
+            wraps=collect_credentials_from_AWS,
+        ) as mock_collect, patch(
+            "src.extraction_lambda.main.connection_to_database",
+            lambda: connection_to_database("totesys"),
+        ):
+            try:
+                for _ in range(3):
+                    start = time.perf_counter()
+                    lambda_handler({}, {})
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+
+        cold, warm = latencies[0], max(latencies[1:])
+        assert mock_collect.call_count == 1
+        assert FakeDatabaseConnection.opened == 1
+        assert cold - warm > 0.3
 
 
 class TestLambdaHandler:
 
+    @pytest.fixture(autouse=True)
+    def no_kept_connection(self):
+        close_connection()
+        yield
+        close_connection()
+
     @patch("src.extraction_lambda.main.get_s3_bucket_name")
     @patch("src.extraction_lambda.main.boto3.client")
     @patch("src.extraction_lambda.main.connection_to_database")
@@ -335,6 +2136,7 @@ class TestLambdaHandler:
         mock_extract_data.return_value = (
             "Initial extraction",
             "Tables extracted - ['address', 'counterparty', 'design', 'sales_order', 'transaction', 'payment', 'payment_type', 'currency', 'staff', 'department', 'purchase_order']",
+            {},
         )
 
         result = lambda_handler({}, {})
@@ -343,6 +2145,9 @@ class TestLambdaHandler:
             mock_s3_client,
             mock_conn,
             "data-squid-ingest-bucket-20250225123034817500000001",
+            ExtractionConfig(compression="none"),
+            connection_factory=mock_connection_to_database,
+            budget=None,
         )
         mock_s3_client.put_object.assert_called_once()
 
@@ -388,7 +2193,35 @@ class TestLambdaHandler:
         result = lambda_handler({}, {})
 
         assert result["result"] == "Failure"
-        assert result["error"] == "Error updating last_extracted.txt"
+        assert result["error"] == "Error during ExtractData"
+
+    @patch("src.extraction_lambda.main.get_s3_bucket_name")
+    @patch("src.extraction_lambda.main.boto3.client")
+    @patch("src.extraction_lambda.main.connection_to_database")
+    @patch("src.extraction_lambda.main.extract_data")
+    def test_client_error_names_the_failed_operation(
+        self,
+        mock_extract_data,
+        mock_connection_to_database,
+        mock_boto_client,
+        mock_get_s3_bucket_name,
+    ):
+        mock_get_s3_bucket_name.return_value = (
+            "data-squid-ingest-bucket-20250225123034817500000001"
+        )
+        mock_s3_client = MagicMock()
+        mock_s3_client.put_object.side_effect = ClientError(
+            {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}},
+            "PutObject",
+        )
+        mock_boto_client.return_value = mock_s3_client
+        mock_connection_to_database.return_value = MagicMock()
+        mock_extract_data.return_value = ("Incremental", ["staff"], {"staff": "json"})
+
+        result = lambda_handler({}, {})
+
+        # the report upload failed, not the manifest write
+        assert result == {"result": "Failure", "error": "Error during PutObject"}
 
     @patch("src.extraction_lambda.main.get_s3_bucket_name")
     @patch("src.extraction_lambda.main.boto3.client")
@@ -436,7 +2269,11 @@ class TestLambdaHandler:
         mock_conn = MagicMock()
         mock_connection_to_database.return_value = mock_conn
 
-        mock_extract_data.return_value = ("incremental", ["table1", "table2"])
+        mock_extract_data.return_value = (
+            "incremental",
+            ["table1", "table2"],
+            {"table1": "json", "table2": "json"},
+        )
 
         result = lambda_handler({}, {})
 
@@ -5,8 +5,13 @@ import os
 import pytest
 import pandas as pd
 import json
+import datetime
 from unittest.mock import patch, MagicMock, Mock
-from utils.lambda_utils import connect_to_warehouse, insert_data_to_table
+from utils.lambda_utils import (
+    connect_to_warehouse,
+    insert_data_to_table,
+    manifest_entry,
+)
 from src.load_lambda.main import lambda_handler
 
 
@@ -47,11 +52,41 @@ class TestParquetToDataframe:
             assert isinstance(expected_result, pd.DataFrame)
             assert expected_output.to_string() == expected_result.to_string()
 
+    @mock_aws
+    def test_manifest_entry_is_used_instead_of_last_transformed(self):
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        df = pd.DataFrame.from_dict({"column1": ["value1", "value2"]})
+        s3_client.put_object(
+            Body=df.to_parquet(),
+            Bucket="test-bucket",
+            Key="dim_staff/2025/03/06/13:39.pqt",
+        )
+        manifest = {
+            "version": 1,
+            "tables": {
+                "dim_staff": manifest_entry(
+                    ["dim_staff/2025/03/06/13:39.pqt"],
+                    2,
+                    None,
+                    "2025/03/06/13:39",
+                    "parquet",
+                )
+            },
+        }
+
+        output = parquet_to_dataframe("test-bucket", "dim_staff", manifest=manifest)
+
+        assert output.to_string() == df.to_string()
+
 
 class TestConnectToWarehouse:
 
     @patch("utils.lambda_utils.boto3.client")
-    @patch("utils.lambda_utils.pg8000.connect")
+    @patch("utils.load.pg8000.connect")
     def test_connect_to_warehouse(self, mock_pg8000_connect, mock_boto3_client):
         """
         Tests the connect_to_warehouse function by mocking Secrets Manager client
@@ -71,7 +106,7 @@ class TestConnectToWarehouse:
             "SecretString": '{"username": "test_user", "password": "test_pass", "dbname": "test_db", "host": "test_host", "port": 5432}'
         }
         with patch(
-            "utils.lambda_utils.collect_credentials_from_AWS",
+            "utils.load.collect_credentials_from_AWS",
             return_value={
                 "username": "test_user",
                 "password": "test_pass",
@@ -143,6 +178,88 @@ class TestInsertDataToTable:
         mock_conn.commit.assert_called_once()
         mock_cursor.close.assert_called_once()
 
+    def test_registry_tables_are_inserted_in_warehouse_order_and_types(self, mock_conn):
+        """Test a registry table's columns are ordered and typed by the registry."""
+        df = pd.DataFrame(
+            {
+                "year": [2025],
+                "date_id": [pd.Timestamp("2025-03-06")],
+                "month": [3],
+                "day": [6],
+                "day_of_week": [3],
+                "day_name": ["Thursday"],
+                "month_name": ["March"],
+                "quarter": [1],
+            }
+        )
+
+        insert_data_to_table(mock_conn, "dim_date", df)
+
+        query, values = mock_conn.cursor.return_value.execute.call_args.args
+        assert "(date_id, year, month, day, day_of_week, day_name" in query
+        assert values == (
+            datetime.date(2025, 3, 6),
+            2025,
+            3,
+            6,
+            3,
+            "Thursday",
+            "March",
+            1,
+        )
+
+    def test_dim_date_extension_reaches_a_table_without_date_key(self, mock_conn):
+        """Columns the warehouse table does not have yet are left out of the insert."""
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.fetchall.return_value = [
+            (column,)
+            for column in (
+                "date_id",
+                "year",
+                "month",
+                "day",
+                "day_of_week",
+                "day_name",
+                "month_name",
+                "quarter",
+            )
+        ]
+        df = pd.DataFrame(
+            {
+                "date_id": pd.to_datetime(["2026-01-01", "2026-01-02"]),
+                "year": [2026, 2026],
+                "month": [1, 1],
+                "day": [1, 2],
+                "day_of_week": [3, 4],
+                "day_name": ["Thursday", "Friday"],
+                "month_name": ["January", "January"],
+                "quarter": [1, 1],
+                "date_key": [20260101, 20260102],
+            }
+        )
+
+        insert_data_to_table(mock_conn, "dim_date", df)
+
+        inserts = [
+            call.args
+            for call in mock_cursor.execute.call_args_list
+            if "INSERT INTO dim_date" in call.args[0]
+        ]
+        assert len(inserts) == 2
+        assert all("date_key" not in query for query, _ in inserts)
+        assert inserts[1][1] == (
+            datetime.date(2026, 1, 2),
+            2026,
+            1,
+            2,
+            4,
+            "Friday",
+            "January",
+            1,
+        )
+        mock_conn.commit.assert_called_once()
+        mock_conn.rollback.assert_not_called()
+
 
 class TestLoadLambdaHandler:
 
@@ -165,8 +282,10 @@ class TestLoadLambdaHandler:
     @patch("src.load_lambda.main.connect_to_warehouse")
     @patch("src.load_lambda.main.parquet_to_dataframe")
     @patch("src.load_lambda.main.insert_data_to_table")
+    @patch("src.load_lambda.main.read_manifest")
     def test_lambda_handler_success(
         self,
+        mock_read_manifest,
         mock_insert_data_to_table,
         mock_parquet_to_dataframe,
         mock_connect_to_warehouse,
@@ -178,6 +297,8 @@ class TestLoadLambdaHandler:
         mock_extract_tablenames_load.return_value = ["dim_date", "dim_staff"]
         mock_connect_to_warehouse.return_value = Mock()
         mock_parquet_to_dataframe.return_value = Mock()
+        manifest = {"version": 1, "tables": {}}
+        mock_read_manifest.return_value = (manifest, '"etag"')
 
         # Invoke the lambda handler
         context = {}
@@ -195,6 +316,10 @@ class TestLoadLambdaHandler:
         )
         mock_connect_to_warehouse.assert_called_once()
         assert mock_parquet_to_dataframe.call_count == 2  # Called for each valid table
+        mock_parquet_to_dataframe.assert_any_call(
+            "test_bucket", "dim_staff", manifest=manifest
+        )
+        mock_read_manifest.assert_called_once()
         assert mock_insert_data_to_table.call_count == 2  # Called for each valid table
 
         # Assert the response
@@ -229,28 +354,54 @@ class TestLoadLambdaHandler:
         assert response["statusCode"] == 400
         assert "Invalid event format" in response["body"]
 
-
     def test_lambda_handler_invalid_records(self):
         event = {"Records": [{"s3": {}}]}  # Missing 'object' key
         response = lambda_handler(event, None)
         assert response["statusCode"] == 400
         assert "Invalid event format" in response["body"]
 
-
-
     def test_lambda_handler_extract_tablenames_error(self, mocker):
-        event = {"Records": [{"s3": {"object": {"key": "valid_key"}, "bucket": {"name": "valid_bucket"}}}]}
-        mocker.patch("src.load_lambda.main.extract_tablenames_load", side_effect=Exception("Extraction error"))
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "object": {"key": "valid_key"},
+                        "bucket": {"name": "valid_bucket"},
+                    }
+                }
+            ]
+        }
+        mocker.patch(
+            "src.load_lambda.main.extract_tablenames_load",
+            side_effect=Exception("Extraction error"),
+        )
         response = lambda_handler(event, None)
         assert response["statusCode"] == 500
         assert "Error extracting table names" in response["body"]
 
-
     @patch("src.load_lambda.main.logger")
-    @patch("src.load_lambda.main.connect_to_warehouse", side_effect=Exception("Connection error"))
+    @patch(
+        "src.load_lambda.main.connect_to_warehouse",
+        side_effect=Exception("Connection error"),
+    )
     @patch("src.load_lambda.main.extract_tablenames_load", return_value=["valid_table"])
-    def test_lambda_handler_database_connection_error(self, mock_extract, mock_connect, mock_logger):
-        event = {"Records": [{"s3": {"object": {"key": "valid_key"}, "bucket": {"name": "valid_bucket"}}}]}
+    @patch(
+        "src.load_lambda.main.read_manifest",
+        return_value=({"version": 0, "tables": {}}, None),
+    )
+    def test_lambda_handler_database_connection_error(
+        self, mock_read_manifest, mock_extract, mock_connect, mock_logger
+    ):
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "object": {"key": "valid_key"},
+                        "bucket": {"name": "valid_bucket"},
+                    }
+                }
+            ]
+        }
 
         # Call the lambda_handler function with the mock event
         response = lambda_handler(event, None)
@@ -260,8 +411,6 @@ class TestLoadLambdaHandler:
         assert "Error connecting to the data warehouse" in response["body"]
 
         # Verify the error was logged
-        mock_logger.error.assert_called_once_with("Error connecting to the warehouse: %s", "Connection error")
-
-
-
-    
\ No newline at end of file
+        mock_logger.error.assert_called_once_with(
+            "Error connecting to the warehouse: %s", "Connection error"
+        )
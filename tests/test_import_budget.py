@@ -0,0 +1,60 @@
+"""
+Cold-start import budget for each lambda handler module, measured in a fresh
+interpreter (as on a Lambda cold start) rather than in the already-warm test
+process.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "numpy", "fastparquet", "pg8000"]
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, runs=3):
+    """Returns the fastest of several cold imports of module and the heavy modules it loaded."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE="1")
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                MEASURE.format(module=module, heavy=HEAVY_MODULES),
+            ],
+            cwd=REPO_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return min(result["seconds"] for result in results), results[0]["loaded"]
+
+
+@pytest.mark.parametrize(
+    "module, budget_seconds, allowed",
+    [
+        ("src.extraction_lambda.main", 1.0, []),
+        ("src.transform_lambda.main", 3.0, ["pandas", "numpy", "fastparquet"]),
+        ("src.load_lambda.main", 3.0, ["pandas", "numpy", "fastparquet", "pg8000"]),
+    ],
+)
+def test_handler_import_stays_within_cold_start_budget(module, budget_seconds, allowed):
+    seconds, loaded = measure_import(module)
+
+    assert set(loaded) <= set(allowed)
+    assert seconds < budget_seconds
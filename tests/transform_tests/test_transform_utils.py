@@ -10,20 +10,43 @@ from utils.lambda_utils import (
     fact_sales_order,
     dataframe_to_parquet,
     format_data_to_json,
+    format_data_to_parquet,
     create_filename,
     upload_to_s3,
     extract_tablenames_load,
+    create_filename_for_parquet,
+    manifest_entry,
+    merge_snapshot,
+    read_ingested_history,
+    read_manifest,
+    compact_dataframe,
+    conform_dataframe,
+    frame_memory_mib,
+    parse_parquet_profiles,
+    PARQUET_PROFILES,
 )
-from src.transform_lambda.main import extract_tablenames, lambda_handler
-from unittest.mock import patch
+from src.transform_lambda.main import (
+    calendar_extension,
+    extract_tablenames,
+    lambda_handler,
+    plan_transforms,
+    run_transforms,
+    TransformConfig,
+    TRANSFORMS,
+)
+from src.extraction_lambda.main import select_list
+from unittest.mock import MagicMock, patch
 import boto3
 import pytest
 import os
 import json
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
+import numpy as np
 import pandas as pd
+import threading
 import io
+import fastparquet
 from unittest.mock import patch, MagicMock
 import json
 
@@ -72,6 +95,149 @@ class TestGetFile:
             assert type(return_val) == pd.core.frame.DataFrame
 
 
+class TestGetFileFromManifest:
+    def test_manifest_keys_are_read_without_last_extracted(self):
+        columns = ["id", "name"]
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            s3_client.create_bucket(
+                Bucket="TestBucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            keys = [
+                "test_table/2025/03/06/13:39.json",
+                "test_table/2025/03/06/13:39-2.json",
+            ]
+            upload_to_s3(
+                data=format_data_to_json([(1, "Alice")], columns),
+                bucket_name="TestBucket",
+                object_name=keys[0],
+            )
+            upload_to_s3(
+                data=format_data_to_json([(2, "Bob")], columns),
+                bucket_name="TestBucket",
+                object_name=keys[1],
+            )
+            manifest = {
+                "version": 1,
+                "tables": {
+                    "test_table": manifest_entry(keys, 2, None, "2025/03/06/13:39")
+                },
+            }
+
+            return_val = convert_json_to_df_from_s3(
+                table="test_table", bucket_name="TestBucket", manifest=manifest
+            )
+
+            assert list(return_val["name"]) == ["Alice", "Bob"]
+
+    def test_registry_tables_are_read_with_their_types_not_inferred_ones(self):
+        columns = ["address_id", "postal_code", "district", "created_at"]
+        rows = [
+            (1, "01234", None, datetime(2025, 2, 26, 14, 33)),
+            (2, "28441", None, datetime(2025, 2, 27, 15, 40)),
+        ]
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            s3_client.create_bucket(
+                Bucket="TestBucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            key = "address/2025/03/06/13:39.json"
+            upload_to_s3(
+                data=format_data_to_json(rows, columns),
+                bucket_name="TestBucket",
+                object_name=key,
+            )
+            manifest = {
+                "version": 1,
+                "tables": {"address": manifest_entry([key], 2, None, None)},
+            }
+
+            return_val = convert_json_to_df_from_s3(
+                table="address", bucket_name="TestBucket", manifest=manifest
+            )
+
+            assert list(return_val["postal_code"]) == ["01234", "28441"]
+            assert return_val["district"].dtype == object
+            assert list(return_val["district"]) == [None, None]
+            assert return_val["address_id"].dtype == "int64"
+            assert return_val["created_at"].dtype == "datetime64[ns]"
+
+    def test_parts_downloaded_concurrently_are_concatenated_in_order(self):
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            s3_client.create_bucket(
+                Bucket="TestBucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            keys = [f"test_table/2025/03/06/13:39-{part}.json" for part in range(1, 7)]
+            for part, key in enumerate(keys):
+                upload_to_s3(
+                    data=format_data_to_json([(part, f"row {part}")], ["id", "name"]),
+                    bucket_name="TestBucket",
+                    object_name=key,
+                )
+            manifest = {
+                "version": 1,
+                "tables": {
+                    "test_table": manifest_entry(keys, 6, None, "2025/03/06/13:39")
+                },
+            }
+
+            return_val = convert_json_to_df_from_s3(
+                table="test_table",
+                bucket_name="TestBucket",
+                manifest=manifest,
+                s3_client=s3_client,
+                max_concurrency=4,
+            )
+
+            assert list(return_val["id"]) == list(range(6))
+
+
+class TestGetParquetFile:
+    def test_parquet_ingestion_file_is_read_with_its_types(self):
+        rows = [
+            [1, "Alice", datetime(2025, 2, 26, 14, 33), Decimal("100.00")],
+            [2, "Bob", datetime(2025, 2, 27, 15, 40), Decimal("200.50")],
+        ]
+        columns = [
+            {"name": "id", "type_oid": 23},
+            {"name": "name", "type_oid": 1043},
+            {"name": "timestamp", "type_oid": 1114},
+            {"name": "amount", "type_oid": 1700},
+        ]
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            s3_client.create_bucket(
+                Bucket="TestBucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            timestamp_for_filename = datetime.now().strftime("%Y/%m/%d/%H:%M")
+            s3_client.put_object(
+                Bucket="TestBucket",
+                Key="test_table/last_extracted.txt",
+                Body=timestamp_for_filename.encode("utf-8"),
+            )
+            upload_to_s3(
+                data=format_data_to_parquet(rows, columns),
+                bucket_name="TestBucket",
+                object_name=create_filename(
+                    "test_table", timestamp_for_filename, file_format="parquet"
+                ),
+            )
+
+            return_val = convert_json_to_df_from_s3(
+                table="test_table", bucket_name="TestBucket", file_format="parquet"
+            )
+
+            assert return_val["id"][0] == 1
+            assert return_val["name"][1] == "Bob"
+            assert return_val["timestamp"][0] == pd.Timestamp("2025-02-26 14:33")
+            assert return_val["amount"][1] == 200.5
+
+
 class TestDimLocation:
     def test_dim_location_returns_dataframe(self):
         rows = [
@@ -545,6 +711,1006 @@ class TestFactSalesOrder:
         assert "created_at" not in result.columns
         assert "last_updated" not in result.columns
 
+    def test_fact_sales_order_parses_mixed_and_missing_timestamps(self, capsys):
+        """Values that are not ISO-8601 fall back to the mixed parse; missing ones are NaT."""
+        df = pd.DataFrame(
+            {
+                "staff_id": [1, 2, 3],
+                "created_at": ["2025-03-04T10:27:15", "05/03/2025 12:00", None],
+                "last_updated": ["2025-03-04 10:28:15.5", "03/05/2025", None],
+            },
+            index=[7, 8, 9],
+        )
+
+        result = fact_sales_order(df)
+
+        assert list(result["created_date"]) == [
+            pd.Timestamp("2025-03-04"),
+            pd.Timestamp("2025-03-05"),
+            pd.NaT,
+        ]
+        assert list(result["created_time"]) == [
+            pd.Timestamp("1900-01-01 10:27:15"),
+            pd.Timestamp("1900-01-01 12:00:00"),
+            pd.NaT,
+        ]
+        assert list(result["last_updated_date"]) == [
+            pd.Timestamp("2025-03-04"),
+            pd.Timestamp("2025-03-05"),
+            pd.NaT,
+        ]
+        assert list(result["last_updated_time"]) == [
+            pd.Timestamp("1900-01-01 10:28:15"),
+            pd.Timestamp("1900-01-01 00:00:00"),
+            pd.NaT,
+        ]
+        assert result["created_date"].dtype == "datetime64[ns]"
+        assert result["created_time"].dtype == "datetime64[ns]"
+        assert capsys.readouterr().out == ""
+
+    def test_fact_sales_order_date_keys_match_dim_date(self):
+        """Each date column gets a YYYYMMDD key, as dim_date's date_key."""
+        df = pd.DataFrame(
+            {
+                "staff_id": [1, 2],
+                "created_at": ["2025-03-04 10:27:15", "2025-12-31 23:59:59"],
+                "last_updated": ["2025-03-05 10:28:15", "2026-01-01 00:00:01"],
+                "agreed_payment_date": ["2025-03-10", "2026-02-28"],
+                "agreed_delivery_date": ["2025-03-12", None],
+            }
+        )
+
+        result = fact_sales_order(df)
+
+        assert result["created_date_key"].tolist() == [20250304, 20251231]
+        assert result["last_updated_date_key"].tolist() == [20250305, 20260101]
+        assert result["agreed_payment_date_key"].tolist() == [20250310, 20260228]
+        assert result["agreed_delivery_date_key"].tolist() == [20250312, pd.NA]
+
+
+class TestTransformColumns:
+    """The transforms give the same output from the projected columns extraction selects."""
+
+    created = "2022-11-03 14:20:49.962000"
+    updated = "2025-03-06 13:39:12.345678"
+
+    @pytest.fixture
+    def full_tables(self):
+        return {
+            "address": pd.DataFrame(
+                {
+                    "address_id": [1, 2],
+                    "address_line_1": ["6826 Herzog Via", "179 Alexie Cliffs"],
+                    "address_line_2": [None, "Flat 2"],
+                    "district": ["Avon", None],
+                    "city": ["New Patienceburgh", "Aliso Viejo"],
+                    "postal_code": ["28441", "99305-7380"],
+                    "country": ["Turkey", "San Marino"],
+                    "phone": ["1803 637401", "9621 880720"],
+                    "created_at": [self.created] * 2,
+                    "last_updated": [self.updated] * 2,
+                }
+            ),
+            "counterparty": pd.DataFrame(
+                {
+                    "counterparty_id": [1, 2],
+                    "counterparty_legal_name": ["Fahey and Sons", "Leannon Inc"],
+                    "legal_address_id": [2, 1],
+                    "commercial_contact": ["Micheal Toy", "Melba Sanford"],
+                    "delivery_contact": ["Mrs. Lucy Runolfsdottir", "Jean Hane III"],
+                    "created_at": [self.created] * 2,
+                    "last_updated": [self.updated] * 2,
+                }
+            ),
+            "currency": pd.DataFrame(
+                {
+                    "currency_id": [1, 2, 3],
+                    "currency_code": ["GBP", "USD", "EUR"],
+                    "created_at": [self.created] * 3,
+                    "last_updated": [self.updated] * 3,
+                }
+            ),
+            "design": pd.DataFrame(
+                {
+                    "design_id": [8, 51],
+                    "created_at": [self.created] * 2,
+                    "design_name": ["Wooden", "Bronze"],
+                    "file_location": ["/usr", "/private"],
+                    "file_name": [
+                        "wooden-20220717-npgz.json",
+                        "bronze-20221024-4dds.json",
+                    ],
+                    "last_updated": [self.updated] * 2,
+                }
+            ),
+            "sales_order": pd.DataFrame(
+                {
+                    "sales_order_id": [2, 3],
+                    "created_at": [self.created] * 2,
+                    "last_updated": [self.updated] * 2,
+                    "design_id": [3, 4],
+                    "staff_id": [19, 10],
+                    "counterparty_id": [8, 4],
+                    "units_sold": [42972, 65839],
+                    "unit_price": [3.94, 2.91],
+                    "currency_id": [2, 3],
+                    "agreed_delivery_date": ["2022-11-07", "2022-11-06"],
+                    "agreed_payment_date": ["2022-11-08", "2022-11-07"],
+                    "agreed_delivery_location_id": [8, 19],
+                }
+            ),
+            "staff": pd.DataFrame(
+                {
+                    "staff_id": [1, 2],
+                    "first_name": ["Jeremie", "Deron"],
+                    "last_name": ["Franey", "Beier"],
+                    "department_id": [2, 6],
+                    "email_address": [
+                        "jeremie.franey@terrifictotes.com",
+                        "deron.beier@terrifictotes.com",
+                    ],
+                    "created_at": [self.created] * 2,
+                    "last_updated": [self.updated] * 2,
+                }
+            ),
+            "department": pd.DataFrame(
+                {
+                    "department_id": [2, 6],
+                    "department_name": ["Purchasing", "Facilities"],
+                    "location": ["Manchester", "Manchester"],
+                    "manager": ["Naomi Lapaglia", "Shelley Levene"],
+                    "created_at": [self.created] * 2,
+                    "last_updated": [self.updated] * 2,
+                }
+            ),
+        }
+
+    def transform_all(self, tables):
+        return {
+            "dim_location": dim_location(tables["address"].copy()),
+            "dim_counterparty": dim_counterparty(
+                tables["address"], tables["counterparty"]
+            ),
+            "dim_currency": dim_currency(tables["currency"]),
+            "dim_design": dim_design(tables["design"]),
+            "fact_sales_order": fact_sales_order(tables["sales_order"]),
+            "dim_staff": dim_staff(tables["department"], tables["staff"]),
+        }
+
+    def test_projected_extraction_leaves_transform_output_unchanged(self, full_tables):
+        projected_tables = {
+            table: df[select_list(table).split(", ")]
+            for table, df in full_tables.items()
+        }
+
+        full = self.transform_all(full_tables)
+        projected = self.transform_all(projected_tables)
+
+        for name, df in full.items():
+            pd.testing.assert_frame_equal(
+                projected[name].reset_index(drop=True), df.reset_index(drop=True)
+            )
+        assert all(
+            len(projected_tables[table].columns) <= len(df.columns)
+            for table, df in full_tables.items()
+        )
+
+
+class TestPushdownDimensions:
+    """Dimensions the extraction joined in the source database are written as they are."""
+
+    staff = pd.DataFrame(
+        {
+            "staff_id": [1, 2],
+            "first_name": ["Jeremie", "Deron"],
+            "last_name": ["Franey", "Beier"],
+            "department_id": [2, 6],
+            "email_address": ["jeremie@terrifictotes.com", "deron@terrifictotes.com"],
+        }
+    )
+    department = pd.DataFrame(
+        {
+            "department_id": [2, 6],
+            "department_name": ["Purchasing", "Facilities"],
+            "location": ["Manchester", "Leeds"],
+        }
+    )
+    # what the dim_staff pushdown query returns for the tables above
+    dim_staff_rows = [
+        (
+            1,
+            "Jeremie",
+            "Franey",
+            "Purchasing",
+            "Manchester",
+            "jeremie@terrifictotes.com",
+        ),
+        (2, "Deron", "Beier", "Facilities", "Leeds", "deron@terrifictotes.com"),
+    ]
+    dim_staff_columns = [
+        "staff_id",
+        "first_name",
+        "last_name",
+        "department_name",
+        "location",
+        "email_address",
+    ]
+
+    def test_joined_dimension_matches_pandas_merge_without_merging(self):
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            timestamp_for_filename = datetime.now().strftime("%Y/%m/%d/%H:%M")
+            filename = create_filename("dim_staff", timestamp_for_filename)
+            data = format_data_to_json(self.dim_staff_rows, self.dim_staff_columns)
+            upload_to_s3(
+                data=data, bucket_name="TestIngestBucket", object_name=filename
+            )
+            manifest = {
+                "version": 1,
+                "tables": {
+                    "dim_staff": manifest_entry([filename], 2, "checksum", None, "json")
+                },
+            }
+            s3_client.put_object(
+                Bucket="TestIngestBucket",
+                Key="state/manifest.json",
+                Body=json.dumps(manifest),
+            )
+            report = {"status": "Success", "updated_tables": ["dim_staff"]}
+            s3_client.put_object(
+                Bucket="TestIngestBucket",
+                Key="reports/test_report.json",
+                Body=json.dumps(report),
+            )
+            mock_event = {
+                "Records": [
+                    {
+                        "s3": {
+                            "bucket": {"name": "TestIngestBucket"},
+                            "object": {"key": "reports/test_report.json"},
+                        }
+                    }
+                ]
+            }
+
+            with patch("src.transform_lambda.main.dim_staff") as mock_dim_staff:
+                lambda_handler(mock_event, {})
+
+            transform_manifest, _ = read_manifest(
+                s3_client, "data-squid-transform-test"
+            )
+            key = transform_manifest["tables"]["dim_staff"]["keys"][0]
+            written = pd.read_parquet(
+                io.BytesIO(
+                    s3_client.get_object(Bucket="data-squid-transform-test", Key=key)[
+                        "Body"
+                    ].read()
+                )
+            )
+
+        mock_dim_staff.assert_not_called()
+        pd.testing.assert_frame_equal(written, dim_staff(self.department, self.staff))
+
+
+class TestTransformEngine:
+
+    def put_table(self, s3_client, table, rows, columns, time="2025/03/06/12:00"):
+        upload_to_s3(
+            data=format_data_to_json(rows, columns),
+            bucket_name="TestIngestBucket",
+            object_name=f"{table}/{time}.json",
+        )
+        return manifest_entry([f"{table}/{time}.json"], len(rows), None, None, "json")
+
+    def test_plan_reads_each_table_once_and_skips_outputs_missing_an_input(self):
+        graph = plan_transforms(["address", "counterparty", "staff"], incremental={})
+
+        assert graph == {
+            ("read", "address"): set(),
+            ("read", "counterparty"): set(),
+            ("build", "dim_location"): {("read", "address")},
+            ("build", "dim_counterparty"): {
+                ("read", "address"),
+                ("read", "counterparty"),
+            },
+        }
+
+    def test_plan_builds_incremental_outputs_when_any_input_changed(self):
+        graph = plan_transforms(["address", "staff"])
+
+        assert graph == {
+            ("read", "address"): set(),
+            ("read", "staff"): set(),
+            ("build", "dim_location"): {("read", "address")},
+            ("snapshot", "address"): {("read", "address")},
+            ("snapshot", "counterparty"): set(),
+            ("build", "dim_counterparty"): {
+                ("snapshot", "address"),
+                ("snapshot", "counterparty"),
+            },
+            ("snapshot", "department"): set(),
+            ("snapshot", "staff"): {("read", "staff")},
+            ("build", "dim_staff"): {
+                ("snapshot", "department"),
+                ("snapshot", "staff"),
+            },
+        }
+        assert plan_transforms([], include_static=True) == {
+            ("build", "dim_date"): set()
+        }
+
+    def test_calendar_extension_only_builds_the_days_missing(self):
+        horizon = date(2026, 3, 1)
+
+        assert calendar_extension("2022-11-03", "2025-12-31", None, True, horizon) == (
+            date(2022, 11, 3),
+            horizon,
+        )
+        assert calendar_extension("2022-11-03", "2025-12-31", {}, False, horizon) == (
+            date(2026, 1, 1),
+            horizon,
+        )
+        entry = {"calendar_end": "2026-02-27"}
+        assert calendar_extension(
+            "2022-11-03", "2025-12-31", entry, False, horizon
+        ) == (
+            date(2026, 2, 28),
+            horizon,
+        )
+        entry = {"calendar_end": "2026-03-01"}
+        assert (
+            calendar_extension("2022-11-03", "2025-12-31", entry, False, horizon)
+            is None
+        )
+
+    def test_calendar_outputs_are_extended_up_to_the_horizon(self):
+        columns = ["address_id", "address_line_1", "address_line_2", "district"]
+        columns += ["city", "postal_code", "country", "phone"]
+        rows = [(1, "1 Road", None, "D", "Leeds", "AB1", "UK", "0123")]
+
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+
+            def run(transform_manifest, today):
+                manifest = {
+                    "tables": {
+                        "address": self.put_table(s3_client, "address", rows, columns)
+                    }
+                }
+                entries, _ = run_transforms(
+                    s3_client,
+                    "TestIngestBucket",
+                    "data-squid-transform-test",
+                    ["address"],
+                    "2025/03/06/12:00",
+                    TransformConfig(calendar_horizon_days=10),
+                    manifest=manifest,
+                    transform_manifest=transform_manifest,
+                    today=today,
+                    incremental={},
+                )
+                return entries
+
+            # versions written before the extension cover up to DIM_DATE_END
+            entries = run({"tables": {}}, date(2025, 12, 25))
+            assert list(entries) == ["dim_date", "dim_location"]
+            assert entries["dim_date"]["calendar_end"] == "2026-01-04"
+            body = s3_client.get_object(
+                Bucket="data-squid-transform-test", Key=entries["dim_date"]["keys"][0]
+            )["Body"].read()
+            output = pd.read_parquet(io.BytesIO(body))
+            assert output["date_key"].tolist() == [
+                20260101,
+                20260102,
+                20260103,
+                20260104,
+            ]
+
+            # up to date: only the address is transformed
+            assert list(run({"tables": entries}, date(2025, 12, 25))) == [
+                "dim_location"
+            ]
+
+            # no transform manifest: nothing is known of the days written
+            assert "dim_date" not in run(None, date(2025, 12, 25))
+
+            # an empty bucket, which has no transform manifest, gets the whole calendar
+            entries, _ = run_transforms(
+                s3_client,
+                "TestIngestBucket",
+                "data-squid-transform-test",
+                [],
+                "2025/03/06/12:00",
+                TransformConfig(calendar_horizon_days=10),
+                include_static=True,
+                today=date(2025, 12, 25),
+            )
+            assert list(entries) == ["dim_date"]
+            assert entries["dim_date"]["calendar_end"] == "2026-01-04"
+
+    def test_merge_snapshot_replaces_rows_by_primary_key(self):
+        snapshot = pd.DataFrame({"staff_id": [3, 1, 2], "name": ["c", "a", "b"]})
+        delta = pd.DataFrame({"staff_id": [2, 4, 2], "name": ["x", "d", "y"]})
+
+        merged = merge_snapshot(snapshot, delta, "staff_id")
+
+        pd.testing.assert_frame_equal(
+            merged,
+            pd.DataFrame({"staff_id": [1, 2, 3, 4], "name": ["a", "y", "c", "d"]}),
+        )
+        assert merge_snapshot(None, delta, "staff_id")["name"].tolist() == ["y", "d"]
+
+    def test_ingested_history_replays_objects_in_the_order_they_were_written(self):
+        # a bootstrap and the delta after it started in the same minute, so the
+        # delta's key sorts before the bootstrap's parts
+        objects = [
+            (
+                "staff/2025/03/06/12:00.json",
+                datetime(2025, 3, 6, 12, 0, 40),
+                [(1, "new")],
+            ),
+            (
+                "staff/2025/03/06/12:00/part-00000.json",
+                datetime(2025, 3, 6, 12, 0, 5),
+                [(1, "old"), (2, "b")],
+            ),
+            (
+                "staff/2025/03/06/12:00/part-00001.json",
+                datetime(2025, 3, 6, 12, 0, 5),
+                [(3, "c")],
+            ),
+        ]
+        columns = ["staff_id", "first_name"]
+        bodies = {key: format_data_to_json(rows, columns) for key, _, rows in objects}
+        s3_client = MagicMock()
+        s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": key, "LastModified": at} for key, at, _ in objects]}
+        ]
+        s3_client.get_object.side_effect = lambda Bucket, Key: {
+            "Body": io.BytesIO(bodies[Key])
+        }
+
+        history = read_ingested_history(s3_client, "TestIngestBucket", "staff")
+
+        assert history["staff_id"].tolist() == [1, 2, 3, 1]
+        assert merge_snapshot(None, history, "staff_id")["first_name"].tolist() == [
+            "new",
+            "b",
+            "c",
+        ]
+
+    @pytest.mark.parametrize("processes", [0, 2])
+    def test_incremental_outputs_rebuild_what_a_one_sided_change_affects(
+        self, processes, tmp_path
+    ):
+        address_columns = ["address_id", "address_line_1", "address_line_2"]
+        address_columns += ["district", "city", "postal_code", "country", "phone"]
+        counterparty_columns = [
+            "counterparty_id",
+            "counterparty_legal_name",
+            "legal_address_id",
+        ]
+
+        def address(address_id, city):
+            return (address_id, "1 Road", None, "D", city, "AB1", "UK", "0123")
+
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+
+            def run(updates, time, transform_manifest):
+                manifest = {
+                    "tables": {
+                        table: self.put_table(s3_client, table, rows, columns, time)
+                        for table, (rows, columns) in updates.items()
+                    }
+                }
+                entries, timings = run_transforms(
+                    s3_client,
+                    "TestIngestBucket",
+                    "data-squid-transform-test",
+                    list(updates),
+                    time,
+                    TransformConfig(processes=processes, cache_dir=str(tmp_path)),
+                    manifest=manifest,
+                    transform_manifest=transform_manifest,
+                    calendars={},
+                )
+                body = s3_client.get_object(
+                    Bucket="data-squid-transform-test",
+                    Key=entries["dim_counterparty"]["keys"][0],
+                )["Body"].read()
+                output = pd.read_parquet(io.BytesIO(body)).sort_values(
+                    "counterparty_id", ignore_index=True
+                )
+                transform_manifest = {
+                    "tables": {**transform_manifest["tables"], **entries}
+                }
+                return entries, output, transform_manifest
+
+            entries, output, transform_manifest = run(
+                {
+                    "address": (
+                        [address(1, "Leeds"), address(2, "York")],
+                        address_columns,
+                    ),
+                    "counterparty": (
+                        [(10, "Acme", 1), (11, "Bolt", 2), (12, "Cogs", 1)],
+                        counterparty_columns,
+                    ),
+                },
+                "2025/03/06/12:00",
+                {"tables": {}},
+            )
+            assert list(entries) == [
+                "dim_location",
+                "dim_counterparty",
+                "address",
+                "counterparty",
+            ]
+            assert output["counterparty_legal_city"].tolist() == [
+                "Leeds",
+                "York",
+                "Leeds",
+            ]
+
+            # only the address changed: its counterparties are rebuilt against the
+            # stored counterparty snapshot, which is only read from the local cache
+            for key in (
+                transform_manifest["tables"][table]["keys"][0]
+                for table in ("address", "counterparty")
+            ):
+                s3_client.delete_object(Bucket="data-squid-transform-test", Key=key)
+            entries, output, transform_manifest = run(
+                {"address": ([address(1, "Hull")], address_columns)},
+                "2025/03/06/12:05",
+                transform_manifest,
+            )
+            assert list(entries) == ["dim_location", "dim_counterparty", "address"]
+            assert output["counterparty_id"].tolist() == [10, 12]
+            assert output["counterparty_legal_city"].tolist() == ["Hull", "Hull"]
+
+            # only a counterparty changed: it is joined to the stored address
+            entries, output, _ = run(
+                {"counterparty": ([(11, "Bolt", 1)], counterparty_columns)},
+                "2025/03/06/12:10",
+                transform_manifest,
+            )
+            assert list(entries) == ["dim_counterparty", "counterparty"]
+            assert output["counterparty_id"].tolist() == [11]
+            assert output["counterparty_legal_city"].tolist() == ["Hull"]
+
+    @pytest.mark.parametrize("processes", [0, 2])
+    def test_new_outputs_only_need_a_registry_entry(self, processes):
+        transforms = {
+            **TRANSFORMS,
+            "fact_payment": (["payment"], lambda df: df[["payment_id", "amount"]]),
+            "payment_total": (
+                ["fact_payment"],
+                lambda df: pd.DataFrame({"total": [df["amount"].sum()]}),
+            ),
+        }
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            entry = self.put_table(
+                s3_client,
+                "payment",
+                [(1, 10.5, "x"), (2, 4.5, "y")],
+                ["payment_id", "amount", "payment_type"],
+            )
+
+            entries, timings = run_transforms(
+                s3_client,
+                "TestIngestBucket",
+                "data-squid-transform-test",
+                ["payment"],
+                "2025/03/06/12:00",
+                TransformConfig(processes=processes),
+                manifest={"tables": {"payment": entry}},
+                transforms=transforms,
+            )
+            key = entries["payment_total"]["keys"][0]
+            total = pd.read_parquet(
+                io.BytesIO(
+                    s3_client.get_object(Bucket="data-squid-transform-test", Key=key)[
+                        "Body"
+                    ].read()
+                )
+            )
+
+        assert list(entries) == ["fact_payment", "payment_total"]
+        assert entries["fact_payment"]["row_count"] == 2
+        assert total["total"].tolist() == [15.0]
+        assert set(timings["read"]) == {"payment"}
+        assert set(timings["build"]) == {"fact_payment", "payment_total"}
+        # the workers' peak is reported once, as a process peak
+        assert ("worker_peak_rss" in timings["memory"]) == bool(processes)
+
+    def test_independent_outputs_are_built_at_the_same_time(self):
+        # each build waits for the other one, so they only finish if run concurrently
+        barrier = threading.Barrier(2, timeout=10)
+
+        def build(df):
+            barrier.wait()
+            return df
+
+        transforms = {
+            "out_design": (["design"], build),
+            "out_currency": (["currency"], build),
+        }
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            manifest = {
+                "tables": {
+                    table: self.put_table(s3_client, table, [(1, "a")], ["id", "name"])
+                    for table in ("design", "currency")
+                }
+            }
+
+            entries, _ = run_transforms(
+                s3_client,
+                "TestIngestBucket",
+                "data-squid-transform-test",
+                ["design", "currency"],
+                "2025/03/06/12:00",
+                TransformConfig(max_workers=2),
+                manifest=manifest,
+                transforms=transforms,
+            )
+
+        assert list(entries) == ["out_design", "out_currency"]
+
+    def test_prefetch_bounds_the_tables_held_ahead_of_their_builds(self):
+        lock = threading.Lock()
+        reads, builds, held = [], [], []
+
+        def read(table, *args, **kwargs):
+            with lock:
+                reads.append(table)
+                held.append(len(reads) - len(builds))
+            return pd.DataFrame({"id": [1]})
+
+        def build(df):
+            with lock:
+                builds.append(df)
+            return df
+
+        tables = ["design", "currency", "address", "staff", "department"]
+        transforms = {f"out_{table}": ([table], build) for table in tables}
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            s3_client.create_bucket(
+                Bucket="data-squid-transform-test",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            with patch(
+                "src.transform_lambda.main.convert_json_to_df_from_s3", side_effect=read
+            ):
+                entries, timings = run_transforms(
+                    s3_client,
+                    "TestIngestBucket",
+                    "data-squid-transform-test",
+                    list(reversed(tables)),
+                    "2025/03/06/12:00",
+                    TransformConfig(io_concurrency=4, prefetch=2),
+                    transforms=transforms,
+                )
+
+        assert reads == tables
+        assert max(held) <= 2
+        assert list(entries) == list(transforms)
+        assert list(timings["read"]) == tables
+        assert list(timings["upload"]) == list(transforms)
+
+    def test_outputs_upload_in_the_background(self):
+        # the upload of out_design waits until the build using it has run
+        derived_built = threading.Event()
+
+        def derive(df):
+            derived_built.set()
+            return df
+
+        def upload(data, bucket_name, object_name, s3_client=None):
+            if object_name.startswith("out_design/"):
+                assert derived_built.wait(timeout=10)
+            upload_to_s3(data, bucket_name, object_name, s3_client=s3_client)
+
+        transforms = {
+            "out_design": (["design"], lambda df: df),
+            "out_derived": (["out_design"], derive),
+        }
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            entry = self.put_table(s3_client, "design", [(1, "a")], ["id", "name"])
+
+            with patch("src.transform_lambda.main.upload_to_s3", side_effect=upload):
+                entries, _ = run_transforms(
+                    s3_client,
+                    "TestIngestBucket",
+                    "data-squid-transform-test",
+                    ["design"],
+                    "2025/03/06/12:00",
+                    manifest={"tables": {"design": entry}},
+                    transforms=transforms,
+                )
+
+        assert list(entries) == ["out_design", "out_derived"]
+
+    def test_compacted_frames_give_the_same_outputs(self):
+        tables = {
+            "address": (
+                [
+                    (1, "1 Road", None, None, "Leeds", "01234", "UK", "0113"),
+                    (2, "2 Road", None, None, "Leeds", "AB1", "UK", "0113"),
+                ],
+                [
+                    "address_id",
+                    "address_line_1",
+                    "address_line_2",
+                    "district",
+                    "city",
+                    "postal_code",
+                    "country",
+                    "phone",
+                ],
+            ),
+            "currency": (
+                [(1, "GBP", "2025-03-06T12:00:00", "2025-03-06T12:00:00")],
+                ["currency_id", "currency_code", "created_at", "last_updated"],
+            ),
+        }
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            manifest = {
+                "tables": {
+                    table: self.put_table(s3_client, table, rows, columns)
+                    for table, (rows, columns) in tables.items()
+                }
+            }
+            outputs, memory = {}, {}
+            for compact in (False, True):
+                entries, timings = run_transforms(
+                    s3_client,
+                    "TestIngestBucket",
+                    "data-squid-transform-test",
+                    list(tables),
+                    f"2025/03/06/12:0{int(compact)}",
+                    TransformConfig(compact=compact),
+                    manifest=manifest,
+                    incremental={},
+                )
+                memory[compact] = timings["memory"]
+                outputs[compact] = {
+                    output: pd.read_parquet(
+                        io.BytesIO(
+                            s3_client.get_object(
+                                Bucket="data-squid-transform-test",
+                                Key=entry["keys"][0],
+                            )["Body"].read()
+                        )
+                    )
+                    for output, entry in entries.items()
+                }
+
+        assert list(outputs[True]) == ["dim_location", "dim_currency"]
+        for output, df in outputs[False].items():
+            pd.testing.assert_frame_equal(outputs[True][output], df)
+        assert outputs[True]["dim_location"]["postal_code"].tolist() == ["01234", "AB1"]
+        assert set(memory[True]["read"]) == {"address", "currency"}
+        # a high-water mark of the whole process, not one per output
+        assert "build" not in memory[True]
+        assert memory[True]["peak_rss"] >= memory[False]["peak_rss"] > 0
+
+    def test_serial_runs_report_the_peak_rss_of_each_table(self):
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            manifest = {
+                "tables": {
+                    "currency": self.put_table(
+                        s3_client,
+                        "currency",
+                        [(1, "GBP", "2025-03-06T12:00:00", "2025-03-06T12:00:00")],
+                        ["currency_id", "currency_code", "created_at", "last_updated"],
+                    ),
+                    "design": self.put_table(
+                        s3_client,
+                        "design",
+                        [(1, "Steel", "/a", "a.json")],
+                        ["design_id", "design_name", "file_location", "file_name"],
+                    ),
+                }
+            }
+            memory = {}
+            for config in (
+                TransformConfig(max_workers=1, io_concurrency=1),
+                TransformConfig(),
+            ):
+                _, timings = run_transforms(
+                    s3_client,
+                    "TestIngestBucket",
+                    "data-squid-transform-test",
+                    ["currency", "design"],
+                    "2025/03/06/12:00",
+                    config,
+                    manifest=manifest,
+                    incremental={},
+                )
+                memory[config.max_workers] = timings["memory"]
+
+        peaks = memory[1]["table_peak_rss"]
+        assert set(peaks["read"]) == {"currency", "design"}
+        assert set(peaks["build"]) == {"dim_currency", "dim_design"}
+        assert peaks["snapshot"] == {}
+        # the process's peak still covers every node
+        assert memory[1]["peak_rss"] >= max(
+            mib for kind in peaks.values() for mib in kind.values()
+        )
+        assert min(mib for kind in peaks.values() for mib in kind.values()) > 0
+        # builds running side by side cannot be told apart
+        assert "table_peak_rss" not in memory[4]
+
+    def test_outputs_are_written_with_their_parquet_profile(self):
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            entry = self.put_table(
+                s3_client,
+                "design",
+                [(1, "Wooden", "/usr", "wooden.json")],
+                ["design_id", "design_name", "file_location", "file_name"],
+            )
+
+            entries, _ = run_transforms(
+                s3_client,
+                "TestIngestBucket",
+                "data-squid-transform-test",
+                ["design"],
+                "2025/03/06/12:00",
+                TransformConfig(
+                    parquet_profile="fast-write",
+                    parquet_profiles={"dim_design": "small-object"},
+                ),
+                manifest={"tables": {"design": entry}},
+                transforms={
+                    "dim_design": (["design"], dim_design),
+                    "design_copy": (["design"], dim_design),
+                },
+            )
+            codecs = {}
+            for output, entry in entries.items():
+                body = s3_client.get_object(
+                    Bucket="data-squid-transform-test", Key=entry["keys"][0]
+                )["Body"].read()
+                row_group = fastparquet.ParquetFile(io.BytesIO(body)).row_groups[0]
+                codecs[output] = row_group.columns[0].meta_data.codec
+
+        # 6 is ZSTD and 0 UNCOMPRESSED in the Parquet format
+        assert codecs == {"dim_design": 6, "design_copy": 0}
+
+    def test_worker_process_errors_fail_the_run(self):
+        def build(df):
+            raise ValueError("bad input")
+
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            entry = self.put_table(s3_client, "design", [(1, "a")], ["id", "name"])
+
+            with pytest.raises(RuntimeError, match="Transform of out_design failed"):
+                run_transforms(
+                    s3_client,
+                    "TestIngestBucket",
+                    "data-squid-transform-test",
+                    ["design"],
+                    "2025/03/06/12:00",
+                    TransformConfig(processes=1),
+                    manifest={"tables": {"design": entry}},
+                    transforms={"out_design": (["design"], build)},
+                )
+
+
+class TestCompactDataframe:
+
+    @pytest.fixture
+    def sales_order_df(self):
+        # a day's sales: unique ids, low-cardinality references and dates as text
+        rows = 20_000
+        rng = np.random.default_rng(0)
+        dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(
+            rng.integers(0, 700, rows), unit="D"
+        )
+        df = pd.DataFrame(
+            {
+                "sales_order_id": np.arange(1, rows + 1),
+                "created_at": pd.Timestamp("2024-01-01")
+                + pd.to_timedelta(rng.integers(0, 10**8, rows), unit="s"),
+                "design_id": rng.integers(1, 500, rows),
+                "staff_id": rng.integers(1, 20, rows),
+                "counterparty_id": rng.integers(1, 20, rows),
+                "units_sold": rng.integers(1, 100_000, rows),
+                "unit_price": rng.integers(100, 400, rows) / 100,
+                "currency_id": rng.integers(1, 4, rows),
+                "agreed_delivery_date": dates.strftime("%Y-%m-%d"),
+                "agreed_payment_date": dates.strftime("%Y-%m-%d"),
+            }
+        )
+        return conform_dataframe(df, "sales_order")
+
+    def test_compacted_table_stays_within_its_memory_budget(self, sales_order_df):
+        # about 3.8 MiB before compaction
+        budget_mib = 1.0
+
+        compacted = compact_dataframe(sales_order_df)
+
+        assert frame_memory_mib(compacted) < budget_mib
+        assert compacted["currency_id"].dtype == "int8"
+        assert compacted["agreed_delivery_date"].dtype == "category"
+
+    def test_compacted_table_conforms_back_to_the_same_values(self, sales_order_df):
+        compacted = compact_dataframe(sales_order_df)
+
+        pd.testing.assert_frame_equal(
+            conform_dataframe(compacted, "sales_order"), sales_order_df
+        )
+
+    def test_high_cardinality_and_null_strings_are_kept_as_objects(self):
+        df = pd.DataFrame(
+            {"name": ["a", "b", "c", "d"], "note": [None] * 4, "country": ["UK"] * 4}
+        )
+
+        compacted = compact_dataframe(df)
+
+        assert compacted["name"].dtype == object
+        assert compacted["note"].dtype == object
+        assert compacted["country"].dtype == "category"
+
 
 class TestDataFrameToParquet:
 
@@ -563,9 +1729,9 @@ class TestDataFrameToParquet:
         )
 
     def test_parquet_conversion_output_type(self, sample_df):
-        """Test if the function returns a bytes object."""
+        """Test if the function returns a view of the buffer, not a copy in bytes."""
         parquet_data = dataframe_to_parquet(sample_df)
-        assert isinstance(parquet_data, bytes)
+        assert isinstance(parquet_data, memoryview)
 
     def test_empty_dataframe_conversion(self):
         """Test if the function works correctly with an empty DataFrame."""
@@ -578,6 +1744,97 @@ class TestDataFrameToParquet:
 
         assert df_read_back.empty
 
+    @pytest.mark.parametrize("compression", ["none", "snappy", "gzip", "zstd"])
+    def test_parquet_codec_round_trips(self, sample_df, compression):
+        """Test each configurable codec writes Parquet that reads back intact."""
+        parquet_data = dataframe_to_parquet(sample_df, compression)
+
+        df_read_back = pd.read_parquet(io.BytesIO(parquet_data))
+
+        assert df_read_back["id"].tolist() == sample_df["id"].tolist()
+
+    def test_registry_tables_keep_their_parquet_schema_without_values(self):
+        """Test an all-null column is written with its registry type, not inferred."""
+        row = {
+            "location_id": [1],
+            "address_line_1": ["6826 Herzog Via"],
+            "address_line_2": ["Avon"],
+            "district": ["Bedfordshire"],
+            "city": ["New Patienceburgh"],
+            "postal_code": ["28441"],
+            "country": ["Turkey"],
+            "phone": ["1803 637401"],
+        }
+        nulls = {**row, "address_line_2": [None], "district": [None]}
+
+        schemas = [
+            fastparquet.ParquetFile(
+                io.BytesIO(dataframe_to_parquet(pd.DataFrame(df), table="dim_location"))
+            ).schema
+            for df in (row, nulls)
+        ]
+
+        assert schemas[0] == schemas[1]
+        assert "district: BYTE_ARRAY, UTF8" in schemas[1].text
+
+    @pytest.fixture
+    def location_df(self):
+        return pd.DataFrame(
+            {
+                "location_id": [3, 1, 2, 4],
+                "address_line_1": ["3 Road", "1 Road", "2 Road", "4 Road"],
+                "address_line_2": [None, None, "Flat 2", None],
+                "district": ["Leeds", "Leeds", "Leeds", None],
+                "city": ["Leeds"] * 4,
+                "postal_code": ["01234", "LS1", "LS2", "LS3"],
+                "country": ["UK"] * 4,
+                "phone": ["0113"] * 4,
+            }
+        )
+
+    @pytest.mark.parametrize("profile", list(PARQUET_PROFILES))
+    def test_parquet_profile_round_trips(self, location_df, profile):
+        """Test each writer profile writes Parquet that reads back intact."""
+        parquet_data = dataframe_to_parquet(
+            location_df, table="dim_location", profile=profile
+        )
+
+        df_read_back = conform_dataframe(
+            pd.read_parquet(io.BytesIO(parquet_data)), "dim_location"
+        )
+
+        pd.testing.assert_frame_equal(
+            df_read_back.sort_values("location_id", ignore_index=True),
+            location_df.sort_values("location_id", ignore_index=True),
+        )
+
+    def test_query_friendly_profile_sorts_row_groups_with_statistics(
+        self, location_df, monkeypatch
+    ):
+        """Test rows are sorted by primary key into row groups with min/max stats."""
+        monkeypatch.setitem(
+            PARQUET_PROFILES,
+            "query-friendly",
+            {**PARQUET_PROFILES["query-friendly"], "row_group_size": 2},
+        )
+
+        parquet_data = dataframe_to_parquet(
+            location_df, table="dim_location", profile="query-friendly"
+        )
+
+        statistics = fastparquet.ParquetFile(io.BytesIO(parquet_data)).statistics
+        assert statistics["min"]["location_id"] == [1, 3]
+        assert statistics["max"]["location_id"] == [2, 4]
+        assert statistics["min"]["postal_code"] == ["LS1", "01234"]
+
+    def test_parquet_profiles_are_selected_per_table(self):
+        assert parse_parquet_profiles(
+            "fact_sales_order=query-friendly, dim_date=fast-write"
+        ) == {"fact_sales_order": "query-friendly", "dim_date": "fast-write"}
+        assert parse_parquet_profiles("") == {}
+        with pytest.raises(ValueError):
+            parse_parquet_profiles("dim_date=smallest")
+
 
 class TestDimDate:
     def test_dim_date_start_date_matches_date_start_date(self):
@@ -600,6 +1857,24 @@ class TestDimDate:
 
         assert result["quarter"][len(result) - 1] == 4
 
+    def test_dim_date_builds_any_range_with_an_integer_key(self):
+        result = dim_date(date(2025, 12, 30), date(2026, 1, 2))
+
+        assert result["date_id"].dt.strftime("%Y-%m-%d").tolist() == [
+            "2025-12-30",
+            "2025-12-31",
+            "2026-01-01",
+            "2026-01-02",
+        ]
+        assert result["date_key"].tolist() == [20251230, 20251231, 20260101, 20260102]
+        assert result["day_name"].tolist() == [
+            "Tuesday",
+            "Wednesday",
+            "Thursday",
+            "Friday",
+        ]
+        assert result["quarter"].tolist() == [4, 4, 1, 1]
+
 
 class TestExtractTableNames:
 
@@ -663,12 +1938,18 @@ class TestExtractTableNamesFromReport:
 class TestLambdaHandler:
     @patch("src.transform_lambda.main.get_s3_bucket_name")
     @patch("src.transform_lambda.main.check_for_data")
-    @patch("src.transform_lambda.main.extract_tablenames")
+    @patch("src.transform_lambda.main.read_extraction_report")
+    @patch("src.transform_lambda.main.read_manifest")
     def test_lambda_handler_erroneously_called_returns_warning_message(
-        self, mock_extract_tablenames, mock_check_for_data, mock_get_s3_bucket_name
+        self,
+        mock_read_manifest,
+        mock_read_extraction_report,
+        mock_check_for_data,
+        mock_get_s3_bucket_name,
     ):
         mock_check_for_data.return_value = True
-        mock_extract_tablenames.return_value = ["fake_table"]
+        mock_read_manifest.return_value = ({"version": 0, "tables": {}}, None)
+        mock_read_extraction_report.return_value = {"updated_tables": ["fake_table"]}
         mock_event = {
             "Records": [
                 {
@@ -691,12 +1972,18 @@ class TestLambdaHandler:
 
     @patch("src.transform_lambda.main.get_s3_bucket_name")
     @patch("src.transform_lambda.main.check_for_data")
-    @patch("src.transform_lambda.main.extract_tablenames")
+    @patch("src.transform_lambda.main.read_extraction_report")
+    @patch("src.transform_lambda.main.read_manifest")
     def test_lambda_handler_called_with_empty_list_returns_warning_message(
-        self, mock_extract_tablenames, mock_check_for_data, mock_get_s3_bucket_name
+        self,
+        mock_read_manifest,
+        mock_read_extraction_report,
+        mock_check_for_data,
+        mock_get_s3_bucket_name,
     ):
         mock_check_for_data.return_value = True
-        mock_extract_tablenames.return_value = []
+        mock_read_manifest.return_value = ({"version": 0, "tables": {}}, None)
+        mock_read_extraction_report.return_value = {"updated_tables": []}
         mock_event = {
             "Records": [
                 {
@@ -876,3 +2163,105 @@ class TestLambdaHandler:
 
             assert result["result"] == "Success"
             assert "s3://data-squid-transform-test" in result["report_file"]
+
+    def test_lambda_handler_reads_each_table_in_its_reported_format(self):
+        address_rows = [
+            [
+                1,
+                "6826 Herzog Via",
+                None,
+                "Avon",
+                "New Patienceburgh",
+                "28441",
+                "Turkey",
+                "1803 637401",
+            ],
+        ]
+        address_columns = [
+            {"name": "address_id", "type_oid": 23},
+            {"name": "address_line_1", "type_oid": 1043},
+            {"name": "address_line_2", "type_oid": 1043},
+            {"name": "district", "type_oid": 1043},
+            {"name": "city", "type_oid": 1043},
+            {"name": "postal_code", "type_oid": 1043},
+            {"name": "country", "type_oid": 1043},
+            {"name": "phone", "type_oid": 1043},
+        ]
+        currency_rows = [(1, "GBP", 18, 7)]
+        currency_columns = [
+            "currency_id",
+            "currency_code",
+            "created_at",
+            "last_updated",
+        ]
+
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            for bucket in ("TestIngestBucket", "data-squid-transform-test"):
+                s3_client.create_bucket(
+                    Bucket=bucket,
+                    CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+                )
+            timestamp_for_filename = datetime.now().strftime("%Y/%m/%d/%H:%M")
+            for table in ("address", "currency"):
+                s3_client.put_object(
+                    Bucket="TestIngestBucket",
+                    Key=f"{table}/last_extracted.txt",
+                    Body=timestamp_for_filename.encode("utf-8"),
+                )
+            upload_to_s3(
+                data=format_data_to_parquet(address_rows, address_columns),
+                bucket_name="TestIngestBucket",
+                object_name=create_filename(
+                    "address", timestamp_for_filename, file_format="parquet"
+                ),
+            )
+            upload_to_s3(
+                data=format_data_to_json(currency_rows, currency_columns),
+                bucket_name="TestIngestBucket",
+                object_name=create_filename("currency", timestamp_for_filename),
+            )
+            report = {
+                "status": "Success",
+                "updated_tables": ["address", "currency"],
+                "table_formats": {"address": "parquet", "currency": "json"},
+            }
+            s3_client.put_object(
+                Bucket="TestIngestBucket",
+                Key="reports/test_report.json",
+                Body=json.dumps(report),
+            )
+            mock_event = {
+                "Records": [
+                    {
+                        "s3": {
+                            "bucket": {"name": "TestIngestBucket"},
+                            "object": {"key": "reports/test_report.json"},
+                        }
+                    }
+                ]
+            }
+
+            result = lambda_handler(mock_event, {})
+
+            transform_report = json.loads(
+                s3_client.get_object(
+                    Bucket="data-squid-transform-test",
+                    Key=result["report_file"].split("data-squid-transform-test/")[1],
+                )["Body"].read()
+            )
+            assert "dim_location" in transform_report["transformed_tables"]
+            assert "dim_currency" in transform_report["transformed_tables"]
+            manifest, _ = read_manifest(s3_client, "data-squid-transform-test")
+            assert manifest["version"] == 1
+            # address is also recorded with the snapshot dim_counterparty will join
+            assert set(manifest["tables"]) == set(
+                transform_report["transformed_tables"]
+            ) | {"address"}
+            assert manifest["tables"]["address"]["keys"][0].startswith(
+                "state/snapshots/address/"
+            )
+            assert manifest["tables"]["dim_currency"]["keys"] == [
+                create_filename_for_parquet("dim_currency", timestamp_for_filename)
+            ]
+            assert manifest["tables"]["dim_currency"]["row_count"] == 1
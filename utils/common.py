@@ -0,0 +1,652 @@
+"""
+Helpers shared by the extraction, transform and load lambdas: S3 objects and
+compression, credentials and database connections, file naming and the state
+manifest.
+
+Nothing heavy is imported here at module level (pg8000 is imported when a
+connection is opened), so every lambda can import this module cheaply.
+"""
+
+import boto3
+from datetime import datetime
+from botocore.exceptions import ClientError
+import json
+import gzip
+import io
+import time
+import zlib
+import cramjam
+
+
+# Columns of each totesys table that the transforms in utils.transform use:
+# dim_location and dim_counterparty (address), dim_counterparty (counterparty),
+# dim_currency, dim_design, dim_staff (staff, department) and fact_sales_order.
+# Extraction selects only these (plus the primary key and last_updated, which it
+# needs itself); tables no transform reads are extracted whole. Declared here rather
+# than in utils.transform so the extraction lambda can use it without pandas.
+TRANSFORM_COLUMNS = {
+    "address": [
+        "address_id",
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+    ],
+    "counterparty": ["counterparty_id", "counterparty_legal_name", "legal_address_id"],
+    # dim_currency only drops created_at, but expects it to be there
+    "currency": ["currency_id", "currency_code", "created_at"],
+    "design": ["design_id", "design_name", "file_location", "file_name"],
+    "sales_order": [
+        "sales_order_id",
+        "created_at",
+        "last_updated",
+        "design_id",
+        "staff_id",
+        "counterparty_id",
+        "units_sold",
+        "unit_price",
+        "currency_id",
+        "agreed_delivery_date",
+        "agreed_payment_date",
+        "agreed_delivery_location_id",
+    ],
+    "staff": ["staff_id", "first_name", "last_name", "department_id", "email_address"],
+    "department": ["department_id", "department_name", "location"],
+}
+
+
+def upload_to_s3(data, bucket_name, object_name, content_encoding=None, s3_client=None):
+    """
+    Uploads data to an S3 bucket.
+
+    Args:
+        data (str, bytes or memoryview): The data to be uploaded to the S3 bucket.
+            A memoryview (dataframe_to_parquet returns one) is uploaded from in
+            place rather than copied into bytes first.
+        bucket_name (str): The name of the target S3 bucket.
+        object_name (str): The name of the object to be created in the S3 bucket.
+        content_encoding (str, optional): Content-Encoding recorded on the object when
+            data has been compressed with compress_data ("gzip" or "zstd").
+        s3_client (boto3.client, optional): Client to upload with; a new one is
+            created when not given. Threads must pass one in, because creating
+            clients from the default session is not thread-safe.
+
+    Raises:
+        ClientError: If the upload fails due to a client-side error with the AWS S3 service.
+
+    Prints:
+        A success message if the upload is successful, or an error message if the upload fails.
+    """
+    if s3_client is None:
+        s3_client = boto3.client("s3")
+    extra_args = {"ContentEncoding": content_encoding} if content_encoding else {}
+    if isinstance(data, memoryview):
+        data = _BufferReader(data)
+    try:
+        s3_client.put_object(
+            Bucket=bucket_name, Key=object_name, Body=data, **extra_args
+        )
+        # print(f"Successfully uploaded {object_name} to {bucket_name}")
+    except ClientError as e:
+        # print(f"Failed to upload {object_name} to {bucket_name}: {e}")
+        raise
+
+
+class _BufferReader(io.RawIOBase):
+    """A seekable file object reading from a buffer, such as a memoryview, in place."""
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        start = {
+            io.SEEK_SET: 0,
+            io.SEEK_CUR: self._position,
+            io.SEEK_END: len(self._buffer),
+        }[whence]
+        self._position = max(start + offset, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        chunk = self._buffer[self._position : self._position + len(buffer)]
+        buffer[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def readall(self):
+        data = bytes(self._buffer[self._position :])
+        self._position += len(data)
+        return data
+
+
+# File extension suffix for each ingestion compression; the codec itself is recorded
+# on the object as its Content-Encoding
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def compress_data(data, compression=None):
+    """
+    Compresses an object before upload.
+
+    Args:
+        data (bytes): The object content.
+        compression (str, optional): "gzip", "zstd", or None / "none" to leave the
+            data as it is.
+
+    Returns:
+        tuple: The bytes to upload and the Content-Encoding to record with them
+        (None when uncompressed).
+
+    Raises:
+        ValueError: If the compression is not supported.
+    """
+    if compression in (None, "none"):
+        return data, None
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0), "gzip"
+    if compression == "zstd":
+        return b"".join(_zstd_frames([data], ZSTD_FRAME_SIZE)), "zstd"
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def compress_chunks(chunks, compression=None):
+    """
+    Compresses a stream of byte chunks into a single gzip or zstd stream, chunk by
+    chunk, so it can be fed to upload_stream_to_s3 without holding the object.
+
+    zstd streams are written as a sequence of frames of at most ZSTD_FRAME_SIZE
+    bytes of content each, which open_s3_object decompresses one at a time.
+
+    Raises:
+        ValueError: If the compression is not supported.
+    """
+    if compression in (None, "none"):
+        return chunks
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return _compressed(chunks, compressor.compress, compressor.flush)
+    if compression == "zstd":
+        return _zstd_frames(chunks, ZSTD_FRAME_SIZE)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def _compressed(chunks, compress, finish):
+    for chunk in chunks:
+        compressed = compress(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+# Bytes of content in each zstd frame written, and bytes of a zstd object read from
+# S3 at a time. cramjam only decompresses whole frames, so a zstd object is written
+# as independent frames (a valid zstd stream) that can be decoded as they arrive.
+ZSTD_FRAME_SIZE = 4 * 2**20
+ZSTD_READ_SIZE = 2**20
+
+ZSTD_MAGIC = 0xFD2FB528
+
+
+def _zstd_frames(chunks, frame_size):
+    pending = []
+    pending_size = 0
+    written = False
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size < frame_size:
+            continue
+        data = memoryview(b"".join(pending))
+        whole = len(data) - len(data) % frame_size
+        for start in range(0, whole, frame_size):
+            yield bytes(cramjam.zstd.compress(data[start : start + frame_size]))
+        pending = [bytes(data[whole:])]
+        pending_size = len(pending[0])
+        written = True
+    if pending_size or not written:
+        yield bytes(cramjam.zstd.compress(b"".join(pending)))
+
+
+def _zstd_frame_end(buffer):
+    """
+    Returns the length of the zstd frame at the start of buffer, from its header
+    and block headers, or None if the buffer does not hold all of it yet.
+
+    Raises:
+        ValueError: If the buffer does not start with a zstd frame.
+    """
+    if len(buffer) < 5:
+        return None
+    if int.from_bytes(buffer[:4], "little") != ZSTD_MAGIC:
+        raise ValueError("Not a zstd frame")
+    descriptor = buffer[4]
+    single_segment = descriptor >> 5 & 1
+    position = 5 + (1 - single_segment)  # the window descriptor
+    position += (0, 1, 2, 4)[descriptor & 3]  # the dictionary id
+    position += (single_segment, 2, 4, 8)[descriptor >> 6]  # the content size
+    while True:
+        if len(buffer) < position + 3:
+            return None
+        header = int.from_bytes(buffer[position : position + 3], "little")
+        # an RLE block (type 1) holds one byte, whatever size it decodes to
+        position += 3 + (1 if header >> 1 & 3 == 1 else header >> 3)
+        if header & 1:
+            break
+    position += 4 * (descriptor >> 2 & 1)  # the content checksum
+    return position if len(buffer) >= position else None
+
+
+def _zstd_decoded_frames(body, read_size):
+    buffer = bytearray()
+    for chunk in iter(lambda: body.read(read_size), b""):
+        buffer += chunk
+        while (end := _zstd_frame_end(buffer)) is not None:
+            yield bytes(cramjam.zstd.decompress(bytes(buffer[:end])))
+            del buffer[:end]
+    if buffer:
+        raise ValueError("Truncated zstd object")
+
+
+class _ZstdReader(io.RawIOBase):
+    """A file object over a zstd response body, decompressed frame by frame."""
+
+    def __init__(self, body, read_size):
+        self._frames = _zstd_decoded_frames(body, read_size)
+        self._pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            frame = next(self._frames, None)
+            if frame is None:
+                return 0
+            self._pending = memoryview(frame)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def readall(self):
+        pending, self._pending = bytes(self._pending), memoryview(b"")
+        return pending + b"".join(self._frames)
+
+
+def open_s3_object(s3_client, bucket_name, key):
+    """
+    Opens an S3 object for reading, decompressing it according to its Content-Encoding.
+
+    gzip and zstd objects are decompressed as the response body is read, zstd ones
+    a frame at a time (see compress_chunks), so the compressed object is never held
+    whole. Objects without a Content-Encoding are returned as they are stored.
+
+    Returns:
+        file object: A binary file object over the object's decoded content.
+    """
+    response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    content_encoding = response.get("ContentEncoding")
+    if content_encoding == "gzip":
+        return gzip.GzipFile(fileobj=response["Body"])
+    if content_encoding == "zstd":
+        return io.BufferedReader(_ZstdReader(response["Body"], ZSTD_READ_SIZE))
+    return response["Body"]
+
+
+def create_filename(table_name, time, file_format="json", part=None, compression=None):
+    """
+    Generates a filename based on the current timestamp and the provided table name.
+
+    Args:
+        table_name (str): The name of the table to be included in the filename.
+        file_format (str): "json" or "parquet"; picks the file extension.
+        part (int, optional): Number of the part, for tables written in chunks.
+        compression (str, optional): Compression applied to a JSON file ("gzip" or
+            "zstd"), which adds ".gz" or ".zst" to the name.
+
+    Returns:
+        str: A string representing the generated filename, formatted as
+             "table_name/year/month/day/timestamp.json" (".pqt" for parquet), or
+             "table_name/year/month/day/timestamp/part-00001.json" for a part.
+    """
+
+    suffix = ""
+    if file_format != "parquet":
+        suffix = COMPRESSION_SUFFIXES.get(compression, "")
+    if part is not None:
+        extension = "pqt" if file_format == "parquet" else "json"
+        return f"{table_name}/{time}/part-{part:05d}.{extension}{suffix}"
+    if file_format == "parquet":
+        return create_filename_for_parquet(table_name, time)
+    filename = f"{table_name}/{time}.json{suffix}"
+    return filename
+
+
+def collect_credentials_from_AWS(sm_client, secret_id):
+    """Returns credentials from AWS Secret Manager, function
+    designed to be called from within connection_to_database function"""
+    response = sm_client.get_secret_value(SecretId=secret_id)
+    response_json = json.loads(response["SecretString"])
+
+    return response_json
+
+
+# Seconds a secret is served from cache before Secrets Manager is asked again
+SECRETS_TTL_SECONDS = 300
+
+
+# secret_id -> (time fetched, credentials), kept across warm invocations
+_credentials_cache = {}
+
+
+def get_credentials(secret_id, ttl=SECRETS_TTL_SECONDS):
+    """
+    Returns credentials for secret_id, calling Secrets Manager only when they
+    are not cached or were fetched more than ttl seconds ago.
+
+    Args:
+        secret_id (str): Name or ARN of the secret.
+        ttl (int, optional): Seconds a cached secret stays valid.
+
+    Returns:
+        dict: The parsed secret.
+    """
+    now = time.monotonic()
+    cached = _credentials_cache.get(secret_id)
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1]
+
+    sm_client = boto3.client("secretsmanager")
+    credentials = collect_credentials_from_AWS(sm_client, secret_id)
+    _credentials_cache[secret_id] = (now, credentials)
+    return credentials
+
+
+def clear_credentials_cache():
+    """Forgets every cached secret, so the next lookup goes to Secrets Manager."""
+    _credentials_cache.clear()
+
+
+def connection_to_database(
+    secret_id="arn:aws:secretsmanager:eu-west-2:195275662632:secret:totesys_database-RBM0fV",
+):
+    """
+    Returns instance of pg8000 Connection for users to run database
+    queries from totesys database and warehouse; secret_id will default to totesys database.
+
+    Credentials are cached for SECRETS_TTL_SECONDS (see get_credentials).
+
+    To access the warehouse, pass secret_id argument: "arn:aws:secretsmanager:eu-west-2:195275662632:secret:database_warehouse-u8BUI3"
+    """
+    from pg8000.native import Connection
+
+    response = get_credentials(secret_id)
+
+    user = response["username"]
+    password = response["password"]
+    database = response["dbname"]
+    host = response["host"]
+    port = response["port"]
+
+    return Connection(
+        user=user, password=password, database=database, host=host, port=port
+    )
+
+
+def connection_is_alive(conn):
+    """
+    Checks that a connection kept from an earlier invocation can still run queries.
+
+    Returns:
+        bool: False if the round trip fails (dropped socket, server restart, or
+        a transaction left aborted), True otherwise.
+    """
+    import pg8000.exceptions
+
+    try:
+        conn.run("SELECT 1")
+    except (pg8000.exceptions.Error, OSError):
+        return False
+    return True
+
+
+def check_for_data(s3_client, bucket_name):
+    """This checks for presence of data in S3 Ingestion Bucket"""
+
+    response = s3_client.list_objects_v2(Bucket=bucket_name)
+    return False if response["KeyCount"] < 1 else True
+
+
+def get_s3_bucket_name(bucket_prefix):
+    # alternative method using env variables
+    # load_dotenv()
+    # bucket_name = os.getenv(bucket_key)
+    # if not bucket_name:
+    #     raise ValueError("bucket name not found")
+    # return bucket_name
+
+    """
+    Retrieve the name of the  S3 bucket that starts with the specified prefix.
+    ingest_bucket_prefix - "data-squid-ingest-bucket-"
+    transform_bucket_prefix - "data-squid-transform-bucket-"
+
+    Parameters:
+    bucket_prefix (str): The prefix to match against the names of S3 buckets.
+
+    Returns:
+    str: The name of the first S3 bucket that starts with the given prefix.
+
+
+    """
+
+    s3_client = boto3.client("s3")
+
+    response = s3_client.list_buckets()
+    for bucket in response["Buckets"]:
+        if bucket["Name"].startswith(bucket_prefix):
+            return bucket["Name"]
+    else:
+        raise ValueError("Error: bucket prefix not found")
+
+
+MANIFEST_KEY = "state/manifest.json"
+
+
+def read_manifest(s3_client, bucket_name):
+    """
+    Reads the state manifest of a bucket.
+
+    The manifest is a single JSON object that replaces the per-table
+    'last_extracted.txt' / 'last_transformed.txt' markers. For every table it holds
+    the watermark of the latest run, the object keys that run wrote, their row count
+    and a sha256 checksum of their content:
+
+        {"version": 3, "tables": {"staff": {"watermark": ..., "keys": [...],
+                                            "format": "json", "row_count": 20,
+                                            "checksum": "..."}}}
+
+    Args:
+        s3_client (boto3.client): S3 client used to read the manifest.
+        bucket_name (str): Name of the bucket the manifest describes.
+
+    Returns:
+        tuple: The manifest dict and the ETag it was read with. A bucket without a
+        manifest gives an empty manifest and an ETag of None.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=MANIFEST_KEY)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return {"version": 0, "tables": {}}, None
+        raise
+    manifest = json.loads(response["Body"].read().decode("utf-8"))
+    return manifest, response["ETag"]
+
+
+def write_manifest(s3_client, bucket_name, manifest, etag):
+    """
+    Writes the manifest with its version bumped, provided nobody has written it since
+    it was read: If-Match on the ETag it was read with, or If-None-Match when the
+    bucket had no manifest yet.
+
+    Returns:
+        str: The ETag of the new manifest.
+
+    Raises:
+        ClientError: 'PreconditionFailed' if the manifest was changed concurrently.
+    """
+    body = json.dumps({**manifest, "version": manifest.get("version", 0) + 1}, indent=4)
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    response = s3_client.put_object(
+        Bucket=bucket_name, Key=MANIFEST_KEY, Body=body.encode("utf-8"), **condition
+    )
+    return response["ETag"]
+
+
+def update_manifest(
+    s3_client, bucket_name, entries, manifest=None, etag=None, attempts=3, fields=None
+):
+    """
+    Merges table entries into the bucket manifest in one conditional write.
+
+    If the manifest changed since it was read, it is read again and the entries are
+    merged into the newer copy, up to attempts times, so two runs that touched
+    different tables never overwrite each other's watermarks.
+
+    Args:
+        s3_client (boto3.client): S3 client used for the manifest.
+        bucket_name (str): Name of the bucket the manifest describes.
+        entries (dict): Maps table names to entries built with manifest_entry.
+        manifest (dict, optional): The manifest as already read by the caller.
+        etag (str, optional): The ETag the caller's manifest was read with.
+        attempts (int): How many conflicting writes to tolerate.
+        fields (dict, optional): Top-level manifest keys to set along with the
+            entries, such as the extraction checkpoint.
+
+    Returns:
+        str: The ETag of the new manifest.
+    """
+    for attempt in range(attempts):
+        if manifest is None:
+            manifest, etag = read_manifest(s3_client, bucket_name)
+        updated = {
+            **manifest,
+            **(fields or {}),
+            "tables": {**manifest.get("tables", {}), **entries},
+        }
+        try:
+            return write_manifest(s3_client, bucket_name, updated, etag)
+        except ClientError as e:
+            if (
+                e.response["Error"]["Code"] != "PreconditionFailed"
+                or attempt == attempts - 1
+            ):
+                raise
+            manifest = None
+
+
+def manifest_entry(
+    keys,
+    row_count,
+    checksum,
+    watermark,
+    file_format="json",
+    boundary=None,
+    content_checksum=None,
+    calendar_end=None,
+):
+    """
+    Builds the manifest entry for a table written to the given object keys.
+
+    boundary is only recorded for extracted tables: the [primary key, last_updated]
+    pairs the next extraction will fetch again because of its overlap window.
+    content_checksum is the change probe's checksum of a small static table.
+    calendar_end is only recorded for calendar outputs such as dim_date: the last
+    day (ISO date) that the parts written so far cover.
+    """
+    entry = {
+        "watermark": watermark,
+        "keys": list(keys),
+        "format": file_format,
+        "row_count": row_count,
+        "checksum": checksum,
+    }
+    if boundary is not None:
+        entry["boundary"] = list(boundary)
+    if content_checksum is not None:
+        entry["content_checksum"] = content_checksum
+    if calendar_end is not None:
+        entry["calendar_end"] = calendar_end
+    return entry
+
+
+def parse_watermark(value):
+    """
+    Parses a stored watermark: an ISO timestamp, or the '%Y/%m/%d/%H:%M' wall-clock
+    form written by earlier versions of the extraction lambda. None stays None.
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, "%Y/%m/%d/%H:%M")
+
+
+def resolve_table_keys(
+    s3_client,
+    bucket_name,
+    table,
+    manifest=None,
+    marker="last_extracted.txt",
+    file_format="json",
+):
+    """
+    Returns the object keys holding the latest version of a table and their format.
+
+    Tables recorded in the manifest are resolved without any S3 call. Tables that are
+    not (buckets written before the manifest existed) fall back to the timestamp in
+    the legacy '{table}/{marker}' object.
+
+    Returns:
+        tuple: The list of object keys and the format they are written in.
+    """
+    entry = (manifest or {}).get("tables", {}).get(table)
+    if entry:
+        return entry["keys"], entry.get("format", file_format)
+    marker_obj = s3_client.get_object(Bucket=bucket_name, Key=f"{table}/{marker}")
+    timestamp = marker_obj["Body"].read().decode("utf-8")
+    return [create_filename(table, timestamp, file_format=file_format)], file_format
+
+
+def create_filename_for_parquet(table_name, time):
+    """
+    Generates a filename based on the current timestamp and the provided table name.
+
+    Args:
+        table_name (str): The name of the table to be included in the filename.
+
+    Returns:
+        str: A string representing the generated filename, formatted as
+             "table_name/year/month/day/timestamp.pqt".
+    """
+    # timestamp = datetime.now().isoformat()
+    # year = datetime.now().strftime("%Y")
+    # month = datetime.now().strftime("%m")
+    # day = datetime.now().strftime("%d")
+
+    filename = f"{table_name}/{time}.pqt"
+    return filename
@@ -0,0 +1,971 @@
+"""
+Extraction lambda helpers: reading totesys with pg8000 and encoding rows as JSON
+(or Parquet) for the ingestion bucket.
+
+pandas is imported only by the Parquet path, so a JSON extraction never loads it.
+"""
+
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from decimal import Decimal
+import hashlib
+import json
+from json.encoder import encode_basestring_ascii
+import io
+import itertools
+import re
+import uuid
+from utils.common import compress_chunks, parse_watermark
+
+
+class CustomEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        elif isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
+
+
+def format_data_to_json(rows, columns):
+    """
+    Convert data from rows and columns into a JSON-formatted bytes object.
+
+    Args:
+        rows (list of tuple): A list of tuples containing the data to be converted.
+        columns (list of str): A list of column names corresponding to the data in rows.
+
+    Returns:
+        bytes: A bytes object containing the JSON-formatted data.
+
+    The function uses a custom JSON encoder (CustomEncoder) to handle non-serializable
+    objects such as datetime and Decimal. The data is first converted into a list of
+    dictionaries, where each dictionary represents a row of data with column names as keys.
+    The resulting list of dictionaries is then serialized into JSON and returned as a
+    UTF-8 encoded bytes object.
+    """
+    data = [dict(zip(columns, row)) for row in rows]
+
+    json_buffer = io.StringIO()
+    json.dump(data, json_buffer, cls=CustomEncoder)
+
+    json_buffer.seek(0)
+
+    return json_buffer.getvalue().encode("utf-8")
+
+
+def _encode_json_float(value):
+    # json.dumps spells the non-finite floats NaN/Infinity/-Infinity
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "Infinity" if value > 0 else "-Infinity"
+    return float.__repr__(value)
+
+
+def _encode_json_decimal(value):
+    return _encode_json_float(float(value))
+
+
+def _encode_json_isoformat(value):
+    return f'"{value.isoformat()}"'
+
+
+def _encode_json_default(value):
+    return json.dumps(value, cls=CustomEncoder)
+
+
+# JSON encoders for the Postgres type OIDs found in totesys, chosen once per column
+PG_TYPE_JSON_ENCODERS = {
+    16: lambda value: "true" if value else "false",  # bool
+    20: int.__repr__,  # int8
+    21: int.__repr__,  # int2
+    23: int.__repr__,  # int4
+    25: encode_basestring_ascii,  # text
+    700: _encode_json_float,  # float4
+    701: _encode_json_float,  # float8
+    1042: encode_basestring_ascii,  # char
+    1043: encode_basestring_ascii,  # varchar
+    1082: _encode_json_isoformat,  # date
+    1083: _encode_json_isoformat,  # time
+    1114: _encode_json_isoformat,  # timestamp
+    1184: _encode_json_isoformat,  # timestamptz
+    1700: _encode_json_decimal,  # numeric
+}
+
+
+def _encode_json_timestamp_text(value):
+    # Postgres sends "YYYY-MM-DD HH:MM:SS[.ffffff]" with trailing zeros trimmed from
+    # the fraction; pad it back so the output matches datetime.isoformat()
+    date, _, time = value.partition(" ")
+    seconds, dot, fraction = time.partition(".")
+    if dot:
+        return f'"{date}T{seconds}.{fraction:0<6}"'
+    return f'"{date}T{time}"'
+
+
+# Type OIDs read_wire_text keeps as the text Postgres sends, and the JSON encoders for
+# that text. Numerics are written verbatim, so no digits are lost to float().
+RAW_JSON_ENCODERS = {
+    1114: _encode_json_timestamp_text,  # timestamp
+    1700: str,  # numeric (NaN and Infinity are spelled as json.dumps spells them)
+}
+
+
+@contextmanager
+def read_wire_text(conn, enabled=True):
+    """
+    Registers pass-through input adapters for the RAW_JSON_ENCODERS types on a
+    pg8000 connection, and restores the connection's own adapters on exit.
+
+    Queries run inside the block return timestamps and numerics as the text Postgres
+    sent instead of datetime and Decimal objects, which iter_json_rows writes out
+    without building (and throwing away) a Python object per value. The adapters are
+    swapped only around the data reads because the rest of the extraction (the
+    change probe, watermarks, Parquet) needs the typed values.
+
+    Args:
+        conn (pg8000.native.Connection): Connection the rows are read with.
+        enabled (bool): When False the block leaves the connection untouched.
+
+    Connections without pg8000's adapter table are left untouched too, so their rows
+    keep whatever types they already return.
+    """
+    pg_types = getattr(conn, "pg_types", None)
+    if not enabled or not isinstance(pg_types, dict):
+        yield
+        return
+    saved = {oid: pg_types[oid] for oid in RAW_JSON_ENCODERS if oid in pg_types}
+    for oid in RAW_JSON_ENCODERS:
+        conn.register_in_adapter(oid, str)
+    try:
+        yield
+    finally:
+        for oid in RAW_JSON_ENCODERS:
+            if oid in saved:
+                pg_types[oid] = saved[oid]
+            else:
+                pg_types.pop(oid, None)
+
+
+def _pick_json_encoder(column, values):
+    type_oid = column.get("type_oid")
+    if type_oid in RAW_JSON_ENCODERS:
+        first = next((value for value in values if value is not None), None)
+        if isinstance(first, str):
+            return RAW_JSON_ENCODERS[type_oid]
+    return PG_TYPE_JSON_ENCODERS.get(type_oid, _encode_json_default)
+
+
+def iter_json_rows(rows, columns, chunk_size=10000):
+    """
+    Encodes rows as JSON objects, column by column, and yields them in byte chunks.
+
+    Args:
+        rows (list of list): Rows as returned by conn.run.
+        columns (list of dict): Column descriptions from conn.columns. The encoder for
+            each column is picked once per chunk from its 'type_oid' (and, for the
+            types read_wire_text covers, whether the values arrived as text); columns
+            without a known type fall back to json.dumps with CustomEncoder.
+        chunk_size (int): Number of rows encoded per yielded chunk.
+
+    Yields:
+        bytes: Comma separated JSON objects (no enclosing brackets) for up to
+        chunk_size rows.
+
+    Each column's values are converted with one list comprehension and every row is
+    assembled with a single %-format of a template holding the pre-encoded keys, so no
+    per-row dict is built and no Python-level encoder hook runs per value.
+    """
+    template = (
+        "{"
+        + ", ".join(
+            json.dumps(column["name"]).replace("%", "%%") + ": %s" for column in columns
+        )
+        + "}"
+    )
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        encoded_columns = []
+        for column, values in zip(columns, zip(*chunk)):
+            encode = _pick_json_encoder(column, values)
+            encoded_columns.append(
+                ["null" if value is None else encode(value) for value in values]
+            )
+        yield ", ".join([template % values for values in zip(*encoded_columns)]).encode(
+            "utf-8"
+        )
+
+
+def encode_rows_to_json(rows, columns):
+    """
+    Convert rows from the database into a JSON-formatted bytes object.
+
+    The output is the same JSON array format_data_to_json produces, but it is
+    built column by column (see iter_json_rows) and written straight into a bytes
+    buffer.
+
+    Args:
+        rows (list of list): Rows as returned by conn.run.
+        columns (list of dict): Column descriptions from conn.columns.
+
+    Returns:
+        tuple: (payload, row_count) - the JSON bytes and the number of rows they
+        hold, so callers can tell an empty extraction apart without parsing the
+        payload again.
+    """
+    buffer = io.BytesIO()
+    buffer.write(b"[")
+    separator = b""
+    for chunk in iter_json_rows(rows, columns):
+        buffer.write(separator)
+        buffer.write(chunk)
+        separator = b", "
+    buffer.write(b"]")
+    return buffer.getvalue(), len(rows)
+
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one).
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+
+
+def export_snapshot(conn):
+    """
+    Opens a repeatable-read transaction on conn and exports its snapshot.
+
+    The transaction must stay open (no COMMIT on conn) for as long as other
+    connections need to attach to the snapshot.
+
+    Returns:
+        str: The snapshot identifier returned by pg_export_snapshot().
+    """
+    conn.run("START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    return conn.run("SELECT pg_export_snapshot()")[0][0]
+
+
+def start_read_transaction(conn, snapshot_id=None):
+    """
+    Starts a read-only transaction on conn, attached to an exported snapshot if given.
+
+    Args:
+        conn (pg8000.native.Connection): The connection to start the transaction on.
+        snapshot_id (str, optional): Identifier returned by export_snapshot.
+
+    Raises:
+        ValueError: If snapshot_id does not look like a snapshot identifier.
+    """
+    if snapshot_id is None:
+        conn.run("START TRANSACTION READ ONLY")
+        return
+
+    # SET TRANSACTION SNAPSHOT does not accept bind parameters
+    if not re.fullmatch(r"[0-9A-Fa-f]+(-[0-9A-Fa-f]+)+", snapshot_id):
+        raise ValueError(f"Invalid snapshot id: {snapshot_id}")
+    conn.run("START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    conn.run(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+
+
+def stream_query_batches(
+    conn,
+    query,
+    batch_size,
+    cursor_name="extract_cursor",
+    snapshot_id=None,
+    params=None,
+    raw=False,
+):
+    """
+    Runs a query through a server-side cursor and yields the rows in fixed-size batches.
+
+    Args:
+        conn (pg8000.native.Connection): Database connection used to run the query.
+        query (str): The SELECT statement to stream.
+        batch_size (int): Maximum number of rows fetched per round trip.
+        cursor_name (str): Name of the server-side cursor to declare.
+        snapshot_id (str, optional): Exported snapshot the cursor reads from.
+        params (dict, optional): Values for the query's named (:name) parameters.
+        raw (bool): Fetch timestamps and numerics as wire text (see read_wire_text).
+
+    Yields:
+        tuple: (rows, columns) where rows is a list of row lists and columns is the
+        list of column descriptions (conn.columns) for the batch.
+
+    The cursor lives inside its own read-only transaction, which is committed once the
+    result set is exhausted (or rolled back if anything fails), so only one batch of
+    rows is held in memory at a time.
+    """
+    statement = query.strip().rstrip(";")
+    start_read_transaction(conn, snapshot_id)
+    try:
+        conn.run(
+            f"DECLARE {cursor_name} NO SCROLL CURSOR FOR {statement}", **(params or {})
+        )
+        with read_wire_text(conn, raw):
+            while True:
+                rows = conn.run(f"FETCH FORWARD {int(batch_size)} FROM {cursor_name}")
+                if not rows:
+                    break
+                yield rows, conn.columns
+        conn.run(f"CLOSE {cursor_name}")
+    except BaseException:
+        conn.run("ROLLBACK")
+        raise
+    conn.run("COMMIT")
+
+
+def json_array_chunks(batches):
+    """
+    Yields the byte chunks of a JSON array built from a stream of (rows, columns) batches.
+
+    The concatenated output is identical to what format_data_to_json produces for the
+    same rows in one go.
+    """
+    yield b"["
+    separator = b""
+    for rows, columns in batches:
+        for chunk in iter_json_rows(rows, columns):
+            yield separator
+            yield chunk
+            separator = b", "
+    yield b"]"
+
+
+def upload_stream_to_s3(
+    s3_client,
+    chunks,
+    bucket_name,
+    object_name,
+    part_size=MIN_MULTIPART_PART_SIZE,
+    digest=None,
+    content_encoding=None,
+):
+    """
+    Uploads an iterable of byte chunks to S3 as a multipart upload.
+
+    Chunks are buffered until at least part_size bytes are available and then sent as a
+    single part, so memory use is bounded by the part size rather than the object size.
+    Objects smaller than one part are written with a plain put_object call.
+
+    Args:
+        s3_client (boto3.client): S3 client used for the upload.
+        chunks (iterable of bytes): The object content, in order.
+        bucket_name (str): Name of the target S3 bucket.
+        object_name (str): Key of the object to create.
+        part_size (int): Minimum size of each uploaded part in bytes.
+        digest (hashlib hash, optional): Updated with every chunk, so the caller gets a
+            checksum of the object without holding it in memory.
+        content_encoding (str, optional): Content-Encoding recorded on the object.
+
+    Returns:
+        int: Total number of bytes written.
+
+    Raises:
+        ClientError: If any S3 call fails; an in-progress multipart upload is aborted first.
+    """
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+    total_bytes = 0
+    extra_args = {"ContentEncoding": content_encoding} if content_encoding else {}
+
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            total_bytes += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            if len(buffer) < part_size:
+                continue
+            if upload_id is None:
+                upload_id = s3_client.create_multipart_upload(
+                    Bucket=bucket_name, Key=object_name, **extra_args
+                )["UploadId"]
+            part_number = len(parts) + 1
+            response = s3_client.upload_part(
+                Bucket=bucket_name,
+                Key=object_name,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=bytes(buffer),
+            )
+            parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+            buffer.clear()
+
+        if upload_id is None:
+            s3_client.put_object(
+                Bucket=bucket_name, Key=object_name, Body=bytes(buffer), **extra_args
+            )
+            return total_bytes
+
+        if buffer:
+            part_number = len(parts) + 1
+            response = s3_client.upload_part(
+                Bucket=bucket_name,
+                Key=object_name,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=bytes(buffer),
+            )
+            parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=object_name,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        if upload_id is not None:
+            s3_client.abort_multipart_upload(
+                Bucket=bucket_name, Key=object_name, UploadId=upload_id
+            )
+        raise
+
+    return total_bytes
+
+
+def stream_table_to_s3(
+    s3_client,
+    conn,
+    query,
+    bucket_name,
+    object_name,
+    batch_size,
+    part_size=MIN_MULTIPART_PART_SIZE,
+    snapshot_id=None,
+    digest=None,
+    params=None,
+    row_filter=None,
+    compression=None,
+    raw=False,
+    stop=None,
+):
+    """
+    Streams the result of a query into a JSON object in S3, one batch at a time.
+
+    Rows are pulled from a server-side cursor in batches of batch_size, encoded and pushed
+    into a multipart upload, so peak memory depends on the batch and part sizes rather
+    than on the size of the table. Nothing is uploaded when the query returns no rows.
+
+    Args:
+        s3_client (boto3.client): S3 client used for the upload.
+        conn (pg8000.native.Connection): Database connection used to run the query.
+        query (str): The SELECT statement to extract.
+        bucket_name (str): Name of the target S3 bucket.
+        object_name (str): Key of the JSON object to create.
+        batch_size (int): Number of rows fetched from the cursor per round trip.
+        part_size (int): Minimum size of each multipart part in bytes.
+        snapshot_id (str, optional): Exported snapshot the rows are read from.
+        digest (hashlib hash, optional): Updated with the bytes written to S3.
+        params (dict, optional): Values for the query's named parameters.
+        row_filter (callable, optional): Called with (rows, columns) for every batch;
+            only the rows it returns are written.
+        compression (str, optional): "gzip" or "zstd" to compress the JSON as it is
+            streamed; recorded as the object's Content-Encoding.
+        raw (bool): Fetch timestamps and numerics as wire text (see read_wire_text).
+        stop (callable, optional): Checked after every batch; once it returns True
+            no further batches are read and the object is completed with the rows
+            written so far.
+
+    Returns:
+        int: Number of rows written to S3.
+    """
+    row_count = 0
+
+    def counted(batches):
+        nonlocal row_count
+        for rows, columns in batches:
+            if row_filter is not None:
+                rows = row_filter(rows, columns)
+            row_count += len(rows)
+            yield rows, columns
+            if stop is not None and stop():
+                break
+
+    source = stream_query_batches(
+        conn, query, batch_size, snapshot_id=snapshot_id, params=params, raw=raw
+    )
+    batches = (batch for batch in counted(source) if batch[0])
+    first_batch = next(batches, None)
+    if first_batch is None:
+        return 0
+
+    chunks = json_array_chunks(itertools.chain([first_batch], batches))
+    # gzip and zstd are also the Content-Encoding tokens for the two codecs
+    content_encoding = None if compression in (None, "none") else compression
+    try:
+        upload_stream_to_s3(
+            s3_client,
+            compress_chunks(chunks, compression),
+            bucket_name,
+            object_name,
+            part_size=part_size,
+            digest=digest,
+            content_encoding=content_encoding,
+        )
+    finally:
+        source.close()
+    return row_count
+
+
+# pandas dtypes for the Postgres type OIDs found in totesys; anything else stays object
+PG_TYPE_DTYPES = {
+    16: "boolean",  # bool
+    20: "Int64",  # int8
+    21: "Int64",  # int2
+    23: "Int64",  # int4
+    700: "float64",  # float4
+    701: "float64",  # float8
+    1700: "float64",  # numeric
+    1082: "datetime64[ns]",  # date
+    1114: "datetime64[ns]",  # timestamp
+    1184: "datetime64[ns, UTC]",  # timestamptz
+}
+
+
+def rows_to_dataframe(rows, columns):
+    """
+    Builds a typed pandas DataFrame directly from pg8000 rows.
+
+    Args:
+        rows (list of list): Rows as returned by conn.run.
+        columns (list of dict): Column descriptions from conn.columns; the
+            'type_oid' of each column picks its dtype from PG_TYPE_DTYPES.
+
+    Returns:
+        pd.DataFrame: One typed column per database column. Values are converted
+        from their Python objects (int, Decimal, datetime...) without going
+        through text.
+    """
+    import pandas as pd
+
+    values_by_column = list(zip(*rows)) if rows else [()] * len(columns)
+    data = {}
+    for column, values in zip(columns, values_by_column):
+        dtype = PG_TYPE_DTYPES.get(column.get("type_oid"), "object")
+        if dtype.startswith("datetime64"):
+            data[column["name"]] = pd.to_datetime(
+                pd.Series(values, dtype="object"), utc=dtype.endswith("UTC]")
+            )
+        else:
+            data[column["name"]] = pd.Series(values, dtype=dtype)
+    return pd.DataFrame(data, columns=[column["name"] for column in columns])
+
+
+def format_data_to_parquet(rows, columns, compression="snappy"):
+    """
+    Convert rows from the database into Parquet bytes with typed columns.
+
+    Args:
+        rows (list of list): Rows as returned by conn.run.
+        columns (list of dict): Column descriptions from conn.columns.
+        compression (str): Parquet codec; see dataframe_to_parquet.
+
+    Returns:
+        memoryview: The Parquet file content.
+    """
+    from utils.transform import dataframe_to_parquet
+
+    return dataframe_to_parquet(rows_to_dataframe(rows, columns), compression)
+
+
+def probe_table_changes(conn, since, checksum_keys=None, boundaries=None):
+    """
+    Finds out which tables have changed without reading them, in one round trip.
+
+    Args:
+        conn (pg8000.native.Connection): The connection to probe with.
+        since (dict): Maps each table to probe to the lower bound (inclusive) for
+            last_updated, or to None to count the whole table.
+        checksum_keys (dict, optional): Maps small tables to their primary key. These
+            are probed over their whole content instead: an md5 of every row, in
+            primary-key order, also catches edits that did not touch last_updated.
+        boundaries (dict, optional): Maps tables to their primary key and the
+            [primary key, last_updated] pairs the previous extraction delivered
+            from the overlap window (see WatermarkTracker). Rows still holding
+            those pairs are not counted, so a table has changed if any row is.
+
+    Returns:
+        dict: Maps each probed table to (row count, max(last_updated), content
+        checksum or None).
+    """
+    checksum_keys = checksum_keys or {}
+    boundaries = boundaries or {}
+    selects, params = [], {}
+    for table, table_since in since.items():
+        if table in checksum_keys:
+            selects.append(
+                f"SELECT '{table}', count(*), max(last_updated), "
+                f"md5(string_agg({table}::text, ',' ORDER BY {checksum_keys[table]})) "
+                f"FROM {table}"
+            )
+        elif table_since is None:
+            selects.append(
+                f"SELECT '{table}', count(*), max(last_updated), NULL FROM {table}"
+            )
+        else:
+            select = (
+                f"SELECT '{table}', count(*), max(last_updated), NULL FROM {table} "
+                f"WHERE last_updated >= :{table}_since"
+            )
+            params[f"{table}_since"] = table_since
+            primary_key, boundary = boundaries.get(table, (None, []))
+            if boundary:
+                select += (
+                    f" AND ({primary_key}, last_updated) NOT IN (SELECT * FROM "
+                    f"unnest(CAST(:{table}_boundary_ids AS bigint[]), "
+                    f"CAST(:{table}_boundary_updated AS timestamp[])))"
+                )
+                params[f"{table}_boundary_ids"] = [key for key, _ in boundary]
+                params[f"{table}_boundary_updated"] = [
+                    last_updated for _, last_updated in boundary
+                ]
+            selects.append(select)
+    if not selects:
+        return {}
+    rows = conn.run(" UNION ALL ".join(selects) + ";", **params)
+    return {
+        table: (row_count, max_updated, checksum)
+        for table, row_count, max_updated, checksum in rows
+    }
+
+
+def table_watermark(s3_client, bucket_name, table, manifest=None):
+    """
+    Returns the high-water mark of the latest extraction of a table: from the manifest
+    if it has an entry for the table, otherwise from the legacy
+    '{table}/last_extracted.txt'.
+
+    Returns:
+        tuple: The watermark as a datetime (None if the table has never had any rows)
+        and the boundary rows recorded with it.
+    """
+    entry = (manifest or {}).get("tables", {}).get(table)
+    if entry:
+        return parse_watermark(entry["watermark"]), entry.get("boundary", [])
+    try:
+        marker_obj = s3_client.get_object(
+            Bucket=bucket_name, Key=f"{table}/last_extracted.txt"
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None, []
+        raise
+    return parse_watermark(marker_obj["Body"].read().decode("utf-8")), []
+
+
+class WatermarkTracker:
+    """
+    Follows max(last_updated) over the rows of one extraction and drops rows the
+    previous extraction already delivered.
+
+    The extraction query re-reads an overlap window before the stored watermark, so
+    that rows committed late with an older last_updated are not missed. Rows in that
+    window which were extracted last time are recognised by their primary key and
+    last_updated (the boundary recorded with the watermark) and filtered out; a row
+    updated since then has a new last_updated and is kept.
+
+    Args:
+        primary_key (str): Name of the table's primary key column.
+        watermark (datetime, optional): The stored high-water mark.
+        boundary (list, optional): [primary key, last_updated] pairs stored with it.
+        overlap (int or float): Length of the overlap window in seconds.
+    """
+
+    def __init__(self, primary_key, watermark=None, boundary=(), overlap=0):
+        self.primary_key = primary_key
+        self.watermark = watermark
+        self.overlap = timedelta(seconds=overlap)
+        self.seen = {(key, last_updated) for key, last_updated in boundary}
+        # insertion-ordered set of (primary key, last_updated) inside the window
+        self.window = dict.fromkeys(
+            (key, datetime.fromisoformat(last_updated))
+            for key, last_updated in boundary
+        )
+
+    def since(self):
+        """Lower bound (inclusive) for last_updated in the extraction query."""
+        if self.watermark is None:
+            return None
+        return self.watermark - self.overlap
+
+    def filter(self, rows, columns):
+        """
+        Records the rows of a batch and returns those not extracted before.
+
+        last_updated may be a datetime or, for rows read with read_wire_text, the
+        timestamp text Postgres sent; the rows themselves are returned unchanged.
+        """
+        names = [column["name"] for column in columns]
+        key_index = names.index(self.primary_key)
+        updated_index = names.index("last_updated")
+        new_rows = []
+        for row in rows:
+            key, last_updated = row[key_index], row[updated_index]
+            if isinstance(last_updated, str):
+                last_updated = datetime.fromisoformat(last_updated)
+            if (key, last_updated.isoformat()) not in self.seen:
+                new_rows.append(row)
+            if self.watermark is None or last_updated > self.watermark:
+                self.watermark = last_updated
+            self.window[(key, last_updated)] = None
+        # only rows inside the overlap window of the newest watermark are kept
+        self.window = {
+            (key, last_updated): None
+            for key, last_updated in self.window
+            if last_updated >= self.since()
+        }
+        return new_rows
+
+    def boundary(self):
+        """[primary key, last_updated] pairs to store alongside the watermark."""
+        return [[key, last_updated.isoformat()] for key, last_updated in self.window]
+
+
+def _pick_row_hash_encoder(column, values):
+    # numerics are hashed as their decimal text, which is what read_wire_text returns
+    # and what str() gives for pg8000's Decimal, so a row hashes the same either way
+    if column.get("type_oid") == 1700:
+        return str
+    return _pick_json_encoder(column, values)
+
+
+class RowHashIndex:
+    """
+    Content hashes of the extracted rows of a table, by primary key, used to drop
+    rows whose last_updated was bumped without any change to the extracted columns.
+
+    A row's hash is a 64-bit blake2b digest of its values in every extracted column
+    but last_updated, each written as JSON text as iter_json_rows would write it
+    (numerics as their decimal text), so it does not depend on whether the rows were
+    read as wire text or as Python objects.
+
+    The index is stored as segments, each two arrays sorted by primary key: 8-byte
+    ids then 8-byte hashes, so 16 bytes per row. A base segment holds every row
+    when it was written, and delta segments the rows changed since, oldest first.
+    The base is kept in memory as its arrays and searched with bisect; only the
+    deltas and the hashes recorded by filter() (changes) are held in dicts, and
+    each run only writes its changes, as a new delta (see write_row_hash_index).
+
+    Args:
+        primary_key (str): Name of the table's (integer) primary key column.
+        ids (array, optional): The base segment's sorted ids ("q").
+        hashes (array, optional): Their hashes ("Q").
+        deltas (list, optional): The delta segments, as (ids, hashes) pairs.
+
+    suppressed counts the rows filter() dropped.
+    """
+
+    def __init__(self, primary_key, ids=None, hashes=None, deltas=()):
+        self.primary_key = primary_key
+        self.ids = ids if ids is not None else array("q")
+        self.hashes = hashes if hashes is not None else array("Q")
+        self.delta = {}
+        for delta_ids, delta_hashes in deltas:
+            self.delta.update(zip(delta_ids, delta_hashes))
+        self.changes = {}
+        self.suppressed = 0
+
+    @property
+    def changed(self):
+        """Whether filter() has recorded any new hash."""
+        return bool(self.changes)
+
+    @staticmethod
+    def segment_from_bytes(data):
+        """Reads a segment written by segment_to_bytes, as (ids, hashes) arrays."""
+        ids, hashes = array("q"), array("Q")
+        ids.frombytes(data[: len(data) // 2])
+        hashes.frombytes(data[len(data) // 2 :])
+        return ids, hashes
+
+    @staticmethod
+    def segment_to_bytes(entries):
+        """
+        A segment of {primary key: hash} as sorted ids followed by their hashes,
+        in native byte order.
+        """
+        ids = array("q", sorted(entries))
+        hashes = array("Q", map(entries.__getitem__, ids))
+        return ids.tobytes() + hashes.tobytes()
+
+    def get(self, key):
+        """The hash recorded for a primary key, or None."""
+        row_hash = self.changes.get(key)
+        if row_hash is None:
+            row_hash = self.delta.get(key)
+        if row_hash is None:
+            position = bisect_left(self.ids, key)
+            if position < len(self.ids) and self.ids[position] == key:
+                row_hash = self.hashes[position]
+        return row_hash
+
+    def merged(self):
+        """The base, deltas and changes merged into one sorted (ids, hashes) pair."""
+        ids, hashes = array("q"), array("Q")
+        start = 0
+        for key, row_hash in sorted({**self.delta, **self.changes}.items()):
+            position = bisect_left(self.ids, key, start)
+            ids.extend(self.ids[start:position])
+            hashes.extend(self.hashes[start:position])
+            ids.append(key)
+            hashes.append(row_hash)
+            start = position
+            if position < len(self.ids) and self.ids[position] == key:
+                start += 1
+        ids.extend(self.ids[start:])
+        hashes.extend(self.hashes[start:])
+        return ids, hashes
+
+    def filter(self, rows, columns):
+        """
+        Returns the rows whose content hash differs from the one recorded for their
+        primary key (or that have none), and records the new hashes in changes.
+        """
+        if not rows:
+            return rows
+        names = [column["name"] for column in columns]
+        key_index = names.index(self.primary_key)
+        encoded_columns = []
+        for column, values in zip(columns, zip(*rows)):
+            if column["name"] == "last_updated":
+                continue
+            encode = _pick_row_hash_encoder(column, values)
+            encoded_columns.append(
+                ["null" if value is None else encode(value) for value in values]
+            )
+
+        changed_rows = []
+        for row, values in zip(rows, zip(*encoded_columns)):
+            digest = hashlib.blake2b(
+                "\x1f".join(values).encode("utf-8"), digest_size=8
+            ).digest()
+            row_hash = int.from_bytes(digest, "little")
+            key = row[key_index]
+            if self.get(key) == row_hash:
+                self.suppressed += 1
+                continue
+            self.changes[key] = row_hash
+            changed_rows.append(row)
+        return changed_rows
+
+
+ROW_HASH_INDEX_PREFIX = "state/row_hashes"
+
+# A table's deltas are merged into a new base once there are this many of them, or
+# once they hold more than a quarter as many rows as the base
+ROW_HASH_MAX_DELTAS = 8
+
+# (bucket, table) -> {segment key: (ids, hashes)} of the segments last read or
+# written, for warm starts
+_row_hash_cache = {}
+
+
+def row_hash_segments(stored):
+    """
+    Returns the keys of the segments of a row-hash index as recorded in a manifest
+    entry ({"base": key, "deltas": [key, ...]}), base first. An index recorded as a
+    single key, as before it had deltas, is a base alone.
+    """
+    if not stored:
+        return []
+    if isinstance(stored, str):
+        return [stored]
+    return [stored["base"], *stored["deltas"]]
+
+
+def read_row_hash_index(s3_client, bucket_name, table, primary_key, stored=None):
+    """
+    Loads the row-hash index recorded in a manifest entry (see row_hash_segments),
+    or returns an empty one when there is none. The segments of the last index read
+    or written for each table are kept for later invocations in the same execution
+    environment; segments are never overwritten (see write_row_hash_index), so a
+    kept copy cannot go stale.
+    """
+    keys = row_hash_segments(stored)
+    if not keys:
+        return RowHashIndex(primary_key)
+    cached = _row_hash_cache.get((bucket_name, table), {})
+    segments = {}
+    for key in keys:
+        if key not in cached:
+            data = s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+            cached[key] = RowHashIndex.segment_from_bytes(data)
+        segments[key] = cached[key]
+    _row_hash_cache[(bucket_name, table)] = segments
+    ids, hashes = segments[keys[0]]
+    return RowHashIndex(primary_key, ids, hashes, [segments[key] for key in keys[1:]])
+
+
+def write_row_hash_index(s3_client, bucket_name, table, index, stored=None):
+    """
+    Uploads the rows a run changed in a row-hash index, and returns the index's new
+    manifest record (see row_hash_segments).
+
+    Only index.changes are written, as a new delta segment, unless the deltas are
+    due to be merged (see ROW_HASH_MAX_DELTAS) or there is no base yet: then the
+    whole index is written as a new base and the deltas are dropped. Every segment
+    gets a new key, recorded in the table's manifest entry, so the new index only
+    takes effect once the manifest write that delivers its rows succeeds; the
+    segments it replaces are deleted after that write (see extract_data).
+    """
+    keys = row_hash_segments(stored)
+    if not index.changed:
+        return stored
+    key = f"{ROW_HASH_INDEX_PREFIX}/{table}/{uuid.uuid4().hex}.bin"
+    merge = (
+        not keys
+        or len(keys) > ROW_HASH_MAX_DELTAS
+        or 4 * (len(index.delta) + len(index.changes)) > len(index.ids)
+    )
+    if merge:
+        segment = index.merged()
+        data = segment[0].tobytes() + segment[1].tobytes()
+        new_keys, record = [key], {"base": key, "deltas": []}
+    else:
+        data = RowHashIndex.segment_to_bytes(index.changes)
+        segment = RowHashIndex.segment_from_bytes(data)
+        new_keys = keys + [key]
+        record = {"base": keys[0], "deltas": keys[1:] + [key]}
+    s3_client.put_object(Bucket=bucket_name, Key=key, Body=data)
+    cached = _row_hash_cache.get((bucket_name, table), {})
+    cached[key] = segment
+    _row_hash_cache[(bucket_name, table)] = {
+        segment_key: cached[segment_key]
+        for segment_key in new_keys
+        if segment_key in cached
+    }
+    return record
+
+
+class TimeBudget:
+    """
+    Tells a time-limited extraction when to stop starting new work, so that it can
+    record its progress before the Lambda is stopped.
+
+    Args:
+        remaining_time (callable): Returns the milliseconds left in the invocation,
+            such as the Lambda context's get_remaining_time_in_millis.
+        reserve (int or float): Seconds kept in hand for finishing the current
+            upload and writing the manifest and the report once work stops.
+
+    Once expired() has returned True it keeps doing so, so every table and batch
+    checked afterwards is left for the next run; stopped tells afterwards whether
+    the budget ran out. pending is filled in by extract_data with the tables the
+    run did not finish.
+    """
+
+    def __init__(self, remaining_time, reserve=60):
+        self.remaining_time = remaining_time
+        self.reserve = reserve
+        self.stopped = False
+        self.pending = []
+
+    def expired(self):
+        """True once fewer than reserve seconds are left."""
+        if not self.stopped and self.remaining_time() < self.reserve * 1000:
+            self.stopped = True
+        return self.stopped
@@ -0,0 +1,215 @@
+"""
+Load lambda helpers: reading processed Parquet and inserting it into the warehouse.
+"""
+
+import boto3
+import json
+import io
+import pg8000
+import pandas as pd
+from utils.common import (
+    collect_credentials_from_AWS,
+    open_s3_object,
+    resolve_table_keys,
+)
+from utils.schema import column_types, conform_dataframe
+
+
+def parquet_to_dataframe(bucket, table, manifest=None):
+    """
+    Fetches a parquet file, for a given table, from the transform S3 bucket
+    and converts the parquet file to a pandas dataframe
+
+    args:
+      bucket is S3 bucket name where transformed data is stored as parquet files
+      table is name of the database table
+      manifest is the transform bucket's state manifest; tables missing from it
+      fall back to '{table}/last_transformed.txt'
+
+    returns:
+      df: the last extracted parquet file converted to pandas dataframe
+    """
+    s3_client = boto3.client("s3")
+    keys, _ = resolve_table_keys(
+        s3_client,
+        bucket,
+        table,
+        manifest=manifest,
+        marker="last_transformed.txt",
+        file_format="parquet",
+    )
+
+    frames = []
+    for key in keys:
+        parquet_bytes_stream = open_s3_object(s3_client, bucket, key).read()
+        buffer = io.BytesIO(parquet_bytes_stream)
+        frames.append(pd.read_parquet(buffer))
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def connect_to_warehouse():
+    """
+    Establishes a connection to the data warehouse using credentials stored in AWS Secrets Manager.
+
+    This function retrieves the database credentials from AWS Secrets Manager, and then uses
+    these credentials to establish and return a connection to the data warehouse.
+
+    Returns:
+        pg8000.Connection: A connection object to the data warehouse.
+    """
+
+    secret_id = (
+        "arn:aws:secretsmanager:eu-west-2:195275662632:secret:database_warehouse-u8BUI3"
+    )
+    sm_client = boto3.client("secretsmanager")
+
+    secret = collect_credentials_from_AWS(sm_client, secret_id)
+
+    conn = pg8000.connect(
+        user=secret["username"],
+        database=secret["dbname"],
+        password=secret["password"],
+        host=secret["host"],
+        port=secret["port"],
+    )
+    return conn
+
+
+def warehouse_columns(conn, table_name):
+    """
+    Returns the names of the columns a warehouse table has, from
+    information_schema (empty if the table is not found).
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = %s",
+            (table_name,),
+        )
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def insert_data_to_table(conn, table_name, df):
+    """
+    Inserts data from a DataFrame into a specified database table, handling conflicts by doing nothing.
+
+    Args:
+        conn (pg8000.Connection): Database connection object.
+        table_name (str): Name of the table to insert data into.
+        df (pandas.DataFrame): DataFrame containing the data to insert. Tables in
+            the schema registry are conformed to it (see conform_dataframe), and
+            their date and time columns inserted as dates and times. Their
+            columns the warehouse table does not have yet (such as the date
+            keys, until sql/001_date_keys.sql has been applied) are left out.
+
+    Example:
+        conn = connect_to_warehouse()
+        df = pd.DataFrame({
+            'sales_record_id': [1, 2, 3],
+            'column1': ['value1', 'value2', 'value3'],
+            'column2': ['value4', 'value5', 'value6']
+        })
+        insert_data_to_table(conn, 'your_table_name', df)
+    """
+    # the warehouse's column order, and its dates and times, from the registry
+    df = conform_dataframe(df, table_name)
+    if column_types(table_name):
+        existing = warehouse_columns(conn, table_name)
+        missing = [column for column in df.columns if column not in existing]
+        if existing and missing:
+            print(f"Not loading {missing}: {table_name} has no such columns")
+            df = df.drop(columns=missing)
+    for column, (column_type, _) in column_types(table_name).items():
+        if column not in df.columns:
+            continue
+        if column_type == "date":
+            df[column] = df[column].dt.date
+        elif column_type == "time":
+            df[column] = df[column].dt.time
+
+    cursor = conn.cursor()
+    for index, row in df.iterrows():
+        columns = ", ".join(df.columns)
+        placeholders = ", ".join(["%s"] * len(row))
+        query = f"""
+            INSERT INTO {table_name} ({columns})
+            VALUES ({placeholders})
+            ON CONFLICT DO NOTHING
+        """
+        row_data = tuple(row)
+
+        try:
+            cursor.execute(query, row_data)
+            print(f"Inserted row {index + 1}")
+        except Exception as e:
+            print(f"Error inserting row {index + 1}: {e}")
+            print("row_data", row_data)
+    conn.commit()
+    cursor.close()
+
+
+def extract_tablenames_load(bucket_name, report_file):
+    """
+    Retrieves the list of updated table names from a report file in an S3 bucket.
+
+    Args:
+        bucket_name (str): Name of the S3 bucket.
+        report_file (str): Key (file path) of the report file in the S3 bucket.
+
+    Returns:
+        list: Names of the updated tables.
+    """
+
+    s3_client = boto3.client("s3")
+
+    report_file_obj = s3_client.get_object(Bucket=bucket_name, Key=report_file)
+    report_file_str = report_file_obj["Body"].read().decode("utf-8")
+    report_file = json.loads(report_file_str)
+    tables = report_file["transformed_tables"]
+    return tables
+
+
+# def warehouse_queries():
+#     # bucket_name = get_s3_bucket_name('data-squid-ingest-bucket-')
+#     # df_date = dim_date(start="2024-11-03", end="2024-12-03")
+#     # df_staff = convert_json_to_df_from_s3('staff', bucket_name)
+#     # dim_conterparty_df = dim_counterparty(df_counterparty)
+#     # df_department = convert_json_to_df_from_s3('department', bucket_name)
+#     # dim_staff_df = dim_staff(df_staff, df_department)
+#     # # # print(dim_currency_df.head())
+#     conn = connect_to_warehouse()
+#     # insert_data_to_table(conn, 'dim_date', df_date)
+
+#     valid_table_names = [
+#         "fact_sales_order",
+#         "dim_date",
+#         "dim_currency",
+#         "dim_location",
+#         "dim_counterparty",
+#         "dim_design",
+#         "dim_staff",
+#     ]
+
+#     for table_name in valid_table_names:
+#         cursor = conn.cursor()
+#         query = f"DELETE FROM {table_name}"
+#         cursor.execute(query)
+#         conn.commit()
+
+
+# if __name__ == "__main__":
+#     # warehouse_queries()
+
+#     # bucket_name = get_s3_bucket_name('data-squid-ingest-bucket-')
+#     # # df_date = dim_date(start="2024-11-03", end="2024-12-03")
+#     # df_sales_order = convert_json_to_df_from_s3('sales_order', bucket_name)
+#     # fact_sales_order_df = fact_sales_order(df_sales_order)
+#     # # df_department = convert_json_to_df_from_s3('department', bucket_name)
+#     # # dim_staff_df = dim_staff(df_staff, df_department)
+#     # print(fact_sales_order_df.head())
+
+#     pass
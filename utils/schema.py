@@ -0,0 +1,304 @@
+"""
+Schema registry: the columns of the totesys tables the pipeline ingests and of
+the star-schema tables it builds, with their types, nullability and keys.
+
+Readers cast what they read to these types instead of letting pandas infer them,
+the Parquet writer writes every table with the same column types whatever its
+rows hold, and the loader takes the warehouse's column order and the date and
+time conversions from here. Plain data, so the extraction lambda can import it
+without pandas; conform_dataframe only uses pandas when it is called.
+"""
+
+# Column types, and the pandas dtype each is held in (not nullable, nullable).
+# Dates and times are held as datetime64 (times on 1900-01-01) and only become
+# date and time objects for the warehouse; strings stay object columns.
+COLUMN_DTYPES = {
+    "int": ("int64", "Int64"),
+    "float": ("float64", "float64"),
+    "bool": ("bool", "boolean"),
+    "string": ("object", "object"),
+    "timestamp": ("datetime64[ns]", "datetime64[ns]"),
+    "date": ("datetime64[ns]", "datetime64[ns]"),
+    "time": ("datetime64[ns]", "datetime64[ns]"),
+}
+
+
+def _table(primary_key, *columns):
+    return {
+        "primary_key": primary_key,
+        "columns": {
+            name: (column_type, nullable) for name, column_type, nullable in columns
+        },
+    }
+
+
+def _audit_columns():
+    return [("created_at", "timestamp", False), ("last_updated", "timestamp", False)]
+
+
+# The source tables, as defined in totesys
+SOURCE_SCHEMAS = {
+    "counterparty": _table(
+        "counterparty_id",
+        ("counterparty_id", "int", False),
+        ("counterparty_legal_name", "string", False),
+        ("legal_address_id", "int", False),
+        ("commercial_contact", "string", True),
+        ("delivery_contact", "string", True),
+        *_audit_columns(),
+    ),
+    "currency": _table(
+        "currency_id",
+        ("currency_id", "int", False),
+        ("currency_code", "string", False),
+        *_audit_columns(),
+    ),
+    "department": _table(
+        "department_id",
+        ("department_id", "int", False),
+        ("department_name", "string", False),
+        ("location", "string", True),
+        ("manager", "string", True),
+        *_audit_columns(),
+    ),
+    "design": _table(
+        "design_id",
+        ("design_id", "int", False),
+        ("design_name", "string", False),
+        ("file_location", "string", False),
+        ("file_name", "string", False),
+        *_audit_columns(),
+    ),
+    "staff": _table(
+        "staff_id",
+        ("staff_id", "int", False),
+        ("first_name", "string", False),
+        ("last_name", "string", False),
+        ("department_id", "int", False),
+        ("email_address", "string", False),
+        *_audit_columns(),
+    ),
+    "sales_order": _table(
+        "sales_order_id",
+        ("sales_order_id", "int", False),
+        ("design_id", "int", False),
+        ("staff_id", "int", False),
+        ("counterparty_id", "int", False),
+        ("units_sold", "int", False),
+        ("unit_price", "float", False),
+        ("currency_id", "int", False),
+        ("agreed_delivery_date", "string", False),
+        ("agreed_payment_date", "string", False),
+        ("agreed_delivery_location_id", "int", False),
+        *_audit_columns(),
+    ),
+    "address": _table(
+        "address_id",
+        ("address_id", "int", False),
+        ("address_line_1", "string", False),
+        ("address_line_2", "string", True),
+        ("district", "string", True),
+        ("city", "string", False),
+        ("postal_code", "string", False),
+        ("country", "string", False),
+        ("phone", "string", False),
+        *_audit_columns(),
+    ),
+    "payment": _table(
+        "payment_id",
+        ("payment_id", "int", False),
+        ("transaction_id", "int", False),
+        ("counterparty_id", "int", False),
+        ("payment_amount", "float", False),
+        ("currency_id", "int", False),
+        ("payment_type_id", "int", False),
+        ("paid", "bool", False),
+        ("payment_date", "string", False),
+        ("company_ac_number", "int", False),
+        ("counterparty_ac_number", "int", False),
+        *_audit_columns(),
+    ),
+    "purchase_order": _table(
+        "purchase_order_id",
+        ("purchase_order_id", "int", False),
+        ("staff_id", "int", False),
+        ("counterparty_id", "int", False),
+        ("item_code", "string", False),
+        ("item_quantity", "int", False),
+        ("item_unit_price", "float", False),
+        ("currency_id", "int", False),
+        ("agreed_delivery_date", "string", False),
+        ("agreed_payment_date", "string", False),
+        ("agreed_delivery_location_id", "int", False),
+        *_audit_columns(),
+    ),
+    "payment_type": _table(
+        "payment_type_id",
+        ("payment_type_id", "int", False),
+        ("payment_type_name", "string", False),
+        *_audit_columns(),
+    ),
+    "transaction": _table(
+        "transaction_id",
+        ("transaction_id", "int", False),
+        ("transaction_type", "string", False),
+        ("sales_order_id", "int", True),
+        ("purchase_order_id", "int", True),
+        *_audit_columns(),
+    ),
+}
+
+# The star-schema tables, with their columns in the warehouse's order
+WAREHOUSE_SCHEMAS = {
+    "dim_date": _table(
+        "date_id",
+        ("date_id", "date", False),
+        ("year", "int", False),
+        ("month", "int", False),
+        ("day", "int", False),
+        ("day_of_week", "int", False),
+        ("day_name", "string", False),
+        ("month_name", "string", False),
+        ("quarter", "int", False),
+        # the day as YYYYMMDD
+        ("date_key", "int", False),
+    ),
+    "dim_design": _table(
+        "design_id",
+        ("design_id", "int", False),
+        ("design_name", "string", False),
+        ("file_location", "string", False),
+        ("file_name", "string", False),
+    ),
+    "dim_location": _table(
+        "location_id",
+        ("location_id", "int", False),
+        ("address_line_1", "string", False),
+        ("address_line_2", "string", True),
+        ("district", "string", True),
+        ("city", "string", False),
+        ("postal_code", "string", False),
+        ("country", "string", False),
+        ("phone", "string", False),
+    ),
+    "dim_currency": _table(
+        "currency_id",
+        ("currency_id", "int", False),
+        ("currency_code", "string", False),
+        ("currency_name", "string", True),
+    ),
+    "dim_counterparty": _table(
+        "counterparty_id",
+        ("counterparty_id", "int", False),
+        ("counterparty_legal_name", "string", False),
+        ("counterparty_legal_address_line_1", "string", False),
+        ("counterparty_legal_address_line_2", "string", True),
+        ("counterparty_legal_district", "string", True),
+        ("counterparty_legal_city", "string", False),
+        ("counterparty_legal_postal_code", "string", False),
+        ("counterparty_legal_country", "string", False),
+        ("counterparty_legal_phone_number", "string", False),
+    ),
+    "dim_staff": _table(
+        "staff_id",
+        ("staff_id", "int", False),
+        ("first_name", "string", False),
+        ("last_name", "string", False),
+        ("department_name", "string", False),
+        ("location", "string", True),
+        ("email_address", "string", False),
+    ),
+    # sales_record_id, the primary key, is generated by the warehouse
+    "fact_sales_order": _table(
+        None,
+        ("sales_order_id", "int", False),
+        ("created_date", "date", False),
+        ("created_time", "time", False),
+        ("last_updated_date", "date", False),
+        ("last_updated_time", "time", False),
+        ("sales_staff_id", "int", False),
+        ("counterparty_id", "int", False),
+        ("units_sold", "int", False),
+        ("unit_price", "float", False),
+        ("currency_id", "int", False),
+        ("design_id", "int", False),
+        ("agreed_payment_date", "date", False),
+        ("agreed_delivery_date", "date", False),
+        ("agreed_delivery_location_id", "int", False),
+        # the date columns as date_key of dim_date, for joining on
+        ("created_date_key", "int", False),
+        ("last_updated_date_key", "int", False),
+        ("agreed_payment_date_key", "int", False),
+        ("agreed_delivery_date_key", "int", False),
+    ),
+}
+
+SCHEMAS = {**SOURCE_SCHEMAS, **WAREHOUSE_SCHEMAS}
+
+
+def column_types(table):
+    """
+    Returns {column: (type, nullable)} for a table in SCHEMAS, in column order, or
+    an empty dict for a table the registry does not describe.
+    """
+    return SCHEMAS.get(table, {}).get("columns", {})
+
+
+def primary_key(table):
+    """Returns the primary key column of a table in SCHEMAS."""
+    return SCHEMAS[table]["primary_key"]
+
+
+def conform_dataframe(df, table):
+    """
+    Casts the columns of a DataFrame to the types SCHEMAS gives them and puts
+    them in the registry's order.
+
+    Columns of the registry the DataFrame does not have are left out (the
+    extraction only selects the columns the transforms use), and columns the
+    registry does not know are kept, after the others, as they are. Dates,
+    times and timestamps held as text are parsed as ISO-8601, and held as
+    numbers are taken as epoch milliseconds (as DataFrame.to_json writes them).
+
+    Args:
+        df (pd.DataFrame): The table as read or built.
+        table (str): Its name in SCHEMAS; a table the registry does not
+            describe is returned unchanged.
+
+    Returns:
+        pd.DataFrame: The conformed table (a new DataFrame).
+
+    Raises:
+        ValueError: A value does not fit its column's type, such as a null
+            in a column that is not nullable.
+    """
+    columns = column_types(table)
+    if not columns:
+        return df
+    import pandas as pd
+
+    data = {}
+    for column, (column_type, nullable) in columns.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        dtype = COLUMN_DTYPES[column_type][nullable]
+        if dtype.startswith("datetime64"):
+            if pd.api.types.is_numeric_dtype(values):
+                # epoch milliseconds, as DataFrame.to_json writes datetimes
+                values = pd.to_datetime(values, unit="ms")
+            elif not pd.api.types.is_datetime64_any_dtype(values):
+                values = pd.to_datetime(values, format="ISO8601")
+            if getattr(values.dt, "tz", None) is not None:
+                values = values.dt.tz_localize(None)
+            data[column] = values.astype(dtype)
+        elif dtype == "object":
+            # strings are kept as they are, with missing values as None
+            values = values.astype(object)
+            data[column] = values.where(values.notna(), None)
+        else:
+            data[column] = values.astype(dtype)
+    for column in df.columns:
+        if column not in data:
+            data[column] = df[column]
+    return pd.DataFrame(data, index=df.index)
@@ -0,0 +1,818 @@
+"""
+Transform lambda helpers: reading ingested tables into DataFrames and shaping
+them into the warehouse star schema.
+"""
+
+import boto3
+import hashlib
+import io
+import os
+import uuid
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from utils.common import (
+    manifest_entry,
+    open_s3_object,
+    resolve_table_keys,
+    upload_to_s3,
+)
+from utils.schema import column_types, conform_dataframe, primary_key
+
+
+# The engine dataframe_to_parquet writes with, named so that pandas does not pick
+# whichever one happens to be installed: fastparquet, which the dependencies
+# layer ships (pyarrow is not a dependency).
+PARQUET_ENGINE = "fastparquet"
+
+# Writer profiles of dataframe_to_parquet, selectable per table:
+# - compression: the codec; "none" for uncompressed pages
+# - stats: min/max statistics for every column (True), for all but the text
+#   columns ("auto", fastparquet's default) or for none (False)
+# - row_group_size: rows per row group; None writes a single one
+# - sort: rows sorted by the table's primary key (its first column for tables
+#   without one), so that each row group's statistics cover a narrow key range
+# - dictionary: dictionary-encoded pages for string columns with repeated values
+PARQUET_PROFILES = {
+    # what dataframe_to_parquet always wrote
+    "default": {
+        "compression": "snappy",
+        "stats": "auto",
+        "row_group_size": None,
+        "sort": False,
+        "dictionary": False,
+    },
+    # cheapest to encode and decode, for files read once
+    "fast-write": {
+        "compression": "none",
+        "stats": False,
+        "row_group_size": None,
+        "sort": False,
+        "dictionary": False,
+    },
+    # fewest bytes to store and transfer
+    "small-object": {
+        "compression": "zstd",
+        "stats": False,
+        "row_group_size": None,
+        "sort": False,
+        "dictionary": True,
+    },
+    # for engines that skip row groups by their statistics
+    "query-friendly": {
+        "compression": "zstd",
+        "stats": True,
+        "row_group_size": 100_000,
+        "sort": True,
+        "dictionary": True,
+    },
+}
+
+
+def parse_parquet_profiles(value):
+    """
+    Parses a per-table selection of writer profiles, as set in the
+    PARQUET_TABLE_PROFILES environment variable.
+
+    Args:
+        value (str): Comma-separated table=profile pairs, such as
+            "fact_sales_order=query-friendly,dim_date=fast-write"; may be empty.
+
+    Returns:
+        dict: {table: profile}.
+
+    Raises:
+        ValueError: A pair is malformed or names a profile not in PARQUET_PROFILES.
+    """
+    profiles = {}
+    for pair in filter(None, (pair.strip() for pair in (value or "").split(","))):
+        table, _, profile = (part.strip() for part in pair.partition("="))
+        if not table or profile not in PARQUET_PROFILES:
+            raise ValueError(f"Invalid Parquet profile selection: {pair!r}")
+        profiles[table] = profile
+    return profiles
+
+
+def dataframe_to_parquet(df, compression=None, table=None, profile="default"):
+    """
+    Convert a pandas DataFrame to Parquet format.
+
+    Args:
+        df (pd.DataFrame): The pandas DataFrame to convert.
+        compression (str, optional): Parquet codec overriding the profile's:
+            "snappy", "zstd", "gzip", or "none" for uncompressed pages.
+        table (str, optional): The table df holds. Tables in the schema registry
+            are conformed to it first (see conform_dataframe) and their string
+            columns written as UTF-8, so the file's schema is the same whatever
+            the rows hold, empty and all-null columns included.
+        profile (str): Name of the writer profile in PARQUET_PROFILES. Sorting
+            only applies to tables in the schema registry. Dictionary-encoded
+            columns are read back as categoricals.
+
+    Returns:
+        memoryview: The Parquet data, a view of the buffer it was written to
+            rather than a copy of it in bytes. upload_to_s3 uploads it in place;
+            it hashes, writes to files and reads back (through io.BytesIO) as
+            bytes do.
+    """
+    options = PARQUET_PROFILES[profile]
+    if compression is None:
+        compression = options["compression"]
+    if compression == "none":
+        compression = None
+    writer = {"stats": options["stats"]}
+    if options["row_group_size"]:
+        writer["row_group_offsets"] = options["row_group_size"]
+    columns = column_types(table)
+    strings = []
+    if columns:
+        df = conform_dataframe(df, table)
+        strings = [
+            column
+            for column, (column_type, _) in columns.items()
+            if column_type == "string" and column in df.columns
+        ]
+        if options["sort"]:
+            key = primary_key(table) or next(iter(columns))
+            df = df.sort_values(key, kind="stable", ignore_index=True)
+    if options["dictionary"]:
+        from pandas.api.types import infer_dtype
+
+        repeated = {
+            column: df[column].astype("category")
+            for column in df.columns
+            if df[column].dtype == object
+            and (column in strings or infer_dtype(df[column]) == "string")
+            and df[column].nunique() <= len(df) / 2
+        }
+        df = df.assign(**repeated)
+        strings += [column for column in repeated if column not in strings]
+    if strings or options["dictionary"]:
+        writer["object_encoding"] = {
+            column: "utf8" if column in strings else "infer"
+            for column in df.columns
+            if df[column].dtype in (object, "category")
+        }
+    parquet_buffer = io.BytesIO()
+    df.to_parquet(
+        parquet_buffer,
+        engine=PARQUET_ENGINE,
+        index=False,
+        compression=compression,
+        **writer,
+    )
+    return parquet_buffer.getbuffer()
+
+
+def convert_json_to_df_from_s3(
+    table,
+    bucket_name,
+    file_format="json",
+    manifest=None,
+    s3_client=None,
+    max_concurrency=1,
+):
+    """
+    Fetches the latest ingested file of a table from an S3 bucket and converts its
+    content into a pandas DataFrame, typed by the schema registry
+    (conform_dataframe) rather than by inference.
+
+    Args:
+        table (str): Directory name in the S3 bucket containing the JSON files.
+        bucket_name (str): Name of the S3 bucket.
+        file_format (str): Format the table was ingested in, as recorded in the
+            extraction report: "json" (default) or "parquet". Parquet files are
+            read with their stored column types and no text parsing.
+        manifest (dict, optional): The ingest bucket's state manifest. When it has an
+            entry for the table, its keys and format are used directly.
+        s3_client (boto3.client, optional): Client to read with; a new one is created
+            when not given (see upload_to_s3).
+        max_concurrency (int): Number of objects downloaded at a time for a table
+            written in several parts; they are still parsed, and concatenated, in
+            order, each one while the later ones download.
+
+    Returns:
+        pd.DataFrame: DataFrame created from the JSON file's content.
+
+    Notes:
+        - Tables missing from the manifest fall back to 'last_extracted.txt' to find
+          the latest timestamp.
+        - gzip and zstd compressed files are decoded according to their
+          Content-Encoding.
+        - Requires `boto3` for S3 access and `pandas` for processing.
+        - JSON files must be compatible with pandas' `read_json`; see read_json_rows.
+    """
+    if s3_client is None:
+        s3_client = boto3.client("s3")
+    keys, file_format = resolve_table_keys(
+        s3_client, bucket_name, table, manifest=manifest, file_format=file_format
+    )
+
+    def fetch(key):
+        return open_s3_object(s3_client, bucket_name, key).read()
+
+    frames = []
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_concurrency, len(keys)))
+    ) as pool:
+        for body in pool.map(fetch, keys):
+            if file_format == "parquet":
+                frames.append(pd.read_parquet(io.BytesIO(body)))
+            else:
+                frames.append(read_json_rows(body))
+    if len(frames) == 1:
+        return conform_dataframe(frames[0], table)
+    return conform_dataframe(pd.concat(frames, ignore_index=True), table)
+
+
+def read_json_rows(body):
+    """
+    Parses an ingested JSON file (a list of row objects) into a DataFrame, with no
+    dtype or date inference: values keep the types JSON gives them, and
+    conform_dataframe casts them to the table's schema. Inference would turn
+    strings of digits such as postal codes into numbers, and guesses the type of
+    empty and all-null columns.
+    """
+    return pd.read_json(
+        io.StringIO(body.decode("utf-8")), dtype=False, convert_dates=False
+    )
+
+
+def compact_dataframe(df, max_category_ratio=0.5):
+    """
+    Returns a DataFrame holding the same values as df in less memory, for the
+    transforms to work on.
+
+    String columns with few distinct values (currency codes, countries,
+    departments, dates held as text) become categoricals, which store each
+    distinct string once and an integer code per row. Integer columns are
+    downcast to the smallest integer type that holds their values. Other
+    columns, such as floats, high-cardinality strings and the datetime64
+    columns conform_dataframe already parsed, are kept as they are.
+    High-cardinality strings stay Python str objects: Arrow-backed strings
+    need pyarrow, which the dependencies layer does not ship.
+
+    The warehouse tables written are unaffected: dataframe_to_parquet conforms
+    the registry's tables back to their registry dtypes. Outputs the registry
+    does not describe are written with the dtypes their build gives them.
+
+    Args:
+        df (pd.DataFrame): The table as read.
+        max_category_ratio (float): A string column becomes categorical when it
+            has at most this many distinct values per row.
+
+    Returns:
+        pd.DataFrame: The compacted table (a new DataFrame).
+    """
+    data = {}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object:
+            if (
+                pd.api.types.infer_dtype(values, skipna=True) == "string"
+                and values.nunique() <= len(values) * max_category_ratio
+            ):
+                values = values.astype("category")
+        elif pd.api.types.is_integer_dtype(values):
+            values = pd.to_numeric(values, downcast="integer")
+        data[column] = values
+    return pd.DataFrame(data, index=df.index)
+
+
+def frame_memory_mib(df):
+    """Returns the memory a DataFrame holds, strings included, in MiB."""
+    return round(df.memory_usage(deep=True).sum() / 2**20, 2)
+
+
+SNAPSHOT_PREFIX = "state/snapshots"
+
+# extensions of the ingested objects a table's history is read from
+INGESTED_EXTENSIONS = (".json", ".json.gz", ".json.zst", ".pqt")
+
+
+def read_ingested_history(s3_client, bucket_name, table, max_concurrency=1):
+    """
+    Reads every batch of a table still in the ingestion bucket, oldest first.
+
+    Used to seed a table's snapshot (see merge_snapshot) the first time one is
+    needed: the batches are the initial extraction and every delta since, so
+    merging them in the order they were written in gives the current content of
+    the table. That order is their LastModified, then their key for objects
+    written in the same second, such as the parts of one extraction. Key order
+    alone is not it: runs started in the same minute share a timestamp, and a
+    delta's key ("12:00.json") sorts before the parts of the bootstrap it
+    follows ("12:00/part-00000.json").
+
+    Args:
+        s3_client (boto3.client): Client to read with.
+        bucket_name (str): Name of the ingestion bucket.
+        table (str): The table, which is also the prefix of its objects.
+        max_concurrency (int): Number of objects downloaded at a time.
+
+    Returns:
+        pd.DataFrame: The rows of all the batches, or None if there are none.
+    """
+    objects = []
+    for page in s3_client.get_paginator("list_objects_v2").paginate(
+        Bucket=bucket_name, Prefix=f"{table}/"
+    ):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(INGESTED_EXTENSIONS):
+                objects.append((obj["LastModified"], obj["Key"]))
+    if not objects:
+        return None
+    keys = [key for _, key in sorted(objects)]
+
+    def fetch(key):
+        return open_s3_object(s3_client, bucket_name, key).read()
+
+    frames = []
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_concurrency, len(keys)))
+    ) as pool:
+        for key, body in zip(keys, pool.map(fetch, keys)):
+            if key.endswith(".pqt"):
+                frames.append(pd.read_parquet(io.BytesIO(body)))
+            else:
+                frames.append(read_json_rows(body))
+    return conform_dataframe(pd.concat(frames, ignore_index=True), table)
+
+
+def merge_snapshot(snapshot, delta, primary_key):
+    """
+    Merges a delta of a table into its snapshot: rows of the delta replace the
+    snapshot's rows with the same primary key, and the later of two rows with
+    the same key in the delta wins.
+
+    Args:
+        snapshot (pd.DataFrame): The table as last stored, or None.
+        delta (pd.DataFrame): The rows ingested since, or None.
+        primary_key (str): The table's primary key column.
+
+    Returns:
+        pd.DataFrame: The merged table, sorted by primary key.
+    """
+    frames = [frame for frame in (snapshot, delta) if frame is not None]
+    if snapshot is not None and delta is not None:
+        frames[0] = snapshot[~snapshot[primary_key].isin(delta[primary_key])]
+    # an empty frame must not decide the merged dtypes
+    frames = [frame for frame in frames if len(frame)] or frames[-1:]
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.drop_duplicates(primary_key, keep="last")
+    return merged.sort_values(primary_key, kind="stable").reset_index(drop=True)
+
+
+def read_snapshot(s3_client, bucket_name, key, cache_dir=None):
+    """
+    Reads a table snapshot written by write_snapshot.
+
+    Args:
+        s3_client (boto3.client): Client to read with.
+        bucket_name (str): Name of the transform bucket.
+        key (str): The snapshot's key, from its manifest entry.
+        cache_dir (str, optional): Local directory (on Lambda, under /tmp) the
+            snapshots are kept in between invocations of a warm container.
+            Snapshot keys are never reused, so a cached copy is always current.
+
+    Returns:
+        pd.DataFrame: The snapshot.
+    """
+    path = os.path.join(cache_dir, key) if cache_dir else None
+    if path and os.path.exists(path):
+        return pd.read_parquet(path)
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+    if path:
+        _cache_snapshot(path, body)
+    return pd.read_parquet(io.BytesIO(body))
+
+
+def write_snapshot(
+    s3_client,
+    bucket_name,
+    table,
+    df,
+    watermark,
+    compression="snappy",
+    cache_dir=None,
+):
+    """
+    Writes a table snapshot to a new key under state/snapshots/{table}/.
+
+    The snapshot replaces the previous one only once its manifest entry is
+    committed, so the key is unique to this version and the previous
+    snapshot stays readable until then.
+
+    Args:
+        s3_client (boto3.client): Client to write with.
+        bucket_name (str): Name of the transform bucket.
+        table (str): The table the snapshot holds.
+        df (pd.DataFrame): The snapshot, as built by merge_snapshot.
+        watermark (str): Timestamp of the run, recorded in the entry.
+        compression (str): Parquet codec; see dataframe_to_parquet.
+        cache_dir (str, optional): See read_snapshot.
+
+    Returns:
+        dict: The snapshot's manifest entry.
+    """
+    body = dataframe_to_parquet(df, compression, table)
+    key = f"{SNAPSHOT_PREFIX}/{table}/{uuid.uuid4().hex}.parquet"
+    upload_to_s3(
+        data=body, bucket_name=bucket_name, object_name=key, s3_client=s3_client
+    )
+    if cache_dir:
+        _cache_snapshot(os.path.join(cache_dir, key), body)
+    return manifest_entry(
+        [key], len(df), hashlib.sha256(body).hexdigest(), watermark, "parquet"
+    )
+
+
+def _cache_snapshot(path, body):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # a table's older snapshots will not be read again
+    for name in os.listdir(directory):
+        if name != os.path.basename(path):
+            os.remove(os.path.join(directory, name))
+    partial = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(partial, "wb") as f:
+        f.write(body)
+    os.replace(partial, path)
+
+
+def dim_design(df):
+    """
+    Extracts a subset of columns from the input Design DataFrame to create the `dim_design` DataFrame.
+
+    This function selects the following columns from the input DataFrame:
+    - 'design_id'
+    - 'design_name'
+    - 'file_location'
+    - 'file_name'
+
+    The resulting DataFrame is used for design-related information and can be further processed or analyzed.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        The input DataFrame containing design-related data.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        A DataFrame containing the columns: 'design_id', 'design_name',
+        'file_location', and 'file_name'.
+    """
+
+    dim_design_df = df[["design_id", "design_name", "file_location", "file_name"]]
+
+    return dim_design_df
+
+
+def dim_staff(df_1, df_2):
+    """
+    Merges the staff and department tables to create a dimensional staff DataFrame.
+
+    Parameters:
+    -----------
+    staff_df : pandas.DataFrame
+        The staff table containing staff-related information.
+    department_df : pandas.DataFrame
+        The department table containing department-related information.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        A DataFrame containing the merged data with the following columns:
+        - 'first_name'
+        - 'last_name'
+        - 'department_name'
+        - 'location'
+        - 'email_address'
+    """
+    try:
+        dim_staff_df = pd.merge(df_1, df_2, on="department_id", how="inner")
+        dim_staff_df = dim_staff_df[
+            [
+                "staff_id",
+                "first_name",
+                "last_name",
+                "department_name",
+                "location",
+                "email_address",
+            ]
+        ]
+
+        return dim_staff_df
+    except KeyError:
+        raise
+
+
+def dim_location(df):
+    """
+    Extracts columns from the input DataFrame to create the `dim_location` DataFrame.
+
+    The resulting DataFrame is used for location-related information and can be further processed or analyzed.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        The input DataFrame containing address-related data.
+
+    Returns:
+    --------
+    pandas.DataFrame
+    A DataFrame containing the columns:
+        "location_id" (renamed from address_id),
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+
+    """
+    dim_location_df = df[
+        [
+            "address_id",
+            "address_line_1",
+            "address_line_2",
+            "district",
+            "city",
+            "postal_code",
+            "country",
+            "phone",
+        ]
+    ]
+    dim_location_df.rename(columns={"address_id": "location_id"}, inplace=True)
+
+    return dim_location_df
+
+
+def dim_counterparty(df1, df2):
+
+    dim_counterparty_df = df1.merge(
+        df2, left_on="address_id", right_on="legal_address_id"
+    )
+    dim_counterparty_df = dim_counterparty_df[
+        [
+            "counterparty_id",
+            "counterparty_legal_name",
+            "address_line_1",
+            "address_line_2",
+            "district",
+            "city",
+            "postal_code",
+            "country",
+            "phone",
+        ]
+    ]
+    dim_counterparty_df.rename(
+        columns={
+            "address_line_1": "counterparty_legal_address_line_1",
+            "address_line_2": "counterparty_legal_address_line_2",
+            "district": "counterparty_legal_district",
+            "city": "counterparty_legal_city",
+            "postal_code": "counterparty_legal_postal_code",
+            "country": "counterparty_legal_country",
+            "phone": "counterparty_legal_phone_number",
+        },
+        inplace=True,
+    )
+
+    return dim_counterparty_df
+
+
+def dim_currency(df):
+    """
+    Transforms a DataFrame by mapping currency codes to currency names and removing unnecessary columns.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing a 'currency_code' column and other related data.
+
+    Returns:
+        pd.DataFrame: A transformed DataFrame with the following changes:
+            - A new column, 'currency_name', is added by mapping 'currency_code' to human-readable currency names.
+            - The 'last_updated' and 'created_at' columns are dropped from the DataFrame.
+
+    """
+    dim_currency_df = df.copy()
+    currency_map = {"GBP": "British Pound", "USD": "US Dollar", "EUR": "Euro"}
+    dim_currency_df["currency_name"] = dim_currency_df["currency_code"].map(
+        currency_map
+    )
+    dim_currency_df.drop(columns=["last_updated", "created_at"], inplace=True)
+
+    return dim_currency_df
+
+
+def parse_timestamps(values, dayfirst=False):
+    """
+    Parses a column of timestamps, as ingested from JSON (ISO-8601 strings) or
+    Parquet (already datetime64).
+
+    The whole column is parsed in one vectorised pass with the ISO-8601 format;
+    only the values that fail it are parsed again element by element with
+    pandas' "mixed" format. Columns whose ISO-8601 parse comes out
+    timezone-aware are parsed entirely with "mixed", which is what decides how
+    offsets (or a mix of offsets and naive values) are handled.
+
+    Args:
+        values (pd.Series): The column to parse.
+        dayfirst (bool): Passed to the "mixed" parse of the values that are not
+            ISO-8601, such as "03/11/2022".
+
+    Returns:
+        pd.Series: The parsed timestamps.
+    """
+    parsed = pd.to_datetime(values, format="ISO8601", errors="coerce")
+    if parsed.dt.tz is not None:
+        return pd.to_datetime(values, format="mixed", dayfirst=dayfirst)
+    failed = parsed.isna() & values.notna()
+    if failed.any():
+        parsed[failed] = pd.to_datetime(
+            values[failed], format="mixed", dayfirst=dayfirst
+        )
+    return parsed
+
+
+def split_timestamps(values, dayfirst=False):
+    """
+    Splits a column of timestamps into the date and time columns of the star
+    schema, using datetime64 arithmetic rather than Python date/time objects.
+
+    Args:
+        values (pd.Series): Timestamps, as strings or datetime64; see
+            parse_timestamps.
+        dayfirst (bool): See parse_timestamps.
+
+    Returns:
+        tuple: Two datetime64[ns] Series with the index of values: the date at
+            midnight, and the time of day (truncated to the second) on
+            1900-01-01. Missing timestamps give NaT in both.
+    """
+    parsed = parse_timestamps(values, dayfirst=dayfirst)
+    if parsed.dt.tz is not None:
+        # split the wall-clock time, as .dt.date and .dt.time would
+        parsed = parsed.dt.tz_localize(None)
+    stamps = parsed.to_numpy(dtype="datetime64[ns]")
+    days = stamps.astype("datetime64[D]")
+    seconds = (stamps - days).astype("timedelta64[s]")
+    dates = days.astype("datetime64[ns]")
+    times = (np.datetime64("1900-01-01") + seconds).astype("datetime64[ns]")
+    return (
+        pd.Series(dates, index=values.index),
+        pd.Series(times, index=values.index),
+    )
+
+
+# The date columns of fact_sales_order, each with the column holding it as a
+# date_key of dim_date
+FACT_DATE_KEYS = {
+    "created_date": "created_date_key",
+    "last_updated_date": "last_updated_date_key",
+    "agreed_payment_date": "agreed_payment_date_key",
+    "agreed_delivery_date": "agreed_delivery_date_key",
+}
+
+
+def date_keys(values):
+    """
+    Returns a column of dates as integer YYYYMMDD keys (see dim_date).
+
+    Args:
+        values (pd.Series): Dates or timestamps, as datetime64 or ISO-8601
+            strings; only the day counts.
+
+    Returns:
+        pd.Series: The keys, with the index of values; Int64 with missing
+            values where a date is missing, int64 otherwise.
+    """
+    days = pd.to_datetime(values, format="ISO8601").to_numpy(dtype="datetime64[D]")
+    months = days.astype("datetime64[M]")
+    year = months.astype(np.int64) // 12 + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    keys = pd.Series(year * 10000 + month * 100 + day, index=values.index)
+    missing = np.isnat(days)
+    if missing.any():
+        keys = keys.astype("Int64").mask(missing)
+    return keys
+
+
+def fact_sales_order(df):
+    """
+    Transforms a DataFrame to prepare sales order data for further processing or analysis.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing sales order data.
+            Expected columns include:
+            - 'staff_id': Identifier for the staff associated with the sales order.
+            - 'created_at': Datetime string indicating when the record was created.
+            - 'last_updated': Datetime string indicating when the record was last updated.
+
+    Returns:
+        pd.DataFrame: Transformed DataFrame with the following changes:
+            - The 'staff_id' column is renamed to 'sales_staff_id'.
+            - 'created_at' and 'last_updated' are converted to datetime objects with their date and time components
+              split into separate columns:
+                - 'created_date': Date part of the 'created_at' timestamp.
+                - 'created_time': Time part of the 'created_at' timestamp.
+                - 'last_updated_date': Date part of the 'last_updated' timestamp.
+                - 'last_updated_time': Time part of the 'last_updated' timestamp.
+            - The original 'created_at' and 'last_updated' columns are dropped.
+            - Each date column (see FACT_DATE_KEYS) gets an integer YYYYMMDD key
+              column, matching the date_key of dim_date.
+
+    The function is intended for cleaning and standardizing sales order data to ensure consistent formats
+    and enable further analysis or storage.
+    """
+
+    fact_sales_order_df = df.copy()
+
+    fact_sales_order_df.rename(columns={"staff_id": "sales_staff_id"}, inplace=True)
+
+    (
+        fact_sales_order_df["created_date"],
+        fact_sales_order_df["created_time"],
+    ) = split_timestamps(df["created_at"], dayfirst=True)
+    (
+        fact_sales_order_df["last_updated_date"],
+        fact_sales_order_df["last_updated_time"],
+    ) = split_timestamps(df["last_updated"])
+
+    fact_sales_order_df.drop(columns=["created_at", "last_updated"], inplace=True)
+
+    for column, key in FACT_DATE_KEYS.items():
+        if column in fact_sales_order_df.columns:
+            fact_sales_order_df[key] = date_keys(fact_sales_order_df[column])
+
+    return fact_sales_order_df
+
+
+# The range of days dim_date covers by default, which is the calendar it was
+# built with before the transform lambda extended it forward (see
+# CALENDAR_TRANSFORMS)
+DIM_DATE_START = "2022-11-03"
+DIM_DATE_END = "2025-12-31"
+
+DAY_NAMES = np.array(
+    ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+)
+MONTH_NAMES = np.array(
+    [
+        "January",
+        "February",
+        "March",
+        "April",
+        "May",
+        "June",
+        "July",
+        "August",
+        "September",
+        "October",
+        "November",
+        "December",
+    ]
+)
+
+
+def dim_date(start=DIM_DATE_START, end=DIM_DATE_END):
+    """
+    Builds the date dimension for the days from start to end, both included.
+
+    Every column is computed for all the days at once with datetime64[D]
+    arithmetic, so extending the calendar by a few days costs next to nothing.
+
+    Args:
+        start (str or date): The first day, such as "2022-11-03".
+        end (str or date): The last day; before start gives an empty table.
+
+    Returns:
+        pd.DataFrame: One row per day: date_id, year, month, day, day_of_week
+            (Monday is 0), day_name, month_name, quarter, and date_key, the day
+            as the integer YYYYMMDD for joining on.
+    """
+    days = np.arange(
+        np.datetime64(start, "D"), np.datetime64(end, "D") + 1, dtype="datetime64[D]"
+    )
+    months = days.astype("datetime64[M]")
+    year = months.astype(np.int64) // 12 + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    # 1970-01-01 was a Thursday
+    day_of_week = (days.astype(np.int64) + 3) % 7
+
+    return pd.DataFrame(
+        {
+            "date_id": days.astype("datetime64[ns]"),
+            "year": year,
+            "month": month,
+            "day": day,
+            "day_of_week": day_of_week,
+            "day_name": DAY_NAMES[day_of_week].astype(object),
+            "month_name": MONTH_NAMES[month - 1].astype(object),
+            "quarter": (month - 1) // 3 + 1,
+            "date_key": year * 10000 + month * 100 + day,
+        }
+    )